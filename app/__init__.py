@@ -2,7 +2,6 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 from flask import Flask, request, session, render_template
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_moment import Moment
@@ -14,9 +13,10 @@ from flask_limiter.util import get_remote_address
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
 from datetime import datetime
+from .services.db_service import ManagedSQLAlchemy
 
 # 初始化扩展
-db = SQLAlchemy()
+db = ManagedSQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 moment = Moment()
@@ -26,6 +26,9 @@ cors = CORS()
 
 # 导入字体管理器
 from .services.font_service import font_manager
+from .services.font_subset_service import font_subsetter
+from .services.glyph_index import glyph_index
+from .services.task_scheduler import task_scheduler
 
 def create_app(config_name=None):
     app = Flask(__name__, instance_relative_config=True)
@@ -54,21 +57,24 @@ def create_app(config_name=None):
     login_manager.login_message_category = 'info'
     
     # 初始化字体管理器
+    glyph_index.init_app(app)
+    font_subsetter.init_app(app)
     font_manager.init_app(app)
     
-    # 确保第一次启动时尝试加载必要的字体
+    # 字体检查和CSS生成由 flask fonts install 在部署时完成，启动时只读取字体清单；
+    # FONT_CHECK_ON_STARTUP 为真时沿用每次启动检查的方式
     with app.app_context():
         try:
-            # 尝试复制或下载必要的字体
-            missing_fonts = font_manager.check_required_fonts()
+            if app.config.get('FONT_CHECK_ON_STARTUP'):
+                missing_fonts, css_path = font_manager.install()
+                app.logger.info(f"生成字体CSS文件: {css_path}")
+            else:
+                manifest = font_manager.load_manifest()
+                if manifest is None:
+                    app.logger.warning("未找到字体清单，请运行 flask fonts install 安装字体资源")
+                missing_fonts = manifest['missing_required'] if manifest else []
             if missing_fonts:
                 app.logger.warning(f"系统缺少以下字体资源: {', '.join(missing_fonts)}")
-            else:
-                app.logger.info("所有必要的字体资源已就绪")
-            
-            # 生成字体CSS
-            css_path = font_manager.generate_font_css()
-            app.logger.info(f"生成字体CSS文件: {css_path}")
         except Exception as e:
             app.logger.error(f"初始化字体资源时出错: {str(e)}")
     
@@ -90,6 +96,66 @@ def create_app(config_name=None):
     from .admin import bp as admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
+    # 注册 /api 蓝图（admin 与后台页面蓝图同名，以 api_admin 注册）
+    from app.api.workflow import bp as api_workflow_bp
+    app.register_blueprint(api_workflow_bp, url_prefix='/api/workflow')
+    
+    from app.api.admin import bp as api_admin_bp
+    app.register_blueprint(api_admin_bp, url_prefix='/api/admin', name='api_admin')
+    
+    from app.api.user import bp as api_user_bp
+    app.register_blueprint(api_user_bp, url_prefix='/api/user')
+    
+    # SQLite 生产模式下启用单线程追加写队列
+    from app.services.write_queue import write_queue
+    write_queue.init_app(app)
+    
+    # 开发模式下启用索引顾问
+    from app.utils.index_advisor import index_advisor
+    index_advisor.init_app(app)
+    
+    # 开发模式下统计每个请求的查询次数
+    from app.utils.query_counter import query_counter
+    query_counter.init_app(app)
+    
+    # 请求耗时、数据库耗时等性能指标
+    from app.utils.metrics import metrics
+    metrics.init_app(app)
+    
+    # 慢请求调用栈采样
+    from app.utils.profiler import request_profiler, purge_request_profiles
+    request_profiler.init_app(app)
+    
+    # 注册命令行工具
+    from app.cli import register_commands
+    register_commands(app)
+    
+    # 注册工作流事件处理函数
+    from app.services.event_service import event_dispatcher, purge_processed_events
+    from app.services.workflow_service import handle_step_entered, handle_instance_finished, handle_timer_fired
+    event_dispatcher.register('step.entered', handle_step_entered)
+    event_dispatcher.register('instance.completed', handle_instance_finished)
+    event_dispatcher.register('instance.rejected', handle_instance_finished)
+    event_dispatcher.register('timer.fired', handle_timer_fired)
+    event_dispatcher.init_app(app)
+    
+    # 步骤截止时间和流程超时定时器
+    from app.services.timer_service import timer_service
+    timer_service.init_app(app)
+    
+    # 注册后台定时任务
+    from app.services.archive_service import archive_expired_logs
+    task_scheduler.register('archive_logs', archive_expired_logs, interval='LOG_ARCHIVE_INTERVAL')
+    task_scheduler.register('purge_workflow_events', purge_processed_events, interval='WORKFLOW_EVENT_PURGE_INTERVAL')
+    from app.services.workflow_service import recover_workflows
+    task_scheduler.register('recover_workflows', recover_workflows, interval='WORKFLOW_RECOVERY_INTERVAL')
+    if event_dispatcher.mode == 'inline':
+        # 没有定时器线程时由调度器检查到期定时器，没有请求时也能触发
+        task_scheduler.register('fire_workflow_timers', timer_service.fire_due, interval='WORKFLOW_TIMER_POLL_INTERVAL')
+    if app.config.get('PROFILER_ENABLED'):
+        task_scheduler.register('purge_request_profiles', purge_request_profiles, interval='PROFILER_PURGE_INTERVAL')
+    task_scheduler.init_app(app)
+    
     # 设置日志
     if not app.debug and not app.testing:
         # 确保日志目录存在
@@ -2,10 +2,17 @@ from flask import jsonify, request, current_app
 from flask_login import current_user, login_required
 from app import db
 from app.api.admin import bp
-from app.models import User, Role, Workflow, WorkflowInstance, SystemLog, LoginLog, Permission
-from app.utils.decorators import api_required, admin_required
+from app.models import User, Role, WorkflowTemplate, WorkflowInstance, SystemLog, LoginLog, WorkflowLog, RequestProfile, Permission
+from app.utils.decorators import api_required, admin_required, read_replica
 from app.utils.security import generate_password, validate_password_strength
-from app.services.workflow_service import recover_workflows
+from app.services.workflow_service import recover_workflows, mark_instances_for_recovery, get_recovery_status
+from app.services.search_service import filter_by_keyword, search_logs
+from app.services.archive_service import should_query_archive, extend_page_with_archive
+from app.services.db_service import get_pool_stats, replica_router
+from app.services.event_service import event_dispatcher
+from app.services.timer_service import timer_service
+from app.utils.pagination import paginate_request, InvalidCursorError
+from app.utils.profiler import request_profiler
 from datetime import datetime, timedelta
 import json
 
@@ -17,7 +24,6 @@ import json
 @admin_required
 def get_users():
     """获取用户列表"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     query = User.query
@@ -47,24 +53,25 @@ def get_users():
     sort_by = request.args.get('sort_by', 'id')
     sort_dir = request.args.get('sort_dir', 'asc')
     
-    if sort_by in ['id', 'username', 'email', 'created_at', 'last_login']:
-        sort_field = getattr(User, sort_by)
-        if sort_dir.lower() == 'desc':
-            sort_field = sort_field.desc()
-        query = query.order_by(sort_field)
+    if sort_by not in ['id', 'username', 'email', 'created_at']:
+        sort_by = 'id'
     
-    # 分页
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    users = pagination.items
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        users, page_info = paginate_request(
+            query, getattr(User, sort_by), User.id, per_page,
+            descending=sort_dir.lower() == 'desc')
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
         'data': {
             'items': [user.to_dict() for user in users],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            **page_info
         }
     })
 
@@ -476,9 +483,9 @@ def get_permissions():
 @login_required
 @api_required
 @admin_required
+@read_replica
 def get_system_logs():
     """获取系统日志"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     query = SystemLog.query
@@ -499,6 +506,8 @@ def get_system_logs():
         query = query.filter_by(user_id=user_id)
     
     # 时间范围过滤
+    start_datetime = None
+    end_datetime = None
     start_time = request.args.get('start_time')
     if start_time:
         try:
@@ -518,32 +527,165 @@ def get_system_logs():
     # 关键字搜索
     keyword = request.args.get('keyword', '')
     if keyword:
-        query = query.filter(SystemLog.message.contains(keyword))
+        query = filter_by_keyword(query, SystemLog, keyword)
+    
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        logs, page_info = paginate_request(query, SystemLog.created_at, SystemLog.id, per_page)
+        items = [log.to_dict() for log in logs]
+        
+        # 主库记录不足一页且时间范围早于保留期时，继续读取归档
+        include_archive = request.args.get('include_archive', '').lower() in ('1', 'true')
+        if should_query_archive('system_logs', include_archive, start_datetime):
+            items, page_info = extend_page_with_archive(
+                'system_logs', items, page_info, per_page,
+                cursor=request.args.get('cursor'),
+                start=start_datetime,
+                end=end_datetime,
+                filters={'level': level or None, 'module': module or None, 'user_id': user_id or None},
+                keyword=keyword or None
+            )
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'items': items,
+            **page_info
+        }
+    })
+
+@bp.route('/system/logs/search', methods=['GET'])
+@login_required
+@api_required
+@admin_required
+@read_replica
+def search_system_logs():
+    """全文检索系统日志或工作流日志，按相关度排序"""
+    keyword = request.args.get('keyword', '').strip()
+    if not keyword:
+        return jsonify({
+            'success': False,
+            'message': '缺少检索关键字'
+        }), 400
+    
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    
+    # 日志类型: system 或 workflow
+    log_type = request.args.get('type', 'system')
+    if log_type == 'workflow':
+        model = WorkflowLog
+    elif log_type == 'system':
+        model = SystemLog
+    else:
+        return jsonify({
+            'success': False,
+            'message': f'无效的日志类型: {log_type}'
+        }), 400
+    
+    query = model.query
+    
+    # 时间范围过滤
+    start_time = request.args.get('start_time')
+    if start_time:
+        try:
+            query = query.filter(model.created_at >= datetime.fromisoformat(start_time))
+        except ValueError:
+            pass
+    
+    end_time = request.args.get('end_time')
+    if end_time:
+        try:
+            query = query.filter(model.created_at <= datetime.fromisoformat(end_time))
+        except ValueError:
+            pass
+    
+    results = search_logs(model, keyword, query=query, limit=limit)
+    
+    items = []
+    for log, score in results:
+        item = log.to_dict()
+        item['score'] = score
+        items.append(item)
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'items': items,
+            'type': log_type,
+            'keyword': keyword
+        }
+    })
+
+@bp.route('/system/profiles', methods=['GET'])
+@login_required
+@api_required
+@admin_required
+@read_replica
+def get_request_profiles():
+    """获取慢请求采样列表，对应的系统日志模块为 profiler"""
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    
+    query = RequestProfile.query
     
-    # 分页
-    pagination = query.order_by(SystemLog.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    # 接口过滤
+    endpoint = request.args.get('endpoint')
+    if endpoint:
+        query = query.filter_by(endpoint=endpoint)
     
-    logs = pagination.items
+    # 最小耗时过滤（毫秒）
+    min_duration = request.args.get('min_duration', type=int)
+    if min_duration:
+        query = query.filter(RequestProfile.duration_ms >= min_duration)
+    
+    try:
+        profiles, page_info = paginate_request(query, RequestProfile.created_at, RequestProfile.id, per_page)
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
         'data': {
-            'items': [log.to_dict() for log in logs],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            'items': [profile.to_dict() for profile in profiles],
+            'profiler': request_profiler.get_status(),
+            **page_info
         }
     })
 
+@bp.route('/system/profiles/<int:id>', methods=['GET'])
+@login_required
+@api_required
+@admin_required
+def get_request_profile(id):
+    """获取慢请求采样详情，format=collapsed 时下载折叠栈文本用于生成火焰图"""
+    profile = RequestProfile.query.get_or_404(id)
+    
+    if request.args.get('format') == 'collapsed':
+        return current_app.response_class(
+            (profile.stacks or '') + '\n',
+            mimetype='text/plain',
+            headers={'Content-Disposition': f'attachment; filename=profile-{profile.id}.folded'}
+        )
+    
+    return jsonify({
+        'success': True,
+        'data': profile.to_dict(include_stacks=True)
+    })
+
 @bp.route('/system/login-logs', methods=['GET'])
 @login_required
 @api_required
 @admin_required
+@read_replica
 def get_login_logs():
     """获取登录日志"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     query = LoginLog.query
@@ -564,6 +706,8 @@ def get_login_logs():
         query = query.filter_by(ip_address=ip_address)
     
     # 时间范围过滤
+    start_datetime = None
+    end_datetime = None
     start_time = request.args.get('start_time')
     if start_time:
         try:
@@ -580,20 +724,33 @@ def get_login_logs():
         except ValueError:
             pass
     
-    # 分页
-    pagination = query.order_by(LoginLog.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
-    
-    logs = pagination.items
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        logs, page_info = paginate_request(query, LoginLog.created_at, LoginLog.id, per_page)
+        items = [log.to_dict() for log in logs]
+        
+        # 主库记录不足一页且时间范围早于保留期时，继续读取归档
+        include_archive = request.args.get('include_archive', '').lower() in ('1', 'true')
+        if should_query_archive('login_logs', include_archive, start_datetime):
+            items, page_info = extend_page_with_archive(
+                'login_logs', items, page_info, per_page,
+                cursor=request.args.get('cursor'),
+                start=start_datetime,
+                end=end_datetime,
+                filters={'username': username or None, 'status': status or None, 'ip_address': ip_address or None},
+                keyword=None
+            )
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
         'data': {
-            'items': [log.to_dict() for log in logs],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            'items': items,
+            **page_info
         }
     })
 
@@ -601,6 +758,7 @@ def get_login_logs():
 @login_required
 @api_required
 @admin_required
+@read_replica
 def get_system_summary():
     """获取系统概览数据"""
     # 用户统计
@@ -608,8 +766,8 @@ def get_system_summary():
     active_users = User.query.filter_by(is_active=True).count()
     
     # 工作流统计
-    total_workflows = Workflow.query.count()
-    active_workflows = Workflow.query.filter_by(is_active=True).count()
+    total_workflows = WorkflowTemplate.query.count()
+    active_workflows = WorkflowTemplate.query.filter_by(is_active=True).count()
     
     # 实例统计
     total_instances = WorkflowInstance.query.count()
@@ -637,7 +795,7 @@ def get_system_summary():
             active_users_data.append({
                 'id': user.id,
                 'username': user.username,
-                'fullname': user.fullname,
+                'fullname': user.full_name,
                 'last_login': last_login.isoformat()
             })
     
@@ -646,14 +804,14 @@ def get_system_summary():
     recent_instances_data = []
     
     for instance in recent_instances:
-        workflow = Workflow.query.get(instance.workflow_id)
+        workflow = WorkflowTemplate.query.get(instance.workflow_id)
         creator = User.query.get(instance.created_by)
         
         recent_instances_data.append({
             'id': instance.id,
             'title': instance.title,
             'workflow_name': workflow.name if workflow else '未知工作流',
-            'creator_name': (creator.fullname or creator.username) if creator else '未知用户',
+            'creator_name': (creator.full_name or creator.username) if creator else '未知用户',
             'status': instance.status,
             'created_at': instance.created_at.isoformat()
         })
@@ -681,21 +839,60 @@ def get_system_summary():
         }
     })
 
-@bp.route('/system/recover-workflows', methods=['POST'])
+@bp.route('/system/db-pool', methods=['GET'])
+@login_required
+@api_required
+@admin_required
+def get_db_pool_status():
+    """获取数据库连接池与只读副本状态"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'pools': get_pool_stats(),
+            'replicas': replica_router.get_status(current_app)
+        }
+    })
+
+@bp.route('/system/workflow-events', methods=['GET'])
+@login_required
+@api_required
+@admin_required
+def get_workflow_event_status():
+    """获取工作流事件分发器和定时器状态"""
+    return jsonify({
+        'success': True,
+        'data': dict(event_dispatcher.get_status(), timers=timer_service.get_status())
+    })
+
+@bp.route('/system/recover-workflows', methods=['GET', 'POST'])
 @login_required
 @api_required
 @admin_required
 def recover_workflows_endpoint():
-    """手动触发恢复异常工作流"""
+    """
+    恢复异常工作流
+    GET 查看恢复进度；POST 从检查点继续处理一批被标记的实例，
+    all=true 时先标记所有运行中的实例进行全面检查
+    """
+    if request.method == 'GET':
+        return jsonify({
+            'success': True,
+            'data': get_recovery_status()
+        })
+    
+    data = request.get_json() or {}
     try:
-        recovered_count = recover_workflows()
+        if data.get('all'):
+            mark_instances_for_recovery()
+        
+        max_batches = data.get('max_batches')
+        result = recover_workflows(max_batches=int(max_batches) if max_batches else None)
         
         return jsonify({
             'success': True,
-            'message': f'成功恢复 {recovered_count} 个工作流实例',
-            'data': {
-                'recovered_count': recovered_count
-            }
+            'message': f"本次检查 {result['examined']} 个工作流实例，恢复 {result['recovered']} 个，"
+                       f"剩余 {result['pending']} 个待检查",
+            'data': dict(result, recovered_count=result['recovered'])
         })
     except Exception as e:
         return jsonify({
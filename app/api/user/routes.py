@@ -2,10 +2,11 @@ from flask import jsonify, request, current_app
 from flask_login import current_user, login_required
 from app import db
 from app.api.user import bp
-from app.models import User, Role, Workflow, WorkflowInstance, WorkflowApproval, Permission
-from app.utils.decorators import api_required
+from app.models import User, Role, WorkflowTemplate, WorkflowInstance, WorkflowApproval, Permission
+from app.utils.decorators import api_required, read_replica
 from app.services.log_service import log_system_activity
 from app.services.workflow_service import get_user_pending_tasks
+from app.utils.pagination import paginate_request, InvalidCursorError
 from datetime import datetime
 
 @bp.route('/profile', methods=['GET'])
@@ -81,6 +82,7 @@ def update_user_profile():
 @bp.route('/tasks', methods=['GET'])
 @login_required
 @api_required
+@read_replica
 def get_user_tasks():
     """获取当前用户的待办任务"""
     page = request.args.get('page', 1, type=int)
@@ -107,10 +109,10 @@ def get_available_workflows():
     """获取当前用户可以使用的工作流"""
     # 管理员可以查看所有激活的工作流
     if current_user.is_admin:
-        workflows = Workflow.query.filter_by(is_active=True).all()
+        workflows = WorkflowTemplate.query.filter_by(is_active=True).all()
     # 普通用户需要有创建实例的权限
     elif current_user.has_permission(Permission.WORKFLOW_INSTANCE_CREATE):
-        workflows = Workflow.query.filter_by(is_active=True).all()
+        workflows = WorkflowTemplate.query.filter_by(is_active=True).all()
     else:
         workflows = []
     
@@ -122,9 +124,9 @@ def get_available_workflows():
 @bp.route('/instances', methods=['GET'])
 @login_required
 @api_required
+@read_replica
 def get_user_instances():
     """获取当前用户创建的工作流实例"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     query = WorkflowInstance.query.filter_by(created_by=current_user.id)
@@ -148,21 +150,24 @@ def get_user_instances():
     sort_by = request.args.get('sort_by', 'created_at')
     sort_dir = request.args.get('sort_dir', 'desc')
     
-    if sort_by in ['id', 'title', 'created_at', 'updated_at']:
-        sort_field = getattr(WorkflowInstance, sort_by)
-        if sort_dir.lower() == 'desc':
-            sort_field = sort_field.desc()
-        query = query.order_by(sort_field)
-    
-    # 分页
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    if sort_by not in ['id', 'title', 'created_at', 'updated_at']:
+        sort_by = 'created_at'
     
-    instances = pagination.items
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        instances, page_info = paginate_request(
+            query, getattr(WorkflowInstance, sort_by), WorkflowInstance.id, per_page,
+            descending=sort_dir.lower() == 'desc')
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     # 获取工作流名称
     results = []
     for instance in instances:
-        workflow = Workflow.query.get(instance.workflow_id)
+        workflow = WorkflowTemplate.query.get(instance.workflow_id)
         
         result = instance.to_dict()
         result['workflow_name'] = workflow.name if workflow else '未知工作流'
@@ -173,10 +178,7 @@ def get_user_instances():
         'success': True,
         'data': {
             'items': results,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            **page_info
         }
     })
 
@@ -202,7 +204,7 @@ def get_user_instance(id):
             }), 403
     
     # 获取工作流定义
-    workflow = Workflow.query.get(instance.workflow_id)
+    workflow = WorkflowTemplate.query.get(instance.workflow_id)
     
     # 获取审批历史
     approvals = WorkflowApproval.query.filter_by(instance_id=instance.id).all()
@@ -2,20 +2,31 @@ from flask import jsonify, request, current_app
 from flask_login import current_user, login_required
 from app import db
 from app.api.workflow import bp
-from app.models import Workflow, WorkflowInstance, WorkflowApproval, User, Permission
-from app.utils.decorators import api_required, permission_required
+from app.models import (
+    WorkflowTemplate, WorkflowInstance, WorkflowApproval, WorkflowLog,
+    WorkflowEvent, WorkflowTimer, WorkflowToken, User, Permission
+)
+from app.utils.decorators import api_required, permission_required, read_replica
 from app.services.log_service import log_workflow_activity
+from app.services.event_service import event_dispatcher
+from app.services.timer_service import schedule_timer
 from app.services.workflow_service import (
     get_workflow_definition, 
     create_workflow_instance, 
     get_workflow_next_step,
     get_user_pending_tasks,
     process_workflow_step,
+    process_workflow_steps_batch,
     get_workflow_history,
-    can_user_approve_step
+    get_instance_detail,
+    can_user_approve_step,
+    enter_workflow_step,
+    cancel_workflow_instance,
+    WorkflowConflictError
 )
+from app.utils.pagination import paginate_request, InvalidCursorError
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # ========== 工作流定义管理 ==========
 
@@ -23,12 +34,12 @@ from datetime import datetime
 @login_required
 @api_required
 @permission_required(Permission.WORKFLOW_VIEW)
+@read_replica
 def get_workflows():
     """获取所有工作流定义"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
-    query = Workflow.query
+    query = WorkflowTemplate.query
     
     # 过滤条件
     if not current_user.is_admin:
@@ -38,23 +49,23 @@ def get_workflows():
     # 关键字搜索
     keyword = request.args.get('keyword', '')
     if keyword:
-        query = query.filter(Workflow.name.contains(keyword) | 
-                          Workflow.description.contains(keyword))
+        query = query.filter(WorkflowTemplate.name.contains(keyword) | 
+                          WorkflowTemplate.description.contains(keyword))
     
-    # 分页
-    pagination = query.order_by(Workflow.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
-    
-    workflows = pagination.items
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        workflows, page_info = paginate_request(query, WorkflowTemplate.created_at, WorkflowTemplate.id, per_page)
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
         'data': {
             'items': [workflow.to_dict() for workflow in workflows],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            **page_info
         }
     })
 
@@ -64,7 +75,7 @@ def get_workflows():
 @permission_required(Permission.WORKFLOW_VIEW)
 def get_workflow(id):
     """获取单个工作流定义"""
-    workflow = Workflow.query.get_or_404(id)
+    workflow = WorkflowTemplate.query.get_or_404(id)
     
     # 检查权限
     if not current_user.is_admin and not workflow.is_active:
@@ -96,7 +107,7 @@ def create_workflow():
             }), 400
     
     # 验证工作流名称唯一性
-    if Workflow.query.filter_by(name=data['name']).first():
+    if WorkflowTemplate.query.filter_by(name=data['name']).first():
         return jsonify({
             'success': False,
             'message': '工作流名称已存在'
@@ -110,7 +121,7 @@ def create_workflow():
         }), 400
     
     # 创建工作流
-    workflow = Workflow(
+    workflow = WorkflowTemplate(
         name=data['name'],
         description=data['description'],
         created_by=current_user.id
@@ -135,13 +146,13 @@ def create_workflow():
 @permission_required(Permission.WORKFLOW_EDIT)
 def update_workflow(id):
     """更新工作流定义"""
-    workflow = Workflow.query.get_or_404(id)
+    workflow = WorkflowTemplate.query.get_or_404(id)
     data = request.get_json() or {}
     
     # 更新字段
     if 'name' in data and data['name'] != workflow.name:
         # 检查名称唯一性
-        if Workflow.query.filter_by(name=data['name']).first():
+        if WorkflowTemplate.query.filter_by(name=data['name']).first():
             return jsonify({
                 'success': False,
                 'message': '工作流名称已存在'
@@ -158,8 +169,6 @@ def update_workflow(id):
                 'message': '工作流定义格式错误'
             }), 400
         workflow.set_definition(data['definition'])
-        # 更新版本号
-        workflow.version += 1
     
     if 'is_active' in data:
         workflow.is_active = data['is_active']
@@ -181,7 +190,7 @@ def update_workflow(id):
 @permission_required(Permission.WORKFLOW_DELETE)
 def delete_workflow(id):
     """删除工作流定义"""
-    workflow = Workflow.query.get_or_404(id)
+    workflow = WorkflowTemplate.query.get_or_404(id)
     
     # 检查是否有依赖该工作流的实例
     instances_count = WorkflowInstance.query.filter_by(workflow_id=workflow.id).count()
@@ -208,9 +217,9 @@ def delete_workflow(id):
 @bp.route('/instances', methods=['GET'])
 @login_required
 @api_required
+@read_replica
 def get_instances():
     """获取工作流实例列表"""
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     query = WorkflowInstance.query
@@ -235,20 +244,20 @@ def get_instances():
     if keyword:
         query = query.filter(WorkflowInstance.title.contains(keyword))
     
-    # 分页
-    pagination = query.order_by(WorkflowInstance.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
-    
-    instances = pagination.items
+    # 分页（带 cursor 参数时使用游标分页）
+    try:
+        instances, page_info = paginate_request(query, WorkflowInstance.created_at, WorkflowInstance.id, per_page)
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
         'data': {
             'items': [instance.to_dict() for instance in instances],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'page': page,
-            'per_page': per_page
+            **page_info
         }
     })
 
@@ -256,7 +265,7 @@ def get_instances():
 @login_required
 @api_required
 def get_instance(id):
-    """获取单个工作流实例"""
+    """获取单个工作流实例，流程模板、审批记录和历史的查询次数固定"""
     instance = WorkflowInstance.query.get_or_404(id)
     
     # 检查权限
@@ -266,30 +275,12 @@ def get_instance(id):
             'message': '无权访问此工作流实例'
         }), 403
     
-    # 获取工作流定义
-    workflow = Workflow.query.get_or_404(instance.workflow_id)
-    
-    # 获取审批历史
-    approvals = WorkflowApproval.query.filter_by(instance_id=instance.id).all()
-    approvals_data = [approval.to_dict() for approval in approvals]
-    
-    # 添加审批人信息
-    for approval_data in approvals_data:
-        user = User.query.get(approval_data['user_id'])
-        if user:
-            approval_data['approver_name'] = user.fullname or user.username
-    
-    # 获取工作流历史
-    history = get_workflow_history(instance.id)
+    # compact=1 时只返回用户名称，不内嵌用户详情
+    compact = request.args.get('compact', '').lower() in ('1', 'true')
     
     return jsonify({
         'success': True,
-        'data': {
-            'instance': instance.to_dict(),
-            'workflow': workflow.to_dict(),
-            'approvals': approvals_data,
-            'history': history
-        }
+        'data': get_instance_detail(instance, compact=compact)
     })
 
 @bp.route('/instances', methods=['POST'])
@@ -310,7 +301,7 @@ def create_instance():
             }), 400
     
     # 验证工作流存在且激活
-    workflow = Workflow.query.get(data['workflow_id'])
+    workflow = WorkflowTemplate.query.get(data['workflow_id'])
     if not workflow:
         return jsonify({
             'success': False,
@@ -365,7 +356,7 @@ def submit_instance(id):
         }), 400
     
     # 获取工作流定义
-    workflow = Workflow.query.get_or_404(instance.workflow_id)
+    workflow = WorkflowTemplate.query.get_or_404(instance.workflow_id)
     definition = workflow.get_definition()
     
     # 获取第一个步骤
@@ -379,25 +370,27 @@ def submit_instance(id):
         
         # 更新实例状态
         instance.status = 'running'
-        instance.current_step = first_step['id']
-        db.session.commit()
         
         # 记录日志
         log_workflow_activity(
             instance_id=instance.id,
             user_id=current_user.id,
             action='submit',
-            message='提交工作流实例，开始流程'
+            message='提交工作流实例，开始流程',
+            commit=False
         )
         
-        # 如果第一个步骤是自动步骤，则自动处理
-        if first_step.get('type') == 'auto':
-            process_workflow_step(
-                instance_id=instance.id,
-                step_id=first_step['id'],
-                action='auto',
-                user_id=current_user.id
-            )
+        # 流程整体超时
+        timeout = current_app.config.get('WORKFLOW_INSTANCE_TIMEOUT')
+        if timeout:
+            schedule_timer(instance.id, 'instance.timeout', datetime.utcnow() + timedelta(seconds=timeout))
+        
+        # 进入第一个步骤（并行步骤时进入各分支），自动步骤的执行和审批通知由事件分发器处理
+        enter_workflow_step(instance, definition, first_step, current_user.id)
+        
+        # 状态变更、日志和事件一次提交
+        db.session.commit()
+        event_dispatcher.notify(instance.id)
         
         return jsonify({
             'success': True,
@@ -430,8 +423,11 @@ def approve_instance(id):
             'message': f'工作流实例当前状态为 {instance.status}，无法审批'
         }), 400
     
+    # 并行区段中需要指定审批的分支步骤，默认为当前步骤
+    step_id = data.get('step_id', instance.current_step)
+    
     # 检查是否有权限审批当前步骤
-    if not can_user_approve_step(instance, current_user.id):
+    if not can_user_approve_step(instance, current_user.id, step_id):
         return jsonify({
             'success': False,
             'message': '无权审批此工作流步骤'
@@ -451,7 +447,7 @@ def approve_instance(id):
         # 处理工作流步骤
         result = process_workflow_step(
             instance_id=instance.id,
-            step_id=instance.current_step,
+            step_id=step_id,
             action=action,
             user_id=current_user.id,
             comment=comment
@@ -463,12 +459,61 @@ def approve_instance(id):
             'data': result
         })
     
+    except WorkflowConflictError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'处理工作流步骤失败: {str(e)}'
         }), 500
 
+@bp.route('/instances/batch-approve', methods=['POST'])
+@login_required
+@api_required
+@permission_required(Permission.WORKFLOW_APPROVAL)
+def batch_approve_instances():
+    """批量审批工作流实例，返回每一项的处理结果"""
+    data = request.get_json() or {}
+    items = data.get('items')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'success': False,
+            'message': '请提供审批项列表'
+        }), 400
+    
+    try:
+        results = process_workflow_steps_batch(items, current_user.id)
+    except WorkflowConflictError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'批量审批失败: {str(e)}'
+        }), 500
+    
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'message': f'批量审批完成，成功 {succeeded} 项，失败 {len(results) - succeeded} 项',
+        'data': {
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        }
+    })
+
 @bp.route('/instances/<int:id>/cancel', methods=['POST'])
 @login_required
 @api_required
@@ -490,17 +535,18 @@ def cancel_instance(id):
             'message': f'工作流实例当前状态为 {instance.status}，无法取消'
         }), 400
     
-    # 更新实例状态
-    instance.status = 'cancelled'
-    db.session.commit()
+    # 更新实例状态，结束并行分支并取消未触发的定时器
+    cancel_workflow_instance(instance)
     
-    # 记录日志
+    # 记录日志，与状态变更一次提交
     log_workflow_activity(
         instance_id=instance.id,
         user_id=current_user.id,
         action='cancel',
-        message='取消工作流实例'
+        message='取消工作流实例',
+        commit=False
     )
+    db.session.commit()
     
     return jsonify({
         'success': True,
@@ -523,15 +569,16 @@ def delete_instance(id):
             'message': f'无法删除状态为 {instance.status} 的工作流实例'
         }), 400
     
-    # 删除相关的审批记录
-    WorkflowApproval.query.filter_by(instance_id=instance.id).delete()
+    # 在同一事务中删除相关的审批记录、日志、事件、定时器和并行分支
+    for model in (WorkflowApproval, WorkflowLog, WorkflowEvent, WorkflowTimer, WorkflowToken):
+        model.query.filter_by(instance_id=instance.id).delete(synchronize_session=False)
     
-    # 删除实例
+    # 删除实例，附件和签署记录保留，与实例解除关联
     db.session.delete(instance)
     db.session.commit()
     
     # 记录日志
-    current_app.logger.info(f'用户 {current_user.username} 删除了工作流实例 #{instance.instance_id}')
+    current_app.logger.info(f'用户 {current_user.username} 删除了工作流实例 #{instance.id}')
     
     return jsonify({
         'success': True,
@@ -543,6 +590,7 @@ def delete_instance(id):
 @bp.route('/tasks', methods=['GET'])
 @login_required
 @api_required
+@read_replica
 def get_tasks():
     """获取用户待处理的任务"""
     page = request.args.get('page', 1, type=int)
@@ -3,7 +3,6 @@ import uuid
 import random
 import string
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 from flask import current_app, url_for
 import base64
 import time
@@ -28,6 +27,8 @@ def generate_random_string(length=CAPTCHA_LENGTH):
 
 def generate_captcha():
     """生成验证码图片和对应的ID"""
+    from PIL import Image, ImageDraw, ImageFont
+    
     # 生成随机验证码字符串
     captcha_text = generate_random_string()
     
@@ -35,10 +36,12 @@ def generate_captcha():
     image = Image.new('RGB', (CAPTCHA_WIDTH, CAPTCHA_HEIGHT), color=(255, 255, 255))
     draw = ImageDraw.Draw(image)
     
-    # 尝试加载字体
+    # 根据字形覆盖索引选择包含验证码全部字符的字体，优先使用 Arial
     try:
-        font_path = os.path.join(current_app.static_folder, 'fonts', 'arial.ttf')
-        if not os.path.exists(font_path):
+        from app.services.font_service import font_manager
+        font_path = font_manager.select_font(
+            captcha_text, preferred=[os.path.join(current_app.static_folder, 'fonts', 'arial.ttf')])
+        if not font_path:
             # 使用系统默认字体
             font = ImageFont.load_default()
         else:
@@ -48,7 +51,8 @@ def generate_captcha():
         font = ImageFont.load_default()
     
     # 绘制文本
-    text_width, text_height = draw.textsize(captcha_text, font=font)
+    left, top, right, bottom = draw.textbbox((0, 0), captcha_text, font=font)
+    text_width, text_height = right - left, bottom - top
     x = (CAPTCHA_WIDTH - text_width) // 2
     y = (CAPTCHA_HEIGHT - text_height) // 2
     
@@ -70,7 +74,7 @@ def generate_captcha():
     # 绘制验证码文本
     for i, char in enumerate(captcha_text):
         # 每个字符有轻微的角度变化
-        char_image = Image.new('RGB', (CAPTCHA_FONT_SIZE, CAPTCHA_FONT_SIZE + 10), (255, 255, 255))
+        char_image = Image.new('RGBA', (CAPTCHA_FONT_SIZE, CAPTCHA_FONT_SIZE + 10), (255, 255, 255, 0))
         char_draw = ImageDraw.Draw(char_image)
         
         # 随机颜色
@@ -84,7 +88,7 @@ def generate_captcha():
         
         # 随机旋转
         angle = random.uniform(-30, 30)
-        char_image = char_image.rotate(angle, expand=True, fillcolor=(255, 255, 255))
+        char_image = char_image.rotate(angle, expand=True, fillcolor=(255, 255, 255, 0))
         
         # 放置到原图
         image.paste(char_image, (x_offset, y_offset), mask=char_image)
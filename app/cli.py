@@ -0,0 +1,171 @@
+import click
+from app.services.task_scheduler import task_scheduler
+
+
+def register_commands(app):
+    """注册 flask 命令行工具"""
+
+    @app.cli.group()
+    def logs():
+        """日志维护命令"""
+        pass
+
+    @logs.command('archive')
+    @click.option('--days', type=int, default=None, help='保留天数，默认按 LOG_RETENTION_DAYS 配置')
+    def archive_logs(days):
+        """将超过保留期的日志归档到压缩文件"""
+        from app.services.archive_service import archive_expired_logs
+        result = archive_expired_logs(retention_days=days)
+        for table, count in result.items():
+            click.echo(f'{table}: 归档 {count} 条')
+
+    @app.cli.group()
+    def schema():
+        """数据库结构维护命令"""
+        pass
+
+    @schema.command('upgrade')
+    def upgrade_schema():
+        """创建缺失的表，为已有的表补建模型中新增的列、索引和权限"""
+        from app.services.schema_service import upgrade_schema as _upgrade_schema
+        from app.services.search_service import ensure_fulltext_index
+        result = _upgrade_schema()
+        ensure_fulltext_index()
+        for label, key in (('表', 'tables'), ('列', 'columns'), ('索引', 'indexes'), ('权限', 'permissions')):
+            if result[key]:
+                click.echo(f"已创建{label}: {', '.join(result[key])}")
+        if result['backfilled']:
+            click.echo(f"已回填空值: {', '.join(result['backfilled'])}")
+        if not any(result.values()):
+            click.echo('数据库结构已是最新')
+
+    @app.cli.group()
+    def indexes():
+        """数据库索引维护命令"""
+        pass
+
+    @indexes.command('ensure')
+    def ensure_indexes():
+        """补建模型中声明但数据库缺失的索引"""
+        from app.services.index_service import ensure_indexes as _ensure_indexes
+        created = _ensure_indexes()
+        click.echo(f"已补建索引: {', '.join(created)}" if created else '索引已是最新')
+
+    @app.cli.group()
+    def scheduler():
+        """后台任务调度命令"""
+        pass
+
+    @scheduler.command('run')
+    def run_scheduler():
+        """以独立进程运行后台任务调度器"""
+        task_scheduler.app = app
+        try:
+            task_scheduler.run_forever()
+        except KeyboardInterrupt:
+            task_scheduler.stop()
+
+    @scheduler.command('list')
+    def list_tasks():
+        """列出已注册的后台任务"""
+        task_scheduler.app = app
+        for task in task_scheduler.get_status():
+            click.echo(f"{task['name']}: 每 {task['interval']:.0f} 秒")
+
+    @app.cli.group()
+    def events():
+        """工作流事件分发命令"""
+        pass
+
+    @events.command('run')
+    def run_events():
+        """以独立进程运行工作流事件分发器和定时器"""
+        from app.services.event_service import event_dispatcher
+        from app.services.timer_service import timer_service
+        event_dispatcher.app = app
+        timer_service.app = app
+        timer_service.start()
+        try:
+            event_dispatcher.run_forever()
+        except KeyboardInterrupt:
+            event_dispatcher.stop()
+            timer_service.stop()
+
+    @events.command('dispatch')
+    def dispatch_events():
+        """立即处理所有到期的定时器和工作流事件"""
+        from app.services.event_service import event_dispatcher
+        from app.services.timer_service import timer_service
+        event_dispatcher.app = app
+        timer_service.app = app
+        click.echo(f'已触发 {timer_service.fire_due()} 个定时器')
+        click.echo(f'已处理 {event_dispatcher.dispatch_pending()} 个事件')
+
+    @app.cli.group()
+    def workflows():
+        """工作流维护命令"""
+        pass
+
+    @workflows.command('recover')
+    @click.option('--all', 'mark_all', is_flag=True, help='先标记所有运行中的实例进行全面检查')
+    @click.option('--max-batches', type=int, default=None, help='最多处理的批数，默认按 WORKFLOW_RECOVERY_MAX_BATCHES 配置')
+    def recover(mark_all, max_batches):
+        """增量恢复被标记的工作流实例"""
+        from app.services.workflow_service import recover_workflows, mark_instances_for_recovery
+        if mark_all:
+            click.echo(f'已标记 {mark_instances_for_recovery()} 个运行中的实例')
+        result = recover_workflows(max_batches=max_batches)
+        click.echo(f"检查 {result['examined']} 个，恢复 {result['recovered']} 个，失败 {result['failed']} 个，"
+                   f"剩余 {result['pending']} 个待检查")
+
+    @app.cli.group()
+    def fonts():
+        """字体资源命令"""
+        pass
+
+    @fonts.command('install')
+    def install_fonts():
+        """从系统复制必需字体，生成字体CSS和字体清单（部署时执行）"""
+        from app.services.font_service import font_manager
+        missing_fonts, css_path = font_manager.install()
+        click.echo(f'已生成字体CSS: {css_path}')
+        click.echo(f"缺少必需字体: {', '.join(missing_fonts)}" if missing_fonts else '必需字体已就绪')
+
+    @fonts.command('download')
+    @click.option('--mirror', default=None, help='本地镜像目录，离线安装时从这里复制字体')
+    @click.option('--workers', type=int, default=None, help='最大并发下载数')
+    def download_fonts(mirror, workers):
+        """并发下载预定义的开源字体（可断点续传），并更新字体CSS和字体清单"""
+        from app.services.font_service import font_manager
+        if mirror:
+            app.config['FONT_MIRROR_DIR'] = mirror
+        if workers:
+            app.config['FONT_DOWNLOAD_WORKERS'] = workers
+        success_count, total_count, errors = font_manager.download_all_fonts()
+        click.echo(f'成功: {success_count}/{total_count}')
+        for error in errors:
+            click.echo(error)
+
+    @fonts.command('subset')
+    def subset_fonts():
+        """预先生成所有字体的 unicode-range 分片子集（不执行时在首次请求时生成）"""
+        from app.services.font_service import font_manager
+        generated, errors = font_manager.generate_subsets()
+        click.echo(f'已生成 {generated} 个字体子集')
+        for error in errors:
+            click.echo(error)
+
+    @fonts.command('status')
+    def font_status():
+        """查看字体清单"""
+        from app.services.font_service import font_manager
+        manifest = font_manager.load_manifest()
+        if manifest is None:
+            click.echo('未找到字体清单，请运行 flask fonts install')
+            return
+        click.echo(f"生成时间: {manifest['generated_at']}")
+        for font_file, entry in sorted(manifest['fonts'].items()):
+            coverage = entry.get('coverage') or {}
+            click.echo(f"{font_file}: {entry['size'] / 1024 / 1024:.1f}MB, 版本 {entry['hash'][:12]}, "
+                       f"{coverage.get('codepoints', '?')} 个字符, {len(entry.get('slices') or {})} 个分片")
+        click.echo(f"缺少必需字体: {', '.join(manifest['missing_required']) or '无'}")
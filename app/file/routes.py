@@ -13,7 +13,7 @@ from app.services.file_service import (
     verify_file_access_token
 )
 from app.services.workflow_service import get_current_step_id
-from app.utils.decorators import api_required
+from app.utils.decorators import api_required, read_replica
 from app.services.watermark_service import add_viewing_watermark, add_printing_watermark, add_pdf_watermark
 import json
 import mimetypes
@@ -93,6 +93,7 @@ def upload_file():
 @bp.route('/files', methods=['GET'])
 @login_required
 @api_required
+@read_replica
 def get_files():
     """获取文件列表API接口"""
     instance_id = request.args.get('instance_id', None)
@@ -1,9 +1,10 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, abort, current_app
 from flask_login import login_required, current_user
 from app.main import bp
 from app.models import WorkflowTemplate, WorkflowInstance, User, Permission
 from app.utils.decorators import permission_required
 from app.services.workflow_service import get_user_pending_tasks
+from app.services.font_service import font_manager
 from datetime import datetime
 import json
 
@@ -112,4 +113,22 @@ def workflow_instance_detail(id):
 @permission_required(Permission.WORKFLOW_CREATE)
 def create_workflow():
     # Implementation of the create_workflow route
-    pass 
\ No newline at end of file
+    pass 
+
+@bp.route('/fonts/subset/<font_file>/<version>/<name>.woff2')
+def font_subset(font_file, version, name):
+    """字体子集（WOFF2），分片子集在首次请求时生成，URL带字体版本号，允许浏览器长期缓存"""
+    try:
+        path = font_manager.get_subset(font_file, version, name)
+    except Exception as e:
+        current_app.logger.error(f'生成字体子集失败 {font_file}/{name}: {str(e)}')
+        abort(500)
+    if not path:
+        abort(404)
+    
+    response = send_file(path, mimetype='font/woff2')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('STATIC_VERSIONED_MAX_AGE', 365 * 24 * 60 * 60)
+    response.cache_control.immutable = True
+    return response
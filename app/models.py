@@ -48,6 +48,7 @@ class Permission(db.Model):
     WORKFLOW_INSTANCE_VIEW = 'workflow_instance_view'  # 查看流程实例
     WORKFLOW_APPROVAL = 'workflow_approval'  # 流程审批权限
     WORKFLOW_INSTANCE_CANCEL = 'workflow_instance_cancel'  # 取消流程实例
+    WORKFLOW_INSTANCE_DELETE = 'workflow_instance_delete'  # 删除流程实例
     
     # 文件权限
     FILE_UPLOAD = 'file_upload'  # 上传文件
@@ -103,7 +104,7 @@ class User(UserMixin, db.Model):
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
     position = db.Column(db.String(64))
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     roles = db.relationship('Role', secondary=users_roles,
@@ -153,7 +154,10 @@ class User(UserMixin, db.Model):
         if self.has_role(role.name):
             self.roles.remove(role)
     
-    def to_dict(self):
+    def to_dict(self, role_names=None):
+        """
+        :param role_names: 预先批量查询的角色名列表，为None时查询该用户的角色
+        """
         return {
             'id': self.id,
             'username': self.username,
@@ -165,7 +169,7 @@ class User(UserMixin, db.Model):
             'position': self.position,
             'last_seen': self.last_seen.isoformat() if self.last_seen else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'roles': [role.name for role in self.roles],
+            'roles': [role.name for role in self.roles] if role_names is None else role_names,
         }
     
     def __repr__(self):
@@ -183,7 +187,7 @@ class WorkflowTemplate(db.Model):
     description = db.Column(db.Text)
     steps = db.Column(db.Text)  # 使用JSON存储步骤定义
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
@@ -198,6 +202,14 @@ class WorkflowTemplate(db.Model):
     def set_steps(self, steps_list):
         self.steps = json.dumps(steps_list)
     
+    def get_definition(self):
+        """获取流程引擎使用的流程定义"""
+        return {'steps': self.get_steps()}
+    
+    def set_definition(self, definition):
+        """保存流程定义，目前只保存其中的步骤"""
+        self.set_steps(definition.get('steps', []))
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -275,13 +287,29 @@ class WorkflowInstance(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, running, completed, rejected, canceled
     current_step = db.Column(db.Integer)  # 当前步骤ID
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 乐观锁版本号
+    needs_recovery = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # 是否需要恢复检查
     
     creator = db.relationship('User', backref=db.backref('workflow_submissions', lazy='dynamic'))
     approvals = db.relationship('WorkflowApproval', backref='instance', lazy='dynamic')
     
+    __table_args__ = (
+        # 按状态筛选并按更新时间排序（待办、超时恢复、统计）
+        db.Index('ix_workflow_instances_status_updated_at', 'status', 'updated_at'),
+        # 我发起的流程列表
+        db.Index('ix_workflow_instances_created_by_created_at', 'created_by', 'created_at'),
+        # 恢复任务按ID顺序读取被标记的实例
+        db.Index('ix_workflow_instances_needs_recovery_id', 'needs_recovery', 'id'),
+    )
+    
+    # 更新时自动比较并递增版本号，版本不一致时抛出 StaleDataError
+    __mapper_args__ = {
+        'version_id_col': version
+    }
+    
     def get_data(self):
         if self.data:
             return json.loads(self.data)
@@ -302,12 +330,45 @@ class WorkflowInstance(db.Model):
             'creator_name': self.creator.username if self.creator else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'version': self.version
         }
     
     def __repr__(self):
         return f'<WorkflowInstance {self.id} ({self.status})>'
 
+class WorkflowToken(db.Model):
+    """并行分支令牌，每个活动分支一个，记录分支当前所在的步骤"""
+    __tablename__ = 'workflow_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, db.ForeignKey('workflow_instances.id'))
+    split_step_id = db.Column(db.Integer, nullable=False)  # 创建分支的并行步骤ID
+    branch_step_id = db.Column(db.Integer, nullable=False)  # 分支的第一个步骤ID
+    current_step = db.Column(db.Integer)  # 分支当前步骤ID，到达汇聚步骤后为汇聚步骤ID
+    status = db.Column(db.String(20), default='active')  # active, arrived, canceled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_workflow_tokens_instance_id_status', 'instance_id', 'status'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'instance_id': self.instance_id,
+            'split_step_id': self.split_step_id,
+            'branch_step_id': self.branch_step_id,
+            'current_step': self.current_step,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<WorkflowToken {self.id} ({self.status})>'
+
 class WorkflowApproval(db.Model):
     __tablename__ = 'workflow_approvals'
     
@@ -321,6 +382,10 @@ class WorkflowApproval(db.Model):
     
     approver = db.relationship('User', backref=db.backref('approvals', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_workflow_approvals_instance_id_step_id', 'instance_id', 'step_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -357,6 +422,10 @@ class FileAttachment(db.Model):
     operations = db.relationship('FileOperation', backref='file', lazy='dynamic')
     signatures = db.relationship('FileSignature', backref='file', lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ix_file_attachments_instance_id_is_deleted', 'instance_id', 'is_deleted'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -383,11 +452,17 @@ class FileOperation(db.Model):
     file_id = db.Column(db.Integer, db.ForeignKey('file_attachments.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     operation_type = db.Column(db.String(50))  # upload, view, edit, sign, delete, print
-    operation_time = db.Column(db.DateTime, default=datetime.utcnow)
+    operation_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     operation_detail = db.Column(db.Text)  # 使用JSON存储操作详情
     
     user = db.relationship('User', backref=db.backref('file_operations', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_file_operations_file_id_operation_time', 'file_id', 'operation_time'),
+        # 归档按时间范围扫描
+        db.Index('ix_file_operations_operation_time_id', 'operation_time', 'id'),
+    )
+    
     def get_detail(self):
         if self.operation_detail:
             return json.loads(self.operation_detail)
@@ -456,12 +531,17 @@ class WorkflowLog(db.Model):
     action = db.Column(db.String(50))  # start, approve, reject, comment, complete, cancel
     step_id = db.Column(db.Integer, nullable=True)
     message = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # 关联
     instance = db.relationship('WorkflowInstance', backref=db.backref('logs', lazy='dynamic'))
     user = db.relationship('User', backref=db.backref('workflow_logs', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_workflow_logs_instance_id_created_at', 'instance_id', 'created_at'),
+        db.Index('ix_workflow_logs_created_at_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -477,6 +557,125 @@ class WorkflowLog(db.Model):
     def __repr__(self):
         return f'<WorkflowLog {self.id} ({self.action})>'
 
+class WorkflowEvent(db.Model):
+    """工作流事件（发件箱），与实例状态变更在同一事务中写入，由事件分发器异步处理"""
+    __tablename__ = 'workflow_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, db.ForeignKey('workflow_instances.id'))
+    event_type = db.Column(db.String(64), nullable=False)  # step.entered, instance.completed, instance.rejected
+    step_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text)  # 使用JSON存储附加数据
+    status = db.Column(db.String(20), default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)  # 已尝试处理次数
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)  # 最早可处理时间（失败重试时延后）
+    locked_until = db.Column(db.DateTime, nullable=True)  # 处理租约到期时间
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # 分发器按状态领取到期事件
+        db.Index('ix_workflow_events_status_available_at', 'status', 'available_at'),
+        db.Index('ix_workflow_events_instance_id_id', 'instance_id', 'id'),
+    )
+    
+    def get_payload(self):
+        if self.payload:
+            return json.loads(self.payload)
+        return {}
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'instance_id': self.instance_id,
+            'event_type': self.event_type,
+            'step_id': self.step_id,
+            'payload': self.get_payload(),
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<WorkflowEvent {self.id} ({self.event_type})>'
+
+class WorkflowTimer(db.Model):
+    """工作流定时器（步骤截止时间、流程超时），到期后写入 timer.fired 事件"""
+    __tablename__ = 'workflow_timers'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, db.ForeignKey('workflow_instances.id'))
+    step_id = db.Column(db.Integer, nullable=True)
+    timer_type = db.Column(db.String(32), nullable=False)  # step.deadline, instance.timeout
+    payload = db.Column(db.Text)  # 使用JSON存储附加数据
+    due_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, fired, canceled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    fired_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # 定时器服务按到期时间加载近期的定时器
+        db.Index('ix_workflow_timers_status_due_at', 'status', 'due_at'),
+        db.Index('ix_workflow_timers_instance_id_status', 'instance_id', 'status'),
+    )
+    
+    def get_payload(self):
+        if self.payload:
+            return json.loads(self.payload)
+        return {}
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'instance_id': self.instance_id,
+            'step_id': self.step_id,
+            'timer_type': self.timer_type,
+            'payload': self.get_payload(),
+            'due_at': self.due_at.isoformat() if self.due_at else None,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'fired_at': self.fired_at.isoformat() if self.fired_at else None
+        }
+    
+    def __repr__(self):
+        return f'<WorkflowTimer {self.id} ({self.timer_type})>'
+
+class WorkflowRecoveryRun(db.Model):
+    """工作流恢复任务，记录检查点和进度"""
+    __tablename__ = 'workflow_recovery_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='running')  # running, completed
+    checkpoint_id = db.Column(db.Integer, default=0)  # 已检查的最大实例ID
+    examined = db.Column(db.Integer, default=0)  # 已检查实例数
+    recovered = db.Column(db.Integer, default=0)  # 已恢复实例数
+    failed = db.Column(db.Integer, default=0)  # 恢复失败实例数
+    last_error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'checkpoint_id': self.checkpoint_id,
+            'examined': self.examined,
+            'recovered': self.recovered,
+            'failed': self.failed,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<WorkflowRecoveryRun {self.id} ({self.status})>'
+
 class SystemLog(db.Model):
     __tablename__ = 'system_logs'
     
@@ -486,11 +685,16 @@ class SystemLog(db.Model):
     message = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     ip_address = db.Column(db.String(64), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # 关联
     user = db.relationship('User', foreign_keys=[user_id])
     
+    __table_args__ = (
+        # 日志列表按 (时间, ID) 游标分页
+        db.Index('ix_system_logs_created_at_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -506,6 +710,55 @@ class SystemLog(db.Model):
     def __repr__(self):
         return f'<SystemLog {self.id}>'
 
+class RequestProfile(db.Model):
+    """慢请求的调用栈采样（折叠栈格式，可直接生成火焰图）"""
+    __tablename__ = 'request_profiles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(128))
+    method = db.Column(db.String(10))
+    path = db.Column(db.String(512))
+    params = db.Column(db.Text)  # 使用JSON存储路由参数和查询参数
+    status_code = db.Column(db.Integer)
+    duration_ms = db.Column(db.Integer)
+    sample_count = db.Column(db.Integer, default=0)
+    stacks = db.Column(db.Text)  # 每行 "帧;帧;帧 次数"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    user = db.relationship('User', foreign_keys=[user_id])
+    
+    __table_args__ = (
+        db.Index('ix_request_profiles_created_at_id', 'created_at', 'id'),
+        db.Index('ix_request_profiles_endpoint_created_at', 'endpoint', 'created_at'),
+    )
+    
+    def get_params(self):
+        if self.params:
+            return json.loads(self.params)
+        return {}
+    
+    def to_dict(self, include_stacks=False):
+        data = {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'params': self.get_params(),
+            'status_code': self.status_code,
+            'duration_ms': self.duration_ms,
+            'sample_count': self.sample_count,
+            'user_id': self.user_id,
+            'username': self.user.username if self.user else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        if include_stacks:
+            data['stacks'] = self.stacks
+        return data
+    
+    def __repr__(self):
+        return f'<RequestProfile {self.id} ({self.endpoint} {self.duration_ms}ms)>'
+
 class LoginLog(db.Model):
     __tablename__ = 'login_logs'
     
@@ -515,11 +768,16 @@ class LoginLog(db.Model):
     status = db.Column(db.String(16))  # success, failed
     ip_address = db.Column(db.String(64))
     user_agent = db.Column(db.String(256))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # 关联
     user = db.relationship('User', foreign_keys=[user_id])
     
+    __table_args__ = (
+        db.Index('ix_login_logs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_login_logs_status_created_at', 'status', 'created_at'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
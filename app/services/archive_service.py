@@ -0,0 +1,348 @@
+"""
+日志保留与归档服务
+
+超过保留期的日志按批从主库迁出，按月分区写入压缩的 JSONL 文件：
+    <LOG_ARCHIVE_FOLDER>/<表名>/<YYYY-MM>/<起始ID>-<结束ID>.jsonl.gz
+每个表维护一个 manifest.json，记录各归档文件的时间范围和行数，
+查询归档时只读取与时间范围重叠的文件。
+"""
+import os
+import json
+import gzip
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import SystemLog, LoginLog, FileOperation, User
+from app.utils.pagination import encode_cursor, decode_cursor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 可归档的表: 表名 -> (模型, 时间字段名)
+# 工作流日志是实例的审批记录，实例详情和历史需要完整读取，因此不归档
+ARCHIVE_TABLES = {
+    'system_logs': (SystemLog, 'created_at'),
+    'login_logs': (LoginLog, 'created_at'),
+    'file_operations': (FileOperation, 'operation_time'),
+}
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_LOCK_NAME = 'manifest.lock'
+
+
+def _archive_root():
+    return current_app.config['LOG_ARCHIVE_FOLDER']
+
+
+def _table_dir(table):
+    return os.path.join(_archive_root(), table)
+
+
+def _atomic_write(path, data, mode='wb'):
+    """先写临时文件再原子替换，避免读到写了一半的文件"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _manifest_lock(table):
+    """
+    清单读-改-写期间持有的文件锁，避免多个进程（例如 flask logs archive 与调度进程）同时归档时互相覆盖清单
+    :param table: 表名
+    """
+    os.makedirs(_table_dir(table), exist_ok=True)
+    path = os.path.join(_table_dir(table), MANIFEST_LOCK_NAME)
+    with open(path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def load_manifest(table):
+    """
+    读取表的归档清单
+    :param table: 表名
+    :return: 清单字典 {'files': [...]}
+    """
+    path = os.path.join(_table_dir(table), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'files': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(table, manifest):
+    os.makedirs(_table_dir(table), exist_ok=True)
+    path = os.path.join(_table_dir(table), MANIFEST_NAME)
+    data = json.dumps(manifest, ensure_ascii=False, indent=2)
+    _atomic_write(path, data, mode='w')
+
+
+def _serialize_row(model, row):
+    """按表字段导出原始列值"""
+    record = {}
+    for column in model.__table__.columns:
+        value = getattr(row, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        record[column.key] = value
+    return record
+
+
+def _write_archive_file(table, month, records):
+    """
+    写入一个归档文件并登记到清单
+    同名文件已存在时（上次写入后删除前中断）直接复用，不重复写入
+    """
+    first_id, last_id = records[0]['id'], records[-1]['id']
+    month_dir = os.path.join(_table_dir(table), month)
+    os.makedirs(month_dir, exist_ok=True)
+    filename = f'{first_id}-{last_id}.jsonl.gz'
+    path = os.path.join(month_dir, filename)
+
+    if not os.path.exists(path):
+        lines = '\n'.join(json.dumps(r, ensure_ascii=False) for r in records) + '\n'
+        _atomic_write(path, gzip.compress(lines.encode('utf-8')))
+
+    time_key = ARCHIVE_TABLES[table][1]
+    times = [r[time_key] for r in records if r.get(time_key)]
+    relative_path = os.path.join(month, filename)
+    with _manifest_lock(table):
+        manifest = load_manifest(table)
+        if not any(entry['path'] == relative_path for entry in manifest['files']):
+            manifest['files'].append({
+                'path': relative_path,
+                'month': month,
+                'first_id': first_id,
+                'last_id': last_id,
+                'rows': len(records),
+                'min_time': min(times) if times else None,
+                'max_time': max(times) if times else None,
+                'archived_at': datetime.utcnow().isoformat()
+            })
+            _save_manifest(table, manifest)
+
+
+def archive_table(table, before, batch_size=None):
+    """
+    将指定时间之前的记录归档并从主库删除
+    :param table: 表名
+    :param before: 截止时间，早于该时间的记录被归档
+    :param batch_size: 每批处理的行数
+    :return: 归档的行数
+    """
+    model, time_key = ARCHIVE_TABLES[table]
+    time_column = getattr(model, time_key)
+    batch_size = batch_size or current_app.config.get('LOG_ARCHIVE_BATCH_SIZE', 5000)
+    archived = 0
+
+    while True:
+        rows = model.query.filter(time_column < before)\
+            .order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        # 按月分组写入归档文件
+        groups = {}
+        for row in rows:
+            month = getattr(row, time_key).strftime('%Y-%m')
+            groups.setdefault(month, []).append(_serialize_row(model, row))
+        for month, records in groups.items():
+            _write_archive_file(table, month, records)
+
+        # 文件落盘后再删除主库记录
+        ids = [row.id for row in rows]
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(rows)
+
+        if len(rows) < batch_size:
+            break
+
+    return archived
+
+
+def archive_expired_logs(retention_days=None):
+    """
+    归档所有超过保留期的日志
+    :param retention_days: 统一的保留天数，默认按 LOG_RETENTION_DAYS 配置逐表计算
+    :return: {表名: 归档行数}
+    """
+    retention = current_app.config.get('LOG_RETENTION_DAYS', {})
+    now = datetime.utcnow()
+    result = {}
+
+    for table in ARCHIVE_TABLES:
+        days = retention_days if retention_days is not None else retention.get(table)
+        if not days:
+            continue
+        try:
+            count = archive_table(table, now - timedelta(days=days))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"归档 {table} 失败: {str(e)}")
+            continue
+        result[table] = count
+        if count:
+            current_app.logger.info(f"已归档 {table} {count} 条超过 {days} 天的记录")
+
+    return result
+
+
+def newest_archived_time(table):
+    """
+    获取归档中最新记录的时间，没有归档时返回None
+    :param table: 表名
+    """
+    times = [entry['max_time'] for entry in load_manifest(table)['files'] if entry.get('max_time')]
+    return datetime.fromisoformat(max(times)) if times else None
+
+
+def _read_archive_file(table, relative_path):
+    path = os.path.join(_table_dir(table), relative_path)
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def query_archive(table, start=None, end=None, filters=None, keyword=None, before=None, limit=50):
+    """
+    查询归档记录，按 (时间, ID) 降序返回
+    :param table: 表名
+    :param start: 开始时间
+    :param end: 结束时间
+    :param filters: 字段等值过滤条件字典
+    :param keyword: 消息关键字
+    :param before: (时间, ID)，只返回严格早于该位置的记录，用于游标续页
+    :param limit: 返回条数上限
+    :return: 记录字典列表
+    """
+    time_key = ARCHIVE_TABLES[table][1]
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+
+    entries = load_manifest(table)['files']
+    # 按文件内最新时间倒序读取，读满即停
+    entries = sorted(entries, key=lambda e: e.get('max_time') or '', reverse=True)
+
+    results = []
+    for entry in entries:
+        min_time = datetime.fromisoformat(entry['min_time']) if entry.get('min_time') else None
+        max_time = datetime.fromisoformat(entry['max_time']) if entry.get('max_time') else None
+        if start and max_time and max_time < start:
+            continue
+        if end and min_time and min_time > end:
+            continue
+        if before and min_time and min_time > before[0]:
+            continue
+        # 已收集满，且剩余文件都比已收集的记录更旧
+        if len(results) >= limit and max_time and max_time < results[limit - 1]['_time']:
+            break
+
+        for record in _read_archive_file(table, entry['path']):
+            record_time = datetime.fromisoformat(record[time_key]) if record.get(time_key) else None
+            if record_time is None:
+                continue
+            if start and record_time < start:
+                continue
+            if end and record_time > end:
+                continue
+            if before and (record_time, record['id']) >= before:
+                continue
+            if any(record.get(k) != v for k, v in filters.items()):
+                continue
+            # 与主库的 LIKE 一致，不区分大小写
+            if keyword and keyword.lower() not in (record.get('message') or '').lower():
+                continue
+            record['_time'] = record_time
+            results.append(record)
+
+        results.sort(key=lambda r: (r['_time'], r['id']), reverse=True)
+
+    return results[:limit]
+
+
+def extend_page_with_archive(table, items, page_info, per_page, cursor=None,
+                             start=None, end=None, filters=None, keyword=None):
+    """
+    游标分页时，主库记录不足一页则从归档中继续读取
+    :param table: 表名
+    :param items: 当前页已有的记录字典列表（来自主库）
+    :param page_info: paginate_request 返回的分页信息
+    :param per_page: 每页条数
+    :param cursor: 请求携带的游标
+    :param start: 开始时间
+    :param end: 结束时间
+    :param filters: 字段等值过滤条件
+    :param keyword: 消息关键字
+    :return: (记录列表, 分页信息)
+    """
+    # 仅游标分页支持续读归档
+    if 'next_cursor' not in page_info or page_info['has_more'] or len(items) >= per_page:
+        return items, page_info
+
+    time_key = ARCHIVE_TABLES[table][1]
+    if items:
+        before = (datetime.fromisoformat(items[-1][time_key]), items[-1]['id'])
+    elif cursor:
+        before = decode_cursor(cursor, time_key, True)
+    else:
+        before = None
+
+    # 多取一条判断归档中是否还有下一页
+    records = query_archive(table, start=start, end=end, filters=filters, keyword=keyword,
+                            before=before, limit=per_page - len(items) + 1)
+    has_more = len(records) > per_page - len(items)
+    records = records[:per_page - len(items)]
+
+    # 补充用户名
+    user_ids = {r['user_id'] for r in records if r.get('user_id')}
+    usernames = {}
+    if user_ids and table != 'login_logs':
+        usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all())
+
+    page_info = dict(page_info)
+    page_info['has_more'] = has_more
+    page_info['next_cursor'] = None
+    if has_more and records:
+        page_info['next_cursor'] = encode_cursor(time_key, True, records[-1]['_time'], records[-1]['id'])
+
+    for record in records:
+        record.pop('_time')
+        if table != 'login_logs':
+            record['username'] = usernames.get(record.get('user_id'))
+        record['archived'] = True
+        items.append(record)
+
+    return items, page_info
+
+
+def should_query_archive(table, include_archive=False, start=None):
+    """
+    判断本次查询是否需要读取归档
+    :param table: 表名
+    :param include_archive: 请求是否显式要求包含归档
+    :param start: 查询开始时间
+    """
+    newest = newest_archived_time(table)
+    if newest is None:
+        return False
+    if include_archive:
+        return True
+    return start is not None and start <= newest
@@ -0,0 +1,499 @@
+"""
+数据库连接管理服务
+
+根据数据库方言把 Config 中的连接池配置（POOL_SIZE、POOL_TIMEOUT 等）转换为引擎参数：
+- MySQL/PostgreSQL: QueuePool，支持溢出连接、超时、回收和连接前检测
+- SQLite 文件库: QueuePool 复用连接，连接时开启 WAL 并设置 busy_timeout；
+  生产模式（SQLITE_PRODUCTION_MODE）下额外调整 synchronous/cache/mmap 等参数，
+  并用进程内写锁串行化写事务，避免多个线程同时争抢数据库写锁
+- SQLite 内存库: 沿用 Flask-SQLAlchemy 的 StaticPool
+
+连接池使用 InstrumentedQueuePool，记录借出次数、等待时间、溢出和超时次数，
+可通过 get_pool_stats() 查看。
+
+配置了只读副本（SQLALCHEMY_REPLICA_URLS）时，会话使用 RoutingSession：
+标记为只读的 GET 请求在没有待写入数据时读取延迟正常的副本，其余查询仍走主库；
+用户写入后的一段时间内（REPLICA_STICKY_SECONDS）其读请求固定走主库，保证读到自己的写入；
+用户按 JWT 令牌或登录会话识别，粘滞记录保存在进程内。
+"""
+import re
+import time
+import random
+import logging
+import threading
+from flask import g, request, session as flask_session, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# 借出连接耗时超过该值（秒）时计为一次等待
+POOL_WAIT_THRESHOLD = 0.001
+
+# 需要获取 SQLite 写锁的语句
+_SQLITE_WRITE_PATTERN = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """连接池统计数据"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.overflow_max = 0
+
+    def record_checkout(self, elapsed, overflow):
+        with self._lock:
+            self.checkouts += 1
+            if elapsed >= POOL_WAIT_THRESHOLD:
+                self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def record_timeout(self, elapsed):
+        with self._lock:
+            self.timeouts += 1
+            self.waits += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'waits': self.waits,
+                'wait_time_total': round(self.wait_time_total, 6),
+                'wait_time_avg': round(self.wait_time_total / self.waits, 6) if self.waits else 0.0,
+                'wait_time_max': round(self.wait_time_max, 6),
+                'timeouts': self.timeouts,
+                'overflow_max': self.overflow_max
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录借出等待时间与溢出情况的 QueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - started)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started, max(self.overflow(), 0))
+        return connection
+
+    def _create_connection(self):
+        self.metrics.record_connect()
+        return super()._create_connection()
+
+
+def _sqlite_is_memory(sa_url):
+    return sa_url.database in (None, '', ':memory:')
+
+
+def build_engine_options(config, sa_url):
+    """
+    根据配置和数据库方言生成 create_engine 参数
+    :param config: 应用配置
+    :param sa_url: 数据库URL对象
+    :return: 引擎参数字典
+    """
+    backend = sa_url.get_backend_name()
+    pool_size = config.get('POOL_SIZE', 10)
+    max_overflow = config.get('POOL_MAX_OVERFLOW', 10)
+    pool_timeout = config.get('POOL_TIMEOUT', 10)
+
+    if backend in ('mysql', 'postgresql'):
+        return {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'pool_recycle': config.get('POOL_RECYCLE', 3600),
+            'pool_pre_ping': config.get('POOL_PRE_PING', True)
+        }
+
+    if backend == 'sqlite' and not _sqlite_is_memory(sa_url):
+        return {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {
+                # 驱动层等待锁的秒数，与 busy_timeout 保持一致
+                'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5000) / 1000,
+                # 连接由连接池在线程间复用
+                'check_same_thread': False
+            }
+        }
+
+    return {}
+
+
+def sqlite_pragmas(config):
+    """
+    根据配置生成 SQLite 连接时执行的 PRAGMA
+    :param config: 应用配置
+    :return: [(名称, 值)] 列表，按顺序执行
+    """
+    pragmas = []
+    if config.get('SQLITE_JOURNAL_MODE', 'WAL'):
+        pragmas.append(('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')))
+    pragmas.append(('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT', 5000))))
+    if config.get('SQLITE_PRODUCTION_MODE'):
+        pragmas.extend([
+            # WAL 模式下 NORMAL 只在检查点时同步，断电最多丢失最后几个事务，不会损坏数据库
+            ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+            ('cache_size', int(config.get('SQLITE_CACHE_SIZE', -64000))),
+            ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+            ('temp_store', 'MEMORY'),
+        ])
+    return pragmas
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """
+    为 SQLite 引擎注册连接事件，在每个新连接上设置 PRAGMA
+    :param engine: 数据库引擎
+    :param pragmas: [(名称, 值)] 列表
+    """
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def install_sqlite_writer_lock(engine, timeout):
+    """
+    为 SQLite 引擎注册进程内写锁
+
+    连接执行第一条写语句前获取锁，提交或回滚后释放，读操作不受影响。
+    同进程的写事务在锁上排队，而不是各自在 busy_timeout 中轮询重试。
+    等待超过 timeout 秒时放弃排队，交由 SQLite 自身的锁处理，避免同一线程持有多个连接时死锁。
+    :param engine: 数据库引擎
+    :param timeout: 等待写锁的秒数
+    """
+    from app.utils.metrics import metrics
+    writer_lock = threading.Lock()
+
+    def release(info):
+        if info.pop('_sqlite_writer_lock', False):
+            writer_lock.release()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def acquire_writer_lock(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('_sqlite_writer_lock') or not _SQLITE_WRITE_PATTERN.match(statement):
+            return
+        started = time.perf_counter()
+        acquired = writer_lock.acquire(timeout=timeout)
+        metrics.record_lock_wait(time.perf_counter() - started)
+        if acquired:
+            conn.info['_sqlite_writer_lock'] = True
+        else:
+            logger.warning('等待 SQLite 写锁超时，直接执行写操作')
+
+    @event.listens_for(engine, 'commit')
+    def release_on_commit(conn):
+        release(conn.info)
+
+    @event.listens_for(engine, 'rollback')
+    def release_on_rollback(conn):
+        release(conn.info)
+
+    # 连接未提交就归还连接池或被作废时，由连接池回滚
+    @event.listens_for(engine.pool, 'reset')
+    def release_on_reset(dbapi_connection, connection_record):
+        release(connection_record.info)
+
+    @event.listens_for(engine.pool, 'invalidate')
+    def release_on_invalidate(dbapi_connection, connection_record, exception):
+        release(connection_record.info)
+
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def _replica_lag_seconds(engine):
+    """
+    查询副本的复制延迟（秒）
+    :return: 延迟秒数，无法判断时返回0（如副本实际是主库或 SQLite）
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        if dialect == 'postgresql':
+            lag = conn.exec_driver_sql(
+                'SELECT CASE WHEN pg_is_in_recovery() '
+                'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END'
+            ).scalar()
+            return float(lag or 0)
+        if dialect == 'mysql':
+            try:
+                row = conn.exec_driver_sql('SHOW REPLICA STATUS').mappings().first()
+                key = 'Seconds_Behind_Source'
+            except Exception:
+                row = conn.exec_driver_sql('SHOW SLAVE STATUS').mappings().first()
+                key = 'Seconds_Behind_Master'
+            if row is None:
+                return 0.0
+            if row.get(key) is None:
+                # 复制线程已停止
+                return float('inf')
+            return float(row[key])
+        conn.exec_driver_sql('SELECT 1')
+    return 0.0
+
+
+class ReplicaRouter:
+    """
+    只读副本选择器
+
+    按 REPLICA_LAG_CHECK_INTERVAL 缓存每个副本的延迟，
+    延迟超过 REPLICA_MAX_LAG 或连接失败的副本暂不使用，全部不可用时回退到主库。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+        self._writes_lock = threading.Lock()
+        self._last_writes = {}
+
+    def replica_binds(self, app):
+        return [key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                if key.startswith(REPLICA_BIND_PREFIX)]
+
+    def _check(self, db, app, bind):
+        try:
+            lag = _replica_lag_seconds(db.get_engine(app, bind))
+            error = None
+        except Exception as e:
+            lag, error = None, str(e)
+            logger.warning(f"只读副本 {bind} 检查失败: {error}")
+        healthy = error is None and lag <= app.config.get('REPLICA_MAX_LAG', 5)
+        if error is None and not healthy:
+            logger.warning(f"只读副本 {bind} 复制延迟 {lag:.1f} 秒，暂停使用")
+        self._status[bind] = {'lag': lag, 'healthy': healthy, 'error': error, 'checked_at': time.time()}
+
+    def choose(self, db, app):
+        """
+        选择一个可用的副本
+        :return: 副本绑定名，没有可用副本时返回None
+        """
+        binds = self.replica_binds(app)
+        if not binds:
+            return None
+
+        interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+        now = time.time()
+        expired = [b for b in binds if now - self._status.get(b, {}).get('checked_at', 0) >= interval]
+        # 只让一个线程执行检查，其余线程沿用上次结果
+        if expired and self._lock.acquire(blocking=False):
+            try:
+                for bind in expired:
+                    self._check(db, app, bind)
+            finally:
+                self._lock.release()
+
+        healthy = [b for b in binds if self._status.get(b, {}).get('healthy')]
+        return random.choice(healthy) if healthy else None
+
+    def _client_key(self):
+        """
+        当前请求的客户端标识，用于写后读粘滞
+        JWT 请求取令牌中的用户，网页请求取登录会话中的用户，匿名请求返回None；
+        这里不使用 current_user，避免在加载登录用户的查询中递归选择数据库
+        """
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            from app.utils.security import verify_jwt_token
+            payload = verify_jwt_token(auth_header[len('Bearer '):])
+            if payload and payload.get('user_id') is not None:
+                return f"user:{payload['user_id']}"
+        user_id = flask_session.get('_user_id')
+        return f'user:{user_id}' if user_id is not None else None
+
+    def mark_write(self, app):
+        """
+        记录当前请求刚刚写入：本请求后续的读取走主库，
+        同一用户在粘滞期内的读请求也走主库（记录保存在进程内）
+        """
+        if not has_request_context():
+            return
+        g._db_wrote = True
+        key = self._client_key()
+        if key is None:
+            return
+        now = time.time()
+        cutoff = now - app.config.get('REPLICA_STICKY_SECONDS', 10)
+        with self._writes_lock:
+            self._last_writes[key] = now
+            # 顺带清理已过粘滞期的记录，避免无限增长
+            if len(self._last_writes) > 1024:
+                self._last_writes = {k: t for k, t in self._last_writes.items() if t >= cutoff}
+
+    def wrote_recently(self, app):
+        """当前请求或当前用户是否在粘滞期内写入过"""
+        if g.get('_db_wrote'):
+            return True
+        key = self._client_key()
+        if key is None:
+            return False
+        cutoff = time.time() - app.config.get('REPLICA_STICKY_SECONDS', 10)
+        return self._last_writes.get(key, 0) >= cutoff
+
+    def get_status(self, app):
+        """获取各副本的延迟与可用状态"""
+        return {bind: dict(self._status.get(bind, {})) for bind in self.replica_binds(app)}
+
+# 创建实例
+replica_router = ReplicaRouter()
+
+
+def use_read_replica():
+    """将当前请求标记为可读副本（仅对 GET 请求生效）"""
+    if request.method == 'GET':
+        g._use_read_replica = True
+
+
+class RoutingSession(SignallingSession):
+    """支持只读副本路由的会话"""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def _should_use_replica(self):
+        if not has_request_context() or not g.get('_use_read_replica'):
+            return False
+        # 会话中有待写入或已写入的数据时必须读主库
+        if self._flushing or self.new or self.dirty or self.deleted or self.info.get('_db_wrote'):
+            return False
+        return not replica_router.wrote_recently(self.app)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if mapper is not None and mapper.persist_selectable.info.get('bind_key') is not None:
+            return super().get_bind(mapper, clause)
+        if self._should_use_replica():
+            bind = replica_router.choose(self.db, self.app)
+            if bind:
+                return self.db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+def _record_flush(session, flush_context):
+    session.info['_db_wrote'] = True
+
+
+def _record_commit(session):
+    if session.info.pop('_db_wrote', False) and isinstance(session, RoutingSession) \
+            and replica_router.replica_binds(session.app):
+        replica_router.mark_write(session.app)
+
+
+def _clear_write_flag(session):
+    session.info.pop('_db_wrote', None)
+
+
+class ManagedSQLAlchemy(SQLAlchemy):
+    """按方言注入连接池参数、支持只读副本路由的 Flask-SQLAlchemy 扩展"""
+
+    def init_app(self, app):
+        # 只读副本以 replica_<序号> 的绑定名加入 SQLALCHEMY_BINDS
+        replicas = app.config.get('SQLALCHEMY_REPLICA_URLS') or []
+        if replicas:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            for index, url in enumerate(replicas):
+                binds.setdefault(f'{REPLICA_BIND_PREFIX}{index}', url)
+            app.config['SQLALCHEMY_BINDS'] = binds
+        super().init_app(app)
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, 'after_flush', _record_flush)
+        event.listen(factory, 'after_commit', _record_commit)
+        event.listen(factory, 'after_rollback', _clear_write_flag)
+        return factory
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        managed = build_engine_options(app.config, sa_url)
+        if managed:
+            # 覆盖 Flask-SQLAlchemy 对 SQLite 默认使用的 NullPool
+            options.pop('poolclass', None)
+            connect_args = dict(options.get('connect_args') or {})
+            connect_args.update(managed.pop('connect_args', {}))
+            options.update(managed)
+            if connect_args:
+                options['connect_args'] = connect_args
+        if sa_url.get_backend_name() == 'sqlite' and not _sqlite_is_memory(sa_url):
+            # 非 create_engine 参数，在 create_engine() 中取出
+            options['_sqlite_pragmas'] = sqlite_pragmas(app.config)
+            if app.config.get('SQLITE_PRODUCTION_MODE'):
+                options['_sqlite_writer_lock'] = app.config.get('SQLITE_BUSY_TIMEOUT', 5000) / 1000
+        # SQLALCHEMY_ENGINE_OPTIONS 中的显式配置在此之后合并，仍然优先
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('_sqlite_pragmas', None)
+        writer_lock_timeout = engine_opts.pop('_sqlite_writer_lock', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            install_sqlite_pragmas(engine, pragmas)
+        if writer_lock_timeout:
+            install_sqlite_writer_lock(engine, writer_lock_timeout)
+        return engine
+
+
+def _engine_stats(engine):
+    pool = engine.pool
+    stats = {
+        'dialect': engine.dialect.name,
+        'pool_class': type(pool).__name__
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout()
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(pool.metrics.to_dict())
+    return stats
+
+
+def get_pool_stats():
+    """
+    获取当前应用所有数据库引擎的连接池状态
+    :return: {绑定名: 统计字典}，主库的绑定名为 'default'
+    """
+    from flask import current_app
+    from app import db
+
+    result = {'default': _engine_stats(db.get_engine(current_app))}
+    for bind in (current_app.config.get('SQLALCHEMY_BINDS') or {}):
+        result[bind] = _engine_stats(db.get_engine(current_app, bind))
+    return result
@@ -0,0 +1,273 @@
+"""
+工作流事件服务（发件箱 + 后台分发器）
+
+步骤流转时在同一事务中向 workflow_events 表写入事件，提交后由分发器异步处理
+（执行自动步骤、发送通知等），审批请求只需记录人工步骤即可返回。
+
+分发器可以在应用进程内以线程运行，也可以通过 `flask events run` 作为独立进程运行。
+事件通过条件更新领取并带租约，多个进程同时运行时同一事件只会被一个进程处理；
+处理进程中断后租约过期，事件会被重新领取。处理失败按指数退避重试，
+超过最大次数后标记为 failed。发送邮件等无法回滚的操作由处理函数通过 after_done()
+登记，在事件标记为 done 并提交后才执行，重试时不会重复发送。
+
+进程内分发线程需要设置 WORKFLOW_EVENT_WORKER_ENABLED=1 启用，并在进程处理第一个请求时
+才启动，命令行工具和脚本创建应用时不会启动；gunicorn --preload 时在 fork 出的 worker 中启动。
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, and_
+from app import db
+from app.models import WorkflowEvent, WorkflowInstance
+
+
+def emit_event(instance_id, event_type, step_id=None, payload=None, collect=None):
+    """
+    写入一条工作流事件，随调用方的事务一起提交
+    :param instance_id: 工作流实例ID
+    :param event_type: 事件类型，如 step.entered, instance.completed
+    :param step_id: 步骤ID
+    :param payload: 附加数据字典
+    :param collect: 收集列表，不为None时只追加字段字典，由调用方批量插入
+    """
+    values = dict(
+        instance_id=instance_id,
+        event_type=event_type,
+        step_id=step_id,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        status='pending',
+        attempts=0,
+        available_at=datetime.utcnow()
+    )
+    if collect is not None:
+        collect.append(values)
+    else:
+        db.session.add(WorkflowEvent(**values))
+
+
+class EventDispatcher:
+    """
+    工作流事件分发器
+
+    WORKFLOW_EVENT_DISPATCH 为 background 时由分发线程或独立进程处理事件，
+    为 inline 时在请求提交后立即处理（测试环境及未部署后台进程时使用）。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.handlers = {}
+        self.stats = {'processed': 0, 'retried': 0, 'failed': 0}
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，后台模式下按配置在处理第一个请求时启动分发线程"""
+        self.app = app
+        if self.mode == 'background' and app.config.get('WORKFLOW_EVENT_WORKER_ENABLED') and not app.testing:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        """请求进入时检查分发线程，fork 后子进程中的线程已不存在，在子进程中重新启动"""
+        if not self.running:
+            with self._start_lock:
+                self.start()
+
+    @property
+    def mode(self):
+        return self.app.config.get('WORKFLOW_EVENT_DISPATCH', 'background') if self.app else 'background'
+
+    def register(self, event_type, handler):
+        """
+        注册事件处理函数
+        :param event_type: 事件类型
+        :param handler: 处理函数，参数为 WorkflowEvent，在事件所在事务中执行，不需要自行提交
+        """
+        self.handlers[event_type] = handler
+
+    def after_done(self, func):
+        """
+        登记在当前事件标记为 done 并提交后执行的操作（例如发送邮件），处理失败回滚时丢弃
+        不在事件处理中调用时立即执行
+        :param func: 无参函数，执行失败只记录日志，不会重新处理事件
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            func()
+        else:
+            pending.append(func)
+
+    def notify(self, instance_id=None):
+        """
+        通知分发器有新事件已提交
+        inline 模式下立即处理该实例的事件，background 模式下唤醒分发线程
+        :param instance_id: 工作流实例ID
+        """
+        if self.mode == 'inline':
+            # 事件已提交，处理失败只记录日志，由重试或后台分发器继续处理
+            try:
+                self.dispatch_pending(instance_id=instance_id)
+            except Exception as e:
+                db.session.rollback()
+                self.logger.exception(f"处理工作流事件失败: {str(e)}")
+        else:
+            self._wakeup.set()
+
+    def _claim(self, instance_id=None):
+        """领取一批到期事件，返回领取成功的事件ID"""
+        config = self.app.config
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=config.get('WORKFLOW_EVENT_LEASE_SECONDS', 60))
+        claimable = or_(
+            and_(WorkflowEvent.status == 'pending', WorkflowEvent.available_at <= now),
+            # 处理进程中断后租约过期的事件
+            and_(WorkflowEvent.status == 'processing', WorkflowEvent.locked_until < now)
+        )
+
+        query = db.session.query(WorkflowEvent.id).filter(claimable)
+        if instance_id is not None:
+            query = query.filter(WorkflowEvent.instance_id == instance_id)
+        candidate_ids = [row.id for row in query.order_by(WorkflowEvent.id)
+                         .limit(config.get('WORKFLOW_EVENT_BATCH_SIZE', 100))]
+
+        claimed = []
+        for event_id in candidate_ids:
+            # 条件更新领取，其他分发进程已领取时影响行数为0
+            updated = WorkflowEvent.query.filter(WorkflowEvent.id == event_id, claimable).update({
+                'status': 'processing',
+                'locked_until': lease_until,
+                'attempts': WorkflowEvent.attempts + 1
+            }, synchronize_session=False)
+            if updated:
+                claimed.append(event_id)
+        db.session.commit()
+        return claimed
+
+    def _process(self, event_id):
+        """在独立事务中处理一个事件，处理结果与事件状态一起提交"""
+        event = WorkflowEvent.query.get(event_id)
+        handler = self.handlers.get(event.event_type)
+        self._local.pending = []
+        try:
+            if handler:
+                handler(event)
+            else:
+                self.logger.warning(f"工作流事件 {event.event_type} 没有处理函数，已忽略")
+            event.status = 'done'
+            event.processed_at = datetime.utcnow()
+            event.last_error = None
+            db.session.commit()
+            self.stats['processed'] += 1
+        except Exception as e:
+            self._local.pending = None
+            db.session.rollback()
+            self.logger.exception(f"处理工作流事件 #{event_id} ({event.event_type}) 失败: {str(e)}")
+            event = WorkflowEvent.query.get(event_id)
+            event.last_error = str(e)
+            event.locked_until = None
+            if event.attempts >= self.app.config.get('WORKFLOW_EVENT_MAX_ATTEMPTS', 5):
+                event.status = 'failed'
+                self.stats['failed'] += 1
+                # 交给恢复任务检查该实例
+                WorkflowInstance.query.filter_by(id=event.instance_id).update(
+                    {'needs_recovery': True, 'updated_at': WorkflowInstance.updated_at}, synchronize_session=False)
+            else:
+                # 指数退避后重试
+                event.status = 'pending'
+                event.available_at = datetime.utcnow() + timedelta(seconds=2 ** event.attempts)
+                self.stats['retried'] += 1
+            db.session.commit()
+            return
+
+        # 事件已提交为 done，执行登记的操作，失败时不再重试以免重复发送
+        pending, self._local.pending = self._local.pending, None
+        for func in pending:
+            try:
+                func()
+            except Exception as e:
+                self.logger.exception(f"工作流事件 #{event_id} ({event.event_type}) 提交后的操作失败: {str(e)}")
+
+    def dispatch_pending(self, instance_id=None):
+        """
+        处理所有到期事件，处理过程中产生的新事件（如连续的自动步骤）也在本次处理
+        :param instance_id: 只处理指定实例的事件
+        :return: 处理的事件数
+        """
+        count = 0
+        while True:
+            event_ids = self._claim(instance_id)
+            if not event_ids:
+                return count
+            for event_id in event_ids:
+                self._process(event_id)
+            count += len(event_ids)
+
+    def run_forever(self):
+        """阻塞运行分发循环，直到调用 stop()"""
+        self.logger.info(f"工作流事件分发器启动，已注册事件: {', '.join(self.handlers) or '无'}")
+        while not self._stop_event.is_set():
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    try:
+                        self.dispatch_pending()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.exception(f"工作流事件分发失败: {str(e)}")
+            # 有新事件提交时立即唤醒，否则按间隔轮询其他进程写入的事件
+            self._wakeup.wait(self.app.config.get('WORKFLOW_EVENT_POLL_INTERVAL', 1))
+
+    def start(self):
+        """以守护线程方式启动分发循环"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='workflow-events', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止分发循环"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """获取分发器状态和各状态事件数"""
+        counts = dict(db.session.query(WorkflowEvent.status, db.func.count(WorkflowEvent.id))
+                      .group_by(WorkflowEvent.status).all())
+        return dict(self.stats, mode=self.mode, running=self.running, events=counts)
+
+
+def purge_processed_events(retention_days=None):
+    """
+    删除超过保留期的已处理事件
+    :param retention_days: 保留天数，默认按 WORKFLOW_EVENT_RETENTION_DAYS 配置
+    :return: 删除的事件数
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('WORKFLOW_EVENT_RETENTION_DAYS', 7)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = WorkflowEvent.query.filter(
+        WorkflowEvent.status == 'done',
+        WorkflowEvent.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# 创建实例
+event_dispatcher = EventDispatcher()
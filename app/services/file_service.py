@@ -7,8 +7,9 @@ from flask import current_app, request
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import FileAttachment, FileOperation, FileSignature, User, WorkflowInstance, WorkflowStep
+from app.services.write_queue import write_queue
+from app.utils.metrics import metrics
 import mimetypes
-from PIL import Image
 import io
 import base64
 import jwt
@@ -121,6 +122,9 @@ def save_uploaded_file(file, instance_id=None, user_id=None):
     db.session.add(operation)
     db.session.commit()
     
+    metrics.inc('file_uploads_total')
+    metrics.inc('file_upload_bytes_total', file_attachment.file_size)
+    
     return file_attachment
 
 def log_file_operation(file_id, user_id, operation_type, instance_id=None, step_id=None, details=None):
@@ -273,8 +277,9 @@ def get_file_for_operation(file_id, user_id, operation_type, instance_id=None):
     if not has_permission:
         raise ValueError(error_msg)
     
-    # 添加操作记录
-    operation = FileOperation(
+    # 添加操作记录（只追加，经写队列写入）
+    write_queue.append(
+        FileOperation,
         operation_type=operation_type,
         file_id=file_id,
         user_id=user_id,
@@ -284,9 +289,6 @@ def get_file_for_operation(file_id, user_id, operation_type, instance_id=None):
         })
     )
     
-    db.session.add(operation)
-    db.session.commit()
-    
     return file
 
 def get_file_viewer_url(file_id, operation='view'):
@@ -1,12 +1,15 @@
 import os
 import sys
+import json
+import hashlib
 import logging
-from flask import current_app
+import tempfile
+import threading
+from flask import current_app, request
 import shutil
 from datetime import datetime
-import requests
-import io
-import zipfile
+from .font_subset_service import font_subsetter, plan_slices, parse_unicode_range
+from .glyph_index import glyph_index, read_codepoints
 
 # 定义系统支持的字体列表
 SYSTEM_FONTS = {
@@ -50,11 +53,68 @@ REQUIRED_FONTS = ['simsun.ttc', 'msyh.ttc', 'arial.ttf', 'symbol.ttf']
 # 常见字体在Windows系统中的位置
 WINDOWS_FONT_PATH = 'C:\\Windows\\Fonts'
 
+# 字体清单文件（位于 instance 目录），记录字体的大小、修改时间、内容哈希和字符覆盖
+MANIFEST_FILE = 'font_manifest.json'
+
+# 字体清单收录的文件类型
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf', '.woff', '.woff2')
+
+# URL 中内容哈希版本号的长度
+VERSION_LENGTH = 12
+
+
+def _file_hash(path):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _font_coverage(cmap):
+    """
+    统计字体的字符覆盖
+    :return: {codepoints: 字符数, latin: 是否覆盖基本拉丁字母, cjk: 是否包含常用汉字}
+    """
+    return {
+        'codepoints': len(cmap),
+        'latin': all(codepoint in cmap for codepoint in range(0x41, 0x5B)),
+        'cjk': any(0x4E00 <= codepoint <= 0x9FFF for codepoint in cmap)
+    }
+
+
+def _write_atomic(path, content):
+    """先写入同目录的临时文件再替换，读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _font_face(name, src, unicode_range=None):
+    """生成一条 @font-face 规则"""
+    lines = ["@font-face {", f"  font-family: '{name}';", f"  src: {src};"]
+    if unicode_range:
+        lines.append(f"  unicode-range: {unicode_range};")
+    lines.extend(["  font-weight: normal;", "  font-style: normal;", "  font-display: swap;", "}", ""])
+    return "\n".join(lines)
+
 # 字体管理类
 class FontManager:
     def __init__(self, app=None):
         self.app = app
         self.logger = logging.getLogger(__name__)
+        self.manifest = None
+        self._lock = threading.Lock()
+        self._coverage_warned = set()  # 已提示过缺字的字体路径，每个进程每个字体只提示一次
         
         if app is not None:
             self.init_app(app)
@@ -62,6 +122,7 @@ class FontManager:
     def init_app(self, app):
         """初始化应用的字体资源"""
         self.app = app
+        self.manifest = None
         font_dir = os.path.join(app.static_folder, 'fonts')
         
         # 确保字体目录存在
@@ -74,13 +135,39 @@ class FontManager:
             return {
                 'get_fonts': self.get_available_fonts,
                 'get_font_url': self.get_font_url,
-                'get_font_categories': self.get_font_categories
+                'get_font_categories': self.get_font_categories,
+                'font_css_url': self.get_css_url
             }
+        
+        # 带内容哈希版本号的静态文件内容不会变化，允许浏览器长期缓存
+        @app.after_request
+        def cache_versioned_static(response):
+            if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = app.config.get('STATIC_VERSIONED_MAX_AGE', 365 * 24 * 60 * 60)
+                response.cache_control.immutable = True
+            return response
+    
+    def get_font_dir(self):
+        """获取应用字体目录"""
+        return os.path.join(self.app.static_folder, 'fonts')
     
     def get_font_url(self, font_file):
-        """获取字体文件的URL"""
+        """获取字体文件的URL，字体在清单中时附带内容哈希版本号"""
+        entry = self.get_manifest()['fonts'].get(font_file)
+        if entry:
+            return f"/static/fonts/{font_file}?v={entry['hash'][:VERSION_LENGTH]}"
         return f'/static/fonts/{font_file}'
     
+    def get_css_url(self):
+        """获取带内容哈希版本号的字体CSS URL"""
+        manifest = self.get_manifest()
+        url = f"/static/{manifest['css']}"
+        if manifest.get('css_hash'):
+            url += f"?v={manifest['css_hash'][:VERSION_LENGTH]}"
+        return url
+    
     def get_system_fonts_path(self):
         """获取系统字体目录"""
         if sys.platform.startswith('win'):
@@ -91,24 +178,18 @@ class FontManager:
             return '/usr/share/fonts'
     
     def get_available_fonts(self):
-        """获取系统中可用的字体列表"""
-        font_dir = os.path.join(self.app.static_folder, 'fonts')
+        """获取系统中可用的字体列表（根据字体清单判断，不逐个检查文件）"""
+        installed = self.get_manifest()['fonts']
         available_fonts = []
         
         for category, fonts in SYSTEM_FONTS.items():
             for font in fonts:
-                font_path = os.path.join(font_dir, font['file'])
-                if os.path.exists(font_path):
-                    font_data = font.copy()
-                    font_data['available'] = True
+                font_data = font.copy()
+                font_data['category'] = category
+                font_data['available'] = font['file'] in installed
+                if font_data['available']:
                     font_data['url'] = self.get_font_url(font['file'])
-                    font_data['category'] = category
-                    available_fonts.append(font_data)
-                else:
-                    font_data = font.copy()
-                    font_data['available'] = False
-                    font_data['category'] = category
-                    available_fonts.append(font_data)
+                available_fonts.append(font_data)
         
         return available_fonts
     
@@ -131,12 +212,11 @@ class FontManager:
     
     def check_required_fonts(self):
         """检查并复制必需的字体"""
-        font_dir = os.path.join(self.app.static_folder, 'fonts')
+        installed = self.get_manifest()['fonts']
         missing_fonts = []
         
         for font_file in REQUIRED_FONTS:
-            font_path = os.path.join(font_dir, font_file)
-            if not os.path.exists(font_path):
+            if font_file not in installed:
                 success = self.copy_font_from_system(font_file)
                 if not success:
                     missing_fonts.append(font_file)
@@ -144,32 +224,31 @@ class FontManager:
         return missing_fonts
     
     def generate_font_css(self):
-        """生成字体CSS文件"""
-        available_fonts = self.get_available_fonts()
-        css_content = ["/* 系统字体定义 */", f"/* 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} */", ""]
+        """重新扫描字体目录，更新字体清单并生成字体CSS文件"""
+        self.refresh_manifest(force=True)
+        return os.path.join(self.app.static_folder, 'css', 'fonts.css')
+    
+    def _build_css(self, installed):
+        """根据已安装的字体生成CSS内容（不含时间戳，内容只随字体变化）"""
+        css_content = ["/* 系统字体定义，由 flask fonts install 生成 */", ""]
         
         # 按类别分组
-        categories = {}
-        for font in available_fonts:
-            if font['available']:
-                category = font['category']
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append(font)
-        
-        # 按类别生成CSS
+        categories = self._group_fonts(installed)
+        use_subsets = font_subsetter.enabled()
+        
+        # 按类别生成CSS，启用子集时每个字体按 unicode-range 分片生成多条规则，浏览器只下载页面用到的分片
         for category, fonts in categories.items():
             css_content.append(f"/* {category.capitalize()} 字体 */")
             
             for font in fonts:
-                css_content.append(f"""@font-face {{
-  font-family: '{font['name']}';
-  src: url('{font['url']}') format('truetype');
-  font-weight: normal;
-  font-style: normal;
-  font-display: swap;
-}}
-""")
+                entry = installed[font['file']]
+                full_src = f"url('/static/fonts/{font['file']}?v={entry['hash'][:VERSION_LENGTH]}') format('truetype')"
+                if not use_subsets or not entry.get('slices'):
+                    css_content.append(_font_face(font['name'], full_src))
+                    continue
+                for slice_name, unicode_range in entry['slices'].items():
+                    subset_src = f"url('{self.get_subset_url(font['file'], entry, slice_name)}') format('woff2')"
+                    css_content.append(_font_face(font['name'], f"{subset_src}, {full_src}", unicode_range))
             css_content.append("")
         
         # 添加便捷字体类
@@ -202,11 +281,7 @@ class FontManager:
         
         # 添加全局字体设置
         css_content.append("\n/* 全局字体设置 */")
-        default_fonts = []
-        if 'chinese' in categories and categories['chinese']:
-            default_fonts.extend([f"'{font['name']}'" for font in categories['chinese'][:2]])
-        if 'english' in categories and categories['english']:
-            default_fonts.extend([f"'{font['name']}'" for font in categories['english'][:1]])
+        default_fonts = [f"'{font['name']}'" for font in self._body_fonts(categories)]
         if not default_fonts:
             default_fonts = ["sans-serif"]
         css_content.append(f"body {{\n  font-family: {', '.join(default_fonts)}, sans-serif;\n}}")
@@ -219,14 +294,213 @@ class FontManager:
         css_content.append("\n/* 代码样式 */")
         css_content.append("pre, code {\n  font-family: Consolas, monospace;\n}")
         
-        # 写入CSS文件
-        css_path = os.path.join(self.app.static_folder, 'css', 'fonts.css')
-        os.makedirs(os.path.dirname(css_path), exist_ok=True)
-        
-        with open(css_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(css_content))
+        return "\n".join(css_content)
+    
+    def _group_fonts(self, installed):
+        """已安装的系统字体按类别分组"""
+        categories = {}
+        for category, fonts in SYSTEM_FONTS.items():
+            for font in fonts:
+                if font['file'] in installed:
+                    categories.setdefault(category, []).append(font.copy())
+        return categories
+    
+    def _body_fonts(self, categories):
+        """正文默认字体: 前两个中文字体和第一个英文字体"""
+        return categories.get('chinese', [])[:2] + categories.get('english', [])[:1]
+    
+    def get_subset_url(self, font_file, entry, name):
+        """获取字体子集的URL，URL中带字体版本号，字体变化后URL随之变化"""
+        return f"/fonts/subset/{font_file}/{entry['hash'][:VERSION_LENGTH]}/{name}.woff2"
+    
+    def get_subset(self, font_file, version, name):
+        """
+        获取字体子集文件，分片子集在首次请求时生成并缓存
+        :param font_file: 字体文件名
+        :param version: URL中的字体版本号，与当前字体不一致时返回None
+        :param name: 分片名
+        :return: 子集文件路径，不存在时返回None
+        """
+        entry = self.get_manifest()['fonts'].get(font_file)
+        if not entry or entry['hash'][:VERSION_LENGTH] != version or not font_subsetter.available():
+            return None
+        slices = entry.get('slices') or {}
+        if name not in slices:
+            return None
+        return font_subsetter.get_subset(os.path.join(self.get_font_dir(), font_file), entry['hash'], name,
+                                         parse_unicode_range(slices[name]))
+    
+    def get_font_paths(self):
+        """已安装字体的路径，按 SYSTEM_FONTS 中的顺序排列（中文字体优先），其余字体按文件名排在后面"""
+        installed = self.get_manifest()['fonts']
+        ordered = [font['file'] for fonts in SYSTEM_FONTS.values() for font in fonts if font['file'] in installed]
+        ordered += sorted(font_file for font_file in installed if font_file not in ordered)
+        return [os.path.join(self.get_font_dir(), font_file) for font_file in ordered]
+    
+    def select_font(self, text, preferred=(), fallback=(), suffixes=None):
+        """
+        根据字形覆盖索引选择能显示文本中所有字符的字体，不加载字体试渲染
+        :param text: 要渲染的文本
+        :param preferred: 优先于应用字体尝试的字体路径
+        :param fallback: 应用字体之后再尝试的字体路径（例如操作系统字体）
+        :param suffixes: 只使用这些扩展名的字体（例如 reportlab 只支持 .ttf/.ttc）
+        :return: 字体路径，没有完全覆盖的字体时返回缺字最少的字体，没有可用字体时返回None
+        """
+        paths = list(preferred) + self.get_font_paths() + list(fallback)
+        if suffixes:
+            paths = [path for path in paths if path.lower().endswith(suffixes)]
+        path, missing = glyph_index.select(text, paths)
+        if missing:
+            # 水印和验证码每次渲染都会选择字体，同一字体只在首次缺字时提示，之后按调试级别记录
+            message = f"没有字体包含文本中的全部字符，使用 {os.path.basename(path)}（缺少 {missing} 个字符）"
+            if path in self._coverage_warned:
+                self.logger.debug(message)
+            else:
+                self._coverage_warned.add(path)
+                self.logger.warning(message + "，同一字体不再重复提示")
+        return path
+    
+    def generate_subsets(self):
+        """
+        预先生成所有字体的分片子集
+        :return: (生成或已缓存的子集数, 错误信息列表)
+        """
+        if not font_subsetter.available():
+            return 0, ['未安装 fontTools 或 brotli，无法生成字体子集']
+        generated = 0
+        errors = []
+        for font_file, entry in self.get_manifest()['fonts'].items():
+            for name in entry.get('slices') or {}:
+                try:
+                    self.get_subset(font_file, entry['hash'][:VERSION_LENGTH], name)
+                    generated += 1
+                except Exception as e:
+                    errors.append(f"生成字体子集失败 {font_file}/{name}: {str(e)}")
+        return generated, errors
+    
+    def install(self):
+        """
+        安装字体资源: 从系统复制必需字体、生成字体CSS，写入字体清单和字形覆盖索引
+        部署时通过 flask fonts install 执行一次，应用启动时不再检查
+        :return: (缺少的必需字体列表, CSS文件路径)
+        """
+        missing_fonts = self.check_required_fonts()
+        css_path = self.generate_font_css()
+        # 预先建立字形覆盖索引，渲染水印和验证码时不再解析字体
+        for path in self.get_font_paths():
+            glyph_index.get_coverage(path, persist=False)
+        glyph_index.save()
+        return missing_fonts, css_path
+    
+    def get_manifest_path(self):
+        """获取字体清单文件路径（位于 instance 目录，写入清单不会改变字体目录的修改时间）"""
+        return os.path.join(self.app.instance_path, MANIFEST_FILE)
+    
+    def load_manifest(self):
+        """
+        读取字体清单，不检查字体文件
+        :return: 清单字典，尚未执行 flask fonts install 时返回None
+        """
+        try:
+            with open(self.get_manifest_path(), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = None
+        return self.manifest
+    
+    def get_manifest(self):
+        """获取字体清单，字体目录有变化时自动刷新"""
+        return self.refresh_manifest()
+    
+    def refresh_manifest(self, force=False):
+        """
+        字体目录的修改时间或子集开关变化时重新扫描，更新字体清单并重写字体CSS
         
-        return css_path
+        未变化时只有一次 stat 调用；重新扫描时只为大小或修改时间变化的字体重新计算哈希和字符覆盖。
+        清单和CSS先写临时文件再原子替换，多个进程同时刷新时不会读到写了一半的文件。
+        :param force: 为True时不比较修改时间，强制重新扫描
+        :return: 清单字典
+        """
+        font_dir = self.get_font_dir()
+        try:
+            dir_mtime = os.stat(font_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        
+        use_subsets = font_subsetter.enabled()
+        manifest = self.manifest
+        if not force and manifest and manifest.get('dir_mtime') == dir_mtime and manifest.get('subsets') == use_subsets:
+            return manifest
+        
+        with self._lock:
+            # 其他线程或进程可能已经完成刷新
+            if not force:
+                manifest = self.load_manifest()
+                if manifest and manifest.get('dir_mtime') == dir_mtime and manifest.get('subsets') == use_subsets:
+                    return manifest
+            
+            previous = manifest or {}
+            installed = self._scan_fonts(font_dir, previous.get('fonts') or {})
+            css = self._build_css(installed)
+            css_hash = hashlib.sha256(css.encode('utf-8')).hexdigest()
+            css_path = os.path.join(self.app.static_folder, 'css', 'fonts.css')
+            if css_hash != previous.get('css_hash') or not os.path.exists(css_path):
+                _write_atomic(css_path, css)
+            
+            manifest = {
+                'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'dir_mtime': dir_mtime,
+                'fonts': installed,
+                'missing_required': [font_file for font_file in REQUIRED_FONTS if font_file not in installed],
+                'css': 'css/fonts.css',
+                'css_hash': css_hash,
+                'subsets': use_subsets
+            }
+            os.makedirs(self.app.instance_path, exist_ok=True)
+            _write_atomic(self.get_manifest_path(), json.dumps(manifest, ensure_ascii=False, indent=2))
+            self.manifest = manifest
+            # 扫描时读取的码位同时写入字形覆盖索引
+            if glyph_index.app is not None:
+                glyph_index.reset_checks()
+                glyph_index.save()
+            # 字体文件变化后旧版本的子集不会再被引用
+            if font_subsetter.app is not None:
+                font_subsetter.purge({entry['hash'] for entry in installed.values()})
+            self.logger.info(f"字体清单已更新: {len(installed)} 个字体")
+            return manifest
+    
+    def _scan_fonts(self, font_dir, previous):
+        """
+        扫描字体目录
+        :param previous: 上一次清单中的字体，大小和修改时间未变的字体直接沿用
+        :return: {文件名: {path, size, mtime, hash, coverage, slices}}
+        """
+        installed = {}
+        try:
+            entries = list(os.scandir(font_dir))
+        except OSError:
+            return installed
+        
+        for entry in entries:
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in FONT_EXTENSIONS:
+                continue
+            stat = entry.stat()
+            old = previous.get(entry.name)
+            if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime_ns and 'slices' in old:
+                installed[entry.name] = old
+                continue
+            cmap = read_codepoints(entry.path)
+            if cmap is not None and glyph_index.app is not None:
+                glyph_index.store(entry.path, stat.st_size, stat.st_mtime_ns, cmap)
+            installed[entry.name] = {
+                'path': f'fonts/{entry.name}',
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': _file_hash(entry.path),
+                'coverage': _font_coverage(cmap) if cmap is not None else None,
+                'slices': plan_slices(cmap) if cmap else {}
+            }
+        return installed
         
     def download_all_fonts(self):
         """下载所有预定义的常用字体
@@ -310,18 +584,11 @@ class FontManager:
             }
         ]
         
-        # 确保目录存在
-        font_dir = os.path.join(self.app.static_folder, 'fonts')
-        os.makedirs(font_dir, exist_ok=True)
-        
-        success_count = 0
-        errors = []
-        
-        for font in OPEN_SOURCE_FONTS:
-            if self.download_font(font):
-                success_count += 1
-            else:
-                errors.append(f"下载失败: {font['name']} ({font['file']})")
+        # 并发下载，镜像目录中有的字体直接复制
+        results = self.get_download_manager().download_all(OPEN_SOURCE_FONTS)
+        success_count = sum(1 for result in results if result['success'])
+        errors = [f"下载失败: {result['name']} ({result['file']}): {result['error']}"
+                  for result in results if not result['success']]
         
         # 如果成功，更新字体CSS
         if success_count > 0:
@@ -336,73 +603,33 @@ class FontManager:
         """获取所有字体分类"""
         return list(SYSTEM_FONTS.keys())
 
+    def get_download_manager(self):
+        """
+        创建字体下载管理器: 下载缓存位于 instance/font_downloads，
+        并发数和本地镜像目录由 FONT_DOWNLOAD_WORKERS、FONT_MIRROR_DIR 配置
+        """
+        # 只有下载字体时才需要，避免应用启动时导入 requests
+        from app.utils.download_manager import DownloadManager
+        
+        return DownloadManager(
+            self.get_font_dir(),
+            os.path.join(self.app.instance_path, 'font_downloads'),
+            mirror_dir=self.app.config.get('FONT_MIRROR_DIR'),
+            workers=self.app.config.get('FONT_DOWNLOAD_WORKERS', 4),
+            logger=self.logger
+        )
+
     def download_font(self, font_info):
-        """从网络下载字体文件
+        """从镜像目录或网络下载字体文件
         
         Args:
-            font_info: 包含字体信息的字典，必须包含name、file字段，可选包含url和category字段
+            font_info: 包含字体信息的字典，必须包含name、file字段，可选包含url、category和sha256字段
             
         Returns:
             bool: 下载是否成功
         """
-        if 'url' not in font_info:
-            self.logger.error(f"缺少下载URL: {font_info.get('name', '未知字体')}")
-            return False
-            
-        font_dir = os.path.join(self.app.static_folder, 'fonts')
-        target_path = os.path.join(font_dir, font_info['file'])
-        
-        # 如果已存在，跳过下载
-        if os.path.exists(target_path):
-            self.logger.info(f"字体已存在，跳过下载: {font_info['name']} ({font_info['file']})")
-            return True
-        
-        self.logger.info(f"正在下载字体: {font_info['name']} ({font_info.get('category', '未分类')})")
-        
-        try:
-            # 获取文件扩展名
-            _, file_ext = os.path.splitext(font_info['url'])
-            
-            # 下载字体文件
-            response = requests.get(font_info['url'], stream=True, timeout=30)
-            response.raise_for_status()  # 确保请求成功
-            
-            # 检查是否为压缩文件
-            if file_ext.lower() in ['.zip']:
-                # 解压缩文件并获取目标字体
-                with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
-                    font_filename = font_info['file']
-                    # 查找压缩包中的字体文件
-                    for file_info in zf.infolist():
-                        if file_info.filename.endswith(('.ttf', '.otf', '.ttc')) and os.path.basename(file_info.filename) == font_filename:
-                            # 发现目标字体
-                            with open(target_path, 'wb') as f:
-                                f.write(zf.read(file_info.filename))
-                            self.logger.info(f"从压缩包中提取并保存字体: {font_filename}")
-                            return True
-                    
-                    # 如果没有直接匹配，尝试找任何相关字体
-                    for file_info in zf.infolist():
-                        if file_info.filename.endswith(('.ttf', '.otf', '.ttc')) and (
-                           font_info['name'].lower() in file_info.filename.lower() or
-                           os.path.splitext(font_filename)[0].lower() in file_info.filename.lower()):
-                            with open(target_path, 'wb') as f:
-                                f.write(zf.read(file_info.filename))
-                            self.logger.info(f"从压缩包中提取并保存字体: {file_info.filename} -> {font_filename}")
-                            return True
-                            
-                    self.logger.error(f"在压缩包中未找到匹配的字体文件: {font_filename}")
-                    return False
-            else:
-                # 直接保存字体文件
-                with open(target_path, 'wb') as f:
-                    f.write(response.content)
-                self.logger.info(f"字体下载并保存成功: {font_info['file']}")
-                return True
-                
-        except Exception as e:
-            self.logger.error(f"下载字体失败 {font_info['name']}: {str(e)}")
-            return False
+        result = self.get_download_manager().download_all([font_info])[0]
+        return result['success']
 
 # 创建实例
 font_manager = FontManager() 
\ No newline at end of file
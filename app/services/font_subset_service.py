@@ -0,0 +1,237 @@
+import os
+import logging
+import tempfile
+import threading
+
+# 子集缓存目录（位于 instance 目录），按字体内容哈希分目录: font_subsets/<sha256>/<分片名>.woff2
+SUBSET_DIR = 'font_subsets'
+
+# 非中文分片，码位按顺序归入第一个包含它的分片
+BASE_SLICES = [
+    ('latin', [(0x0000, 0x00FF), (0x0131, 0x0131), (0x0152, 0x0153), (0x02BB, 0x02BC), (0x02C6, 0x02C6),
+               (0x02DA, 0x02DA), (0x02DC, 0x02DC), (0x2000, 0x206F), (0x20AC, 0x20AC), (0x2122, 0x2122),
+               (0x2212, 0x2212), (0xFEFF, 0xFEFF), (0xFFFD, 0xFFFD)]),
+    ('latin-ext', [(0x0100, 0x024F), (0x1E00, 0x1EFF), (0x2C60, 0x2C7F), (0xA720, 0xA7FF)]),
+    ('greek-cyrillic', [(0x0370, 0x03FF), (0x0400, 0x052F)]),
+    ('symbols', [(0x2070, 0x2BFF)]),
+    ('cjk-symbols', [(0x3000, 0x30FF), (0xFE30, 0xFE4F), (0xFF00, 0xFFEF)]),
+]
+
+# 中文分片: cjk-1 为 GB2312 一级汉字（3755 个常用字），cjk-2 为 GB2312 二级汉字，
+# 其余汉字按码位每 CJK_CHUNK_SIZE 个一片（cjk-ext-00、cjk-ext-01...），不属于任何分片的字符归入 other
+CJK_RANGES = [(0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2FA1F)]
+CJK_CHUNK_SIZE = 4096
+
+_slice_table = None
+_slice_table_lock = threading.Lock()
+
+
+def _gb2312_chars(first_row, last_row):
+    """按 GB2312 区号解码出一段汉字的码位"""
+    codepoints = set()
+    for high in range(first_row, last_row + 1):
+        for low in range(0xA1, 0xFF):
+            try:
+                codepoints.add(ord(bytes([high, low]).decode('gb2312')))
+            except UnicodeDecodeError:
+                continue
+    return codepoints
+
+
+def _get_slice_table():
+    """码位到分片名的映射（中文扩展分片不在表中，按码位计算）"""
+    global _slice_table
+    if _slice_table is None:
+        with _slice_table_lock:
+            if _slice_table is None:
+                table = {}
+                for name, ranges in BASE_SLICES:
+                    for start, end in ranges:
+                        for codepoint in range(start, end + 1):
+                            table.setdefault(codepoint, name)
+                for name, codepoints in (('cjk-1', _gb2312_chars(0xB0, 0xD7)), ('cjk-2', _gb2312_chars(0xD8, 0xF7))):
+                    for codepoint in codepoints:
+                        table.setdefault(codepoint, name)
+                _slice_table = table
+    return _slice_table
+
+
+def slice_of(codepoint):
+    """获取码位所属的分片名"""
+    name = _get_slice_table().get(codepoint)
+    if name:
+        return name
+    for start, end in CJK_RANGES:
+        if start <= codepoint <= end:
+            return f'cjk-ext-{_cjk_offset(codepoint) // CJK_CHUNK_SIZE:02d}'
+    return 'other'
+
+
+def _cjk_offset(codepoint):
+    """码位在所有中文区段拼接后的序号"""
+    offset = 0
+    for start, end in CJK_RANGES:
+        if codepoint <= end:
+            return offset + codepoint - start
+        offset += end - start + 1
+    return offset
+
+
+def _slice_order(name):
+    """分片在CSS中的顺序: 基础分片、常用汉字、扩展汉字、其他"""
+    base = [slice_name for slice_name, _ in BASE_SLICES] + ['cjk-1', 'cjk-2']
+    if name in base:
+        return base.index(name), name
+    return (len(base), name) if name.startswith('cjk-ext-') else (len(base) + 1, name)
+
+
+def format_unicode_range(codepoints):
+    """码位集合转换为 CSS unicode-range 的值，连续码位合并为区间"""
+    parts = []
+    start = previous = None
+    for codepoint in sorted(codepoints):
+        if previous is not None and codepoint == previous + 1:
+            previous = codepoint
+            continue
+        if start is not None:
+            parts.append(f'U+{start:X}' if start == previous else f'U+{start:X}-{previous:X}')
+        start = previous = codepoint
+    if start is not None:
+        parts.append(f'U+{start:X}' if start == previous else f'U+{start:X}-{previous:X}')
+    return ', '.join(parts)
+
+
+def parse_unicode_range(value):
+    """解析 format_unicode_range 生成的 unicode-range 值"""
+    codepoints = set()
+    for part in value.split(','):
+        part = part.strip()[2:]
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        codepoints.update(range(int(start, 16), int(end or start, 16) + 1))
+    return codepoints
+
+
+def plan_slices(cmap):
+    """
+    按字体实际包含的字符划分分片
+    :param cmap: 字体包含的码位集合
+    :return: {分片名: unicode-range}，按CSS中的顺序排列，只包含字体中有字符的分片
+    """
+    slices = {}
+    for codepoint in cmap:
+        slices.setdefault(slice_of(codepoint), []).append(codepoint)
+    return {name: format_unicode_range(slices[name]) for name in sorted(slices, key=_slice_order)}
+
+
+# 字体子集服务
+class FontSubsetter:
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self._available = None
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """初始化子集服务"""
+        self.app = app
+
+    def available(self):
+        """是否可以生成 WOFF2 子集（需要 fontTools 和 brotli）"""
+        if self._available is None:
+            # 只查找模块不导入，fontTools.subset 在生成子集时才导入
+            import importlib.util
+            self._available = all(importlib.util.find_spec(name) is not None for name in ('fontTools', 'brotli'))
+            if not self._available:
+                self.logger.warning("未安装 fontTools 或 brotli，字体CSS将直接引用完整字体文件")
+        return self._available
+
+    def enabled(self):
+        """是否在字体CSS中使用子集"""
+        return bool(self.app and self.app.config.get('FONT_SUBSET_ENABLED', True)) and self.available()
+
+    def get_cache_dir(self):
+        """获取子集缓存目录"""
+        return os.path.join(self.app.instance_path, SUBSET_DIR)
+
+    def get_subset_path(self, font_hash, name):
+        """获取子集缓存文件路径"""
+        return os.path.join(self.get_cache_dir(), font_hash, f'{name}.woff2')
+
+    def get_subset(self, font_path, font_hash, name, codepoints):
+        """
+        获取字体子集，缓存中没有时生成
+        :param font_path: 字体文件路径
+        :param font_hash: 字体内容哈希，作为缓存目录名，字体文件变化后不会用到旧的子集
+        :param name: 分片名
+        :param codepoints: 子集包含的码位
+        :return: 子集文件路径
+        """
+        path = self.get_subset_path(font_hash, name)
+        if os.path.exists(path):
+            return path
+
+        # 同一个子集只生成一次，其他请求等待生成完成；分片数量有限，锁一直保留
+        with self._locks_lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        with lock:
+            if not os.path.exists(path):
+                self._generate(font_path, codepoints, path)
+        return path
+
+    def _generate(self, font_path, codepoints, path):
+        """用 fontTools 生成 WOFF2 子集，先写临时文件再原子替换"""
+        from fontTools import subset
+
+        options = subset.Options()
+        options.flavor = 'woff2'
+        options.font_number = 0
+        options.layout_features = ['*']
+        options.notdef_outline = True
+        options.name_IDs = ['*']
+        options.name_languages = ['*']
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.woff2')
+        os.close(fd)
+        try:
+            font = subset.load_font(font_path, options)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(unicodes=codepoints)
+            subsetter.subset(font)
+            subset.save_font(font, tmp_path, options)
+            font.close()
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.logger.info(f"生成字体子集: {os.path.basename(font_path)} -> {path} ({len(codepoints)} 个字符)")
+
+    def purge(self, keep_hashes):
+        """
+        删除已不在字体清单中的字体的子集
+        :param keep_hashes: 当前字体的内容哈希
+        :return: 删除的目录数
+        """
+        import shutil
+
+        cache_dir = self.get_cache_dir()
+        if not os.path.isdir(cache_dir):
+            return 0
+        removed = 0
+        for entry in os.scandir(cache_dir):
+            if entry.is_dir() and entry.name not in keep_hashes:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+# 创建实例
+font_subsetter = FontSubsetter()
@@ -0,0 +1,207 @@
+import os
+import json
+import zlib
+import base64
+import logging
+import tempfile
+import threading
+
+# 字形覆盖索引文件（位于 instance 目录）
+INDEX_FILE = 'glyph_index.json'
+INDEX_VERSION = 1
+
+
+class CoverageBitmap:
+    """字体包含的码位位图，第 n 位为 1 表示字体中有码位 n 的字形，查询为 O(1)"""
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, bits, count):
+        self.bits = bits
+        self.count = count
+
+    @classmethod
+    def from_codepoints(cls, codepoints):
+        codepoints = list(codepoints)
+        bits = bytearray((max(codepoints) >> 3) + 1 if codepoints else 0)
+        for codepoint in codepoints:
+            bits[codepoint >> 3] |= 1 << (codepoint & 7)
+        return cls(bytes(bits), len(codepoints))
+
+    def __contains__(self, codepoint):
+        index = codepoint >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (codepoint & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def missing(self, text):
+        """文本中字体没有字形的字符数（空白和控制字符不计）"""
+        return sum(1 for char in set(text) if char.isprintable() and not char.isspace() and ord(char) not in self)
+
+    def dump(self):
+        """压缩后的位图，用于写入索引文件"""
+        return base64.b64encode(zlib.compress(self.bits, 9)).decode('ascii')
+
+    @classmethod
+    def load(cls, data, count):
+        return cls(zlib.decompress(base64.b64decode(data)), count)
+
+
+def read_codepoints(path):
+    """用 fontTools 读取字体包含的码位（TTC 取第一个字体），无法解析时返回None"""
+    try:
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        return None
+    try:
+        font = TTFont(path, fontNumber=0, lazy=True)
+        codepoints = set(font.getBestCmap() or {})
+        font.close()
+    except Exception:
+        return None
+    return codepoints
+
+
+# 字形覆盖索引
+class GlyphIndex:
+    """
+    字体字形覆盖索引
+
+    每个字体文件一条记录: 大小、修改时间和压缩的码位位图，持久化在 instance/glyph_index.json，
+    字体只在首次遇到或文件变化时用 fontTools 解析一次。选择字体时逐个检查文本中的字符是否在位图中，
+    不需要加载字体试渲染。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self._fonts = None
+        self._checked = set()
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，索引在第一次使用时加载"""
+        self.app = app
+        self._fonts = None
+        self._checked = set()
+
+    def get_index_path(self):
+        """获取索引文件路径"""
+        return os.path.join(self.app.instance_path, INDEX_FILE)
+
+    def _load(self):
+        """读取索引文件，格式不符时忽略"""
+        fonts = {}
+        try:
+            with open(self.get_index_path(), encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                for path, entry in data['fonts'].items():
+                    fonts[path] = (entry['size'], entry['mtime'], CoverageBitmap.load(entry['bitmap'], entry['count']))
+        except (OSError, ValueError, KeyError, zlib.error):
+            pass
+        return fonts
+
+    def save(self):
+        """写入索引文件，先写临时文件再原子替换"""
+        with self._lock:
+            fonts = dict(self._fonts or {})
+        data = {
+            'version': INDEX_VERSION,
+            'fonts': {path: {'size': size, 'mtime': mtime, 'count': bitmap.count, 'bitmap': bitmap.dump()}
+                      for path, (size, mtime, bitmap) in fonts.items()}
+        }
+        os.makedirs(self.app.instance_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.app.instance_path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.get_index_path())
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _get_fonts(self):
+        if self._fonts is None:
+            with self._lock:
+                if self._fonts is None:
+                    self._fonts = self._load()
+        return self._fonts
+
+    def store(self, path, size, mtime, codepoints):
+        """
+        记录已经读取过码位的字体（扫描字体目录时调用，避免重复解析），需要调用 save 写入文件
+        :return: 码位位图
+        """
+        bitmap = CoverageBitmap.from_codepoints(codepoints)
+        path = os.path.abspath(path)
+        fonts = self._get_fonts()
+        with self._lock:
+            fonts[path] = (size, mtime, bitmap)
+            self._checked.add(path)
+        return bitmap
+
+    def get_coverage(self, path, persist=True):
+        """
+        获取字体的码位位图
+
+        每个进程中每个字体只检查一次大小和修改时间，文件变化或不在索引中时重新解析。
+        :param persist: 重新解析后是否写入索引文件
+        :return: CoverageBitmap（无法解析的字体为空位图），文件不存在时返回None
+        """
+        path = os.path.abspath(path)
+        fonts = self._get_fonts()
+        entry = fonts.get(path)
+        if path in self._checked:
+            return entry[2] if entry else None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 不存在的字体（例如其他操作系统的字体路径）在本进程中不再检查
+            self._checked.add(path)
+            return None
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self._checked.add(path)
+            return entry[2]
+
+        # 无法解析的字体记为空位图，不会每次都重新解析
+        codepoints = read_codepoints(path) or set()
+        bitmap = self.store(path, stat.st_size, stat.st_mtime_ns, codepoints)
+        if persist:
+            try:
+                self.save()
+            except OSError as e:
+                self.logger.warning(f"写入字形覆盖索引失败: {str(e)}")
+        return bitmap
+
+    def reset_checks(self):
+        """字体目录变化后调用，下次使用时重新检查字体文件"""
+        self._checked = set()
+
+    def select(self, text, paths):
+        """
+        按顺序选择第一个包含文本所有字符的字体
+        :param text: 要渲染的文本
+        :param paths: 候选字体路径（按优先级排列）
+        :return: (字体路径, 缺少字形的字符数)；没有完全覆盖的字体时返回缺字最少的字体，没有可用字体时返回 (None, None)
+        """
+        best_path, best_missing = None, None
+        for path in paths:
+            bitmap = self.get_coverage(path)
+            if bitmap is None or not len(bitmap):
+                continue
+            missing = bitmap.missing(text)
+            if missing == 0:
+                return path, 0
+            if best_missing is None or missing < best_missing:
+                best_path, best_missing = path, missing
+        return best_path, best_missing
+
+# 创建实例
+glyph_index = GlyphIndex()
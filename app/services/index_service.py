@@ -0,0 +1,33 @@
+"""
+数据库索引维护服务
+
+模型中通过 __table_args__ 声明的复合索引只会在 db.create_all() 建表时创建，
+已有数据库需要调用 ensure_indexes() 补建。
+"""
+from sqlalchemy import inspect
+from app import db
+
+
+def ensure_indexes(bind=None):
+    """
+    补建模型中声明但数据库中缺失的索引（幂等），可在 db.create_all() 之后调用
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: 本次新建的索引名列表
+    """
+    bind = bind or db.engine
+    inspector = inspect(bind)
+    table_names = set(inspector.get_table_names())
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        # 尚未建表的交给 create_all 处理
+        if table.name not in table_names:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(bind=bind)
+            created.append(index.name)
+
+    return created
@@ -1,12 +1,13 @@
 from app import db
 from app.models import SystemLog, LoginLog, WorkflowLog
+from app.services.write_queue import write_queue
 from flask import current_app, has_request_context, request
 from flask_login import current_user
 import logging
 import json
 from datetime import datetime
 
-def log_system_activity(level, module, message, user_id=None, ip_address=None):
+def log_system_activity(level, module, message, user_id=None, ip_address=None, commit=True):
     """
     记录系统日志
     :param level: 日志级别 (INFO, WARNING, ERROR)
@@ -14,6 +15,7 @@ def log_system_activity(level, module, message, user_id=None, ip_address=None):
     :param message: 日志消息
     :param user_id: 用户ID，如果不提供则尝试从current_user获取
     :param ip_address: IP地址，如果不提供则尝试从request获取
+    :param commit: 是否立即提交；为False时只加入当前会话，随调用方的事务一起提交
     """
     try:
         # 获取用户ID
@@ -24,17 +26,18 @@ def log_system_activity(level, module, message, user_id=None, ip_address=None):
         if ip_address is None and has_request_context():
             ip_address = request.remote_addr
             
-        # 创建系统日志
-        log = SystemLog(
+        values = dict(
             level=level,
             module=module,
             message=message,
             user_id=user_id,
             ip_address=ip_address
         )
-        
-        db.session.add(log)
-        db.session.commit()
+        if commit:
+            # 创建系统日志（SQLite 生产模式下由写队列批量提交）
+            write_queue.append(SystemLog, **values)
+        else:
+            db.session.add(SystemLog(**values))
         
         # 同时使用应用日志记录
         app_logger = current_app.logger
@@ -63,7 +66,8 @@ def log_login_attempt(username, status, ip_address, user_agent, message=None):
         if status == 'success' and current_user.is_authenticated:
             user_id = current_user.id
             
-        log = LoginLog(
+        write_queue.append(
+            LoginLog,
             user_id=user_id,
             username=username,
             status=status,
@@ -71,9 +75,6 @@ def log_login_attempt(username, status, ip_address, user_agent, message=None):
             user_agent=user_agent
         )
         
-        db.session.add(log)
-        db.session.commit()
-        
         # 记录到系统日志
         action = "登录成功" if status == 'success' else "登录失败"
         log_message = f"用户 '{username}' {action}"
@@ -86,7 +87,7 @@ def log_login_attempt(username, status, ip_address, user_agent, message=None):
     except Exception as e:
         current_app.logger.error(f"记录登录日志失败: {str(e)}")
         
-def log_workflow_activity(instance_id, user_id, action, step_id=None, message=None):
+def log_workflow_activity(instance_id, user_id, action, step_id=None, message=None, commit=True):
     """
     记录工作流活动
     :param instance_id: 工作流实例ID
@@ -94,6 +95,7 @@ def log_workflow_activity(instance_id, user_id, action, step_id=None, message=No
     :param action: 操作类型 (create, submit, approve, reject, cancel)
     :param step_id: 步骤ID
     :param message: 附加消息
+    :param commit: 是否立即提交；为False时只加入当前会话，随调用方的事务一起提交
     """
     try:
         log = WorkflowLog(
@@ -105,25 +107,64 @@ def log_workflow_activity(instance_id, user_id, action, step_id=None, message=No
         )
         
         db.session.add(log)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         # 记录到系统日志
-        action_map = {
-            'create': '创建',
-            'submit': '提交',
-            'approve': '批准',
-            'reject': '拒绝',
-            'cancel': '取消'
-        }
-        
-        action_text = action_map.get(action, action)
-        step_text = f" 步骤 '{step_id}'" if step_id else ""
-        log_message = f"工作流实例 #{instance_id}{step_text} 被{action_text}"
-        
-        log_system_activity("INFO", "工作流", log_message, user_id)
+        log_system_activity("INFO", "工作流", _workflow_log_message(instance_id, action, step_id), user_id, commit=commit)
         
     except Exception as e:
         current_app.logger.error(f"记录工作流日志失败: {str(e)}")
+
+def log_workflow_activities(entries):
+    """
+    批量记录工作流活动
+    工作流日志和对应的系统日志各用一次批量插入写入当前会话，随调用方的事务一起提交
+    :param entries: 日志字典列表，键与 log_workflow_activity 的参数相同（instance_id, user_id, action, step_id, message）
+    """
+    if not entries:
+        return
+    
+    ip_address = request.remote_addr if has_request_context() else None
+    
+    db.session.bulk_insert_mappings(WorkflowLog, [
+        dict(
+            instance_id=entry['instance_id'],
+            user_id=entry['user_id'],
+            action=entry['action'],
+            step_id=entry.get('step_id'),
+            message=entry.get('message')
+        )
+        for entry in entries
+    ])
+    db.session.bulk_insert_mappings(SystemLog, [
+        dict(
+            level='INFO',
+            module='工作流',
+            message=_workflow_log_message(entry['instance_id'], entry['action'], entry.get('step_id')),
+            user_id=entry['user_id'],
+            ip_address=ip_address
+        )
+        for entry in entries
+    ])
+    
+    current_app.logger.info(f"[工作流] 批量记录 {len(entries)} 条工作流活动")
+
+def _workflow_log_message(instance_id, action, step_id=None):
+    action_map = {
+        'create': '创建',
+        'submit': '提交',
+        'approve': '批准',
+        'reject': '拒绝',
+        'cancel': '取消',
+        'recover': '恢复',
+        'timeout': '超时拒绝',
+        'escalate': '超时升级'
+    }
+    
+    action_text = action_map.get(action, action)
+    step_text = f" 步骤 '{step_id}'" if step_id else ""
+    return f"工作流实例 #{instance_id}{step_text} 被{action_text}"
         
 class CustomJSONEncoder(json.JSONEncoder):
     """自定义JSON编码器，处理日期时间等特殊类型"""
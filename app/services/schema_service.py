@@ -0,0 +1,136 @@
+"""
+数据库结构升级服务
+
+db.create_all() 只会创建缺失的表，不会修改已有的表。模型新增列后，已有数据库需要调用
+upgrade_schema() 补建缺失的表、列和索引。新增列按模型中的类型和 server_default 执行
+ALTER TABLE ... ADD COLUMN，非空列必须声明 server_default，已有行取该默认值。
+已有的列在模型中改为非空时（例如游标分页使用的时间列），按列的默认值回填其中的 NULL。
+Permission 中新增的权限常量同样补建到 permissions 表中。
+"""
+import logging
+from sqlalchemy import inspect, text, select, func
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_columns(bind=None):
+    """
+    为已有的表补建模型中声明但数据库中缺失的列（幂等）
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: 本次新建的列名列表（表名.列名）
+    """
+    bind = bind or db.engine
+    inspector = inspect(bind)
+    table_names = set(inspector.get_table_names())
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        # 尚未建表的交给 create_all 处理
+        if table.name not in table_names:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise ValueError(f'非空列 {table.name}.{column.name} 没有 server_default，无法添加到已有的表')
+            ddl = CreateColumn(column).compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+            created.append(f'{table.name}.{column.name}')
+            logger.info(f'已添加列: {table.name}.{column.name}')
+
+    return created
+
+
+def backfill_not_null(bind=None):
+    """
+    模型中声明为非空、但已有数据库中仍可为空的列，按列的默认值回填 NULL（幂等）
+    SQLite 不能直接修改列的约束，回填后由模型的默认值保证新写入的行不为空
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: 回填过的列名列表（表名.列名）
+    """
+    bind = bind or db.engine
+    inspector = inspect(bind)
+    table_names = set(inspector.get_table_names())
+    backfilled = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+        nullable = {column['name'] for column in inspector.get_columns(table.name) if column['nullable']}
+        for column in table.columns:
+            if column.nullable or column.primary_key or column.name not in nullable:
+                continue
+            default = column.default
+            if default is None or not (default.is_scalar or default.is_callable):
+                continue
+            value = default.arg(None) if default.is_callable else default.arg
+            with bind.begin() as conn:
+                updated = conn.execute(table.update().where(column.is_(None)).values({column.name: value})).rowcount
+            if updated:
+                backfilled.append(f'{table.name}.{column.name}')
+                logger.info(f'已回填 {table.name}.{column.name} 中的 {updated} 个空值')
+
+    return backfilled
+
+
+def ensure_permissions(bind=None):
+    """
+    为 Permission 中声明但 permissions 表中缺失的权限补建记录（幂等）
+    已拥有全部已有权限的角色（默认的管理员角色）同时获得新增的权限
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: 本次新建的权限名列表
+    """
+    from app.models import Permission, roles_permissions
+
+    bind = bind or db.engine
+    table = Permission.__table__
+    declared = {value: attr for attr, value in vars(Permission).items()
+                if attr.isupper() and isinstance(value, str)}
+
+    with bind.begin() as conn:
+        existing = set(conn.execute(select(table.c.name)).scalars())
+        missing = sorted(name for name in declared if name not in existing)
+        if not missing:
+            return []
+        full_roles = []
+        if existing:
+            full_roles = conn.execute(
+                select(roles_permissions.c.role_id)
+                .group_by(roles_permissions.c.role_id)
+                .having(func.count() >= len(existing))
+            ).scalars().all()
+        conn.execute(table.insert(), [{'name': name, 'description': declared[name]} for name in missing])
+        if full_roles:
+            new_ids = conn.execute(select(table.c.id).where(table.c.name.in_(missing))).scalars().all()
+            conn.execute(roles_permissions.insert(),
+                         [{'role_id': role_id, 'permission_id': permission_id}
+                          for role_id in full_roles for permission_id in new_ids])
+
+    logger.info(f"已添加权限: {', '.join(missing)}")
+    return missing
+
+
+def upgrade_schema(bind=None):
+    """
+    将已有数据库升级到当前模型的结构: 创建缺失的表，补建缺失的列、索引和权限，回填非空列中的空值（幂等）
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: {'tables': 新建的表名, 'columns': 新建的列, 'backfilled': 回填过的列, 'indexes': 新建的索引名,
+              'permissions': 新建的权限名}
+    """
+    from app.services.index_service import ensure_indexes
+
+    bind = bind or db.engine
+    before = set(inspect(bind).get_table_names())
+    # 先补列再建表和索引，新列上的索引（例如 needs_recovery）需要列已存在
+    columns = ensure_columns(bind)
+    backfilled = backfill_not_null(bind)
+    db.metadata.create_all(bind=bind)
+    tables = sorted(set(inspect(bind).get_table_names()) - before)
+    indexes = ensure_indexes(bind)
+    permissions = ensure_permissions(bind)
+    return {'tables': tables, 'columns': columns, 'backfilled': backfilled, 'indexes': indexes,
+            'permissions': permissions}
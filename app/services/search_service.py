@@ -0,0 +1,207 @@
+"""
+日志全文检索服务
+
+根据数据库方言选择全文索引实现：
+- SQLite: FTS5 外部内容表（trigram 分词，支持中文子串检索），由触发器在插入/删除时维护
+- PostgreSQL: pg_trgm 扩展的 GIN 三元组索引，ILIKE 子串查询可以走索引，随写入自动维护
+两种实现都保持与 LIKE 回退一致的子串匹配语义（不区分大小写），不会因分词规则漏掉结果
+- 其他数据库: 回退到 LIKE 查询
+"""
+from app import db
+from app.models import SystemLog, WorkflowLog
+from flask import current_app
+from sqlalchemy import text, func, Integer, Float
+
+# 需要建立全文索引的日志模型
+FULLTEXT_MODELS = [SystemLog, WorkflowLog]
+
+# trigram 分词器要求检索词至少3个字符
+SQLITE_TRIGRAM_MIN_LENGTH = 3
+
+
+# 已确认存在全文索引的表（按数据库URI缓存）
+_index_ready = {}
+
+
+def _fts_table(model):
+    return f'{model.__tablename__}_fts'
+
+
+def _sqlite_ddl(model):
+    table = model.__tablename__
+    fts = _fts_table(model)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"message, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, message) VALUES (new.id, new.message); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, message) VALUES ('delete', old.id, old.message); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF message ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, message) VALUES ('delete', old.id, old.message); "
+        f"INSERT INTO {fts}(rowid, message) VALUES (new.id, new.message); END",
+    ]
+
+
+def _pg_index_name(model):
+    return f'ix_{model.__tablename__}_message_trgm'
+
+
+def _postgresql_ddl(model):
+    table = model.__tablename__
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # 旧版本的 tsvector 索引按词匹配，与子串检索语义不一致，替换为三元组索引
+        f"DROP INDEX IF EXISTS ix_{table}_message_fts",
+        f"CREATE INDEX IF NOT EXISTS {_pg_index_name(model)} ON {table} "
+        f"USING GIN (message gin_trgm_ops)",
+    ]
+
+
+def ensure_fulltext_index(bind=None):
+    """
+    创建日志全文索引（幂等），可在 db.create_all() 之后调用
+    :param bind: 数据库引擎或连接，默认使用 db.engine
+    :return: 已建立索引的表名列表
+    """
+    bind = bind or db.engine
+    dialect = bind.dialect.name
+    created = []
+
+    with bind.begin() as conn:
+        for model in FULLTEXT_MODELS:
+            if dialect == 'sqlite':
+                fts = _fts_table(model)
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                    {'name': fts}
+                ).first() is not None
+                for statement in _sqlite_ddl(model):
+                    conn.execute(text(statement))
+                # 首次创建时为已有数据建立索引
+                if not exists:
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            elif dialect == 'postgresql':
+                for statement in _postgresql_ddl(model):
+                    conn.execute(text(statement))
+            else:
+                continue
+            created.append(model.__tablename__)
+
+    _index_ready.clear()
+    return created
+
+
+def fulltext_available(model):
+    """
+    检查指定模型是否可以使用全文索引
+    :param model: 日志模型类
+    :return: 是否可用
+    """
+    engine = db.engine
+    key = (str(engine.url), model.__tablename__)
+    if key in _index_ready:
+        return _index_ready[key]
+
+    dialect = engine.dialect.name
+    available = False
+    try:
+        if dialect == 'sqlite':
+            available = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {'name': _fts_table(model)}
+            ).first() is not None
+        elif dialect == 'postgresql':
+            available = db.session.execute(
+                text("SELECT 1 FROM pg_indexes WHERE indexname=:name"),
+                {'name': _pg_index_name(model)}
+            ).first() is not None
+    except Exception as e:
+        current_app.logger.warning(f"检查全文索引失败: {str(e)}")
+        available = False
+
+    _index_ready[key] = available
+    return available
+
+
+def _use_fulltext(model, keyword):
+    if not fulltext_available(model):
+        return False
+    if db.engine.dialect.name == 'sqlite' and len(keyword) < SQLITE_TRIGRAM_MIN_LENGTH:
+        return False
+    return True
+
+
+def _sqlite_match_subquery(model, keyword):
+    """返回 (id, score) 子查询，score 越大相关度越高"""
+    fts = _fts_table(model)
+    # 以短语形式检索，避免关键字中的 FTS5 语法字符被解释
+    phrase = '"' + keyword.replace('"', '""') + '"'
+    stmt = text(
+        f"SELECT rowid AS id, -rank AS score FROM {fts} WHERE {fts} MATCH :phrase"
+    ).bindparams(phrase=phrase).columns(id=Integer, score=Float)
+    return stmt.subquery(f'{fts}_match')
+
+
+def _pg_substring_filter(model, keyword):
+    """不区分大小写的子串匹配，转义 LIKE 通配符，由三元组索引加速"""
+    escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return model.message.ilike(f'%{escaped}%', escape='\\')
+
+
+def filter_by_keyword(query, model, keyword):
+    """
+    按关键字过滤日志查询，优先使用全文索引
+    :param query: 日志查询对象
+    :param model: 日志模型类
+    :param keyword: 关键字
+    :return: 过滤后的查询对象
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return query
+
+    if not _use_fulltext(model, keyword):
+        return query.filter(model.message.contains(keyword))
+
+    if db.engine.dialect.name == 'sqlite':
+        matched = _sqlite_match_subquery(model, keyword)
+        return query.join(matched, model.id == matched.c.id)
+
+    return query.filter(_pg_substring_filter(model, keyword))
+
+
+def search_logs(model, keyword, query=None, limit=50):
+    """
+    按相关度检索日志
+    :param model: 日志模型类 (SystemLog 或 WorkflowLog)
+    :param keyword: 检索关键字
+    :param query: 附加过滤条件的基础查询，默认为 model.query
+    :param limit: 返回条数上限
+    :return: [(日志对象, 相关度得分)] 列表，按相关度降序排列
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return []
+
+    query = query if query is not None else model.query
+
+    if not _use_fulltext(model, keyword):
+        # 回退到 LIKE 查询，按时间倒序，得分统一为0
+        logs = query.filter(model.message.contains(keyword))\
+            .order_by(model.created_at.desc()).limit(limit).all()
+        return [(log, 0.0) for log in logs]
+
+    if db.engine.dialect.name == 'sqlite':
+        matched = _sqlite_match_subquery(model, keyword)
+        score = matched.c.score
+        query = query.join(matched, model.id == matched.c.id)
+    else:
+        # word_similarity 衡量关键字与日志中最接近片段的相似度
+        score = func.word_similarity(keyword, model.message)
+        query = query.filter(_pg_substring_filter(model, keyword))
+
+    rows = query.add_columns(score.label('score'))\
+        .order_by(score.desc(), model.id.desc())\
+        .limit(limit).all()
+    return [(log, float(row_score or 0)) for log, row_score in rows]
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+
+# 后台定时任务调度器
+class TaskScheduler:
+    """
+    轻量级后台任务调度器，不依赖外部消息队列。
+
+    可以在应用进程内以守护线程运行（SCHEDULER_ENABLED），
+    也可以通过 `flask scheduler run` 作为独立进程运行。
+    多个 gunicorn worker 时建议只在独立进程中启用，避免任务重复执行。
+    """
+
+    # 调度循环的最小检查间隔（秒）
+    TICK_SECONDS = 1
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，并在启用时启动后台线程"""
+        self.app = app
+        if app.config.get('SCHEDULER_ENABLED') and not app.testing:
+            self.start()
+
+    def register(self, name, func, interval):
+        """
+        注册定时任务
+        :param name: 任务名称，重复注册会覆盖
+        :param func: 任务函数，在应用上下文中无参调用
+        :param interval: 执行间隔（秒），或配置项名称（运行时从配置读取）
+        """
+        with self._lock:
+            self.tasks[name] = {
+                'func': func,
+                'interval': interval,
+                'next_run': 0,
+                'last_run': None,
+                'last_duration': None,
+                'last_error': None,
+                'runs': 0
+            }
+
+    def _resolve_interval(self, interval):
+        if isinstance(interval, str):
+            return float(self.app.config.get(interval) or 0)
+        return float(interval or 0)
+
+    def run_task(self, name):
+        """在应用上下文中立即执行指定任务"""
+        task = self.tasks[name]
+        started = time.time()
+        try:
+            with self.app.app_context():
+                try:
+                    task['func']()
+                    task['last_error'] = None
+                finally:
+                    from app import db
+                    db.session.remove()
+        except Exception as e:
+            task['last_error'] = str(e)
+            self.logger.exception(f"定时任务 {name} 执行失败: {str(e)}")
+        finally:
+            task['runs'] += 1
+            task['last_run'] = datetime.utcnow()
+            task['last_duration'] = time.time() - started
+
+    def run_pending(self):
+        """执行所有到期的任务"""
+        now = time.time()
+        with self._lock:
+            due = [name for name, task in self.tasks.items() if task['next_run'] <= now]
+
+        for name in due:
+            task = self.tasks[name]
+            interval = self._resolve_interval(task['interval'])
+            if interval <= 0:
+                # 间隔为0表示任务已禁用
+                task['next_run'] = now + 60
+                continue
+            self.run_task(name)
+            task['next_run'] = time.time() + interval
+
+    def run_forever(self):
+        """阻塞运行调度循环，直到调用 stop()"""
+        self.logger.info(f"后台任务调度器启动，已注册任务: {', '.join(self.tasks) or '无'}")
+        while not self._stop_event.is_set():
+            self.run_pending()
+            self._stop_event.wait(self.TICK_SECONDS)
+
+    def start(self):
+        """以守护线程方式启动调度循环"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='task-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止调度循环"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """获取任务运行状态"""
+        status = []
+        for name, task in self.tasks.items():
+            status.append({
+                'name': name,
+                'interval': self._resolve_interval(task['interval']) if self.app else None,
+                'runs': task['runs'],
+                'last_run': task['last_run'].isoformat() if task['last_run'] else None,
+                'last_duration': task['last_duration'],
+                'last_error': task['last_error']
+            })
+        return status
+
+# 创建实例
+task_scheduler = TaskScheduler()
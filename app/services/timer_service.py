@@ -0,0 +1,262 @@
+"""
+工作流定时器服务
+
+步骤截止时间、流程超时等定时器持久化在 workflow_timers 表（按 status, due_at 建索引），
+定时器线程只把 WORKFLOW_TIMER_HORIZON 秒内到期的定时器加载到内存中的分层时间轮，
+每个刻度推进一次时间轮，到期的定时器通过条件更新领取后写入 timer.fired 事件，
+由工作流事件分发器执行升级、提醒或自动拒绝。
+
+多个进程同时运行时各自加载近期定时器，同一定时器只会被一个进程领取。
+事件分发为 inline 模式（默认配置）时没有定时器线程，改为在请求开始时和后台任务调度器中
+按 WORKFLOW_TIMER_POLL_INTERVAL 直接从数据库领取到期的定时器。
+"""
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from app import db
+from app.models import WorkflowTimer
+from app.services.event_service import emit_event, event_dispatcher
+from app.utils.timing_wheel import HierarchicalTimingWheel
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp(value):
+    return (value - EPOCH).total_seconds()
+
+
+def schedule_timer(instance_id, timer_type, due_at, step_id=None, payload=None):
+    """
+    写入定时器，随调用方的事务一起提交
+    :param instance_id: 工作流实例ID
+    :param timer_type: 定时器类型（step.deadline, instance.timeout）
+    :param due_at: 到期时间（UTC）
+    :param step_id: 步骤ID
+    :param payload: 附加数据字典
+    """
+    db.session.add(WorkflowTimer(
+        instance_id=instance_id,
+        step_id=step_id,
+        timer_type=timer_type,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        due_at=due_at,
+        status='pending'
+    ))
+
+
+def cancel_timers(instance_id, timer_type=None):
+    """
+    取消实例未到期的定时器，随调用方的事务一起提交
+    已加载到时间轮中的定时器到期时因领取失败而被忽略
+    :param instance_id: 工作流实例ID
+    :param timer_type: 定时器类型，为None时取消全部
+    :return: 取消的定时器数
+    """
+    query = WorkflowTimer.query.filter_by(instance_id=instance_id, status='pending')
+    if timer_type:
+        query = query.filter_by(timer_type=timer_type)
+    return query.update({'status': 'canceled'}, synchronize_session=False)
+
+
+class TimerService:
+    """
+    定时器服务
+
+    后台分发模式下随事件分发线程一起启用（WORKFLOW_EVENT_WORKER_ENABLED，处理第一个请求时启动），
+    也可以通过 `flask events run` 在独立进程中运行；inline 模式下由 poll_due() 在请求中检查到期定时器。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.wheel = None
+        self.stats = {'loaded': 0, 'fired': 0, 'ticks': 0}
+        self._loaded_until = None
+        self._max_id = 0
+        self._next_load = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._next_poll = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        绑定应用，后台模式下按配置在处理第一个请求时启动定时器线程，
+        inline 模式下在请求开始时检查到期定时器
+        """
+        self.app = app
+        mode = app.config.get('WORKFLOW_EVENT_DISPATCH', 'background')
+        if mode == 'background' and app.config.get('WORKFLOW_EVENT_WORKER_ENABLED') and not app.testing:
+            app.before_request(self._ensure_started)
+        elif mode == 'inline':
+            app.before_request(self._poll_before_request)
+
+    def _ensure_started(self):
+        """请求进入时检查定时器线程，fork 后在子进程中重新启动"""
+        if not self.running:
+            with self._start_lock:
+                self.start()
+
+    def _poll_before_request(self):
+        # before_request 的返回值不为 None 时会作为响应返回
+        self.poll_due()
+
+    def _reset(self, now):
+        self.wheel = HierarchicalTimingWheel(tick=self.app.config.get('WORKFLOW_TIMER_TICK', 1),
+                                             start=_timestamp(now))
+        self._loaded_until = None
+        self._max_id = 0
+        self._next_load = 0
+
+    def load(self, now=None):
+        """
+        把近期到期的定时器加载到时间轮
+        依次读取: 新时间窗口内到期的定时器、上次加载后新建且落在已加载窗口内的定时器、
+        超过一个加载周期仍未领取的定时器（兜底）
+        :param now: 当前时间（UTC）
+        :return: 新加载的定时器数
+        """
+        now = now or datetime.utcnow()
+        config = self.app.config
+        if self.wheel is None:
+            self._reset(now)
+
+        horizon = min(config.get('WORKFLOW_TIMER_HORIZON', 3600), self.wheel.capacity * self.wheel.tick)
+        until = now + timedelta(seconds=horizon)
+        grace = timedelta(seconds=config.get('WORKFLOW_TIMER_LOAD_INTERVAL', 30))
+        columns = db.session.query(WorkflowTimer.id, WorkflowTimer.due_at).filter(WorkflowTimer.status == 'pending')
+        max_id = db.session.query(db.func.max(WorkflowTimer.id)).scalar() or 0
+
+        if self._loaded_until is None:
+            rows = columns.filter(WorkflowTimer.due_at < until).all()
+        else:
+            rows = columns.filter(WorkflowTimer.due_at >= self._loaded_until, WorkflowTimer.due_at < until).all()
+            rows += columns.filter(WorkflowTimer.id > self._max_id, WorkflowTimer.due_at < self._loaded_until).all()
+            rows += columns.filter(WorkflowTimer.due_at < now - grace).all()
+
+        loaded = 0
+        for timer_id, due_at in rows:
+            if timer_id not in self.wheel and self.wheel.add(timer_id, _timestamp(due_at)):
+                loaded += 1
+
+        self._loaded_until = until
+        self._max_id = max(self._max_id, max_id)
+        self.stats['loaded'] += loaded
+        return loaded
+
+    def fire(self, timer_ids):
+        """
+        领取到期的定时器并写入 timer.fired 事件
+        :param timer_ids: 定时器ID列表
+        :return: 成功领取的定时器数
+        """
+        now = datetime.utcnow()
+        fired = 0
+        for timer_id in timer_ids:
+            # 条件更新领取，已取消或已被其他进程领取时影响行数为0
+            updated = WorkflowTimer.query.filter_by(id=timer_id, status='pending') \
+                .update({'status': 'fired', 'fired_at': now}, synchronize_session=False)
+            if not updated:
+                continue
+            timer = WorkflowTimer.query.get(timer_id)
+            emit_event(timer.instance_id, 'timer.fired', step_id=timer.step_id,
+                       payload=dict(timer.get_payload(), timer_id=timer.id, timer_type=timer.timer_type))
+            fired += 1
+        db.session.commit()
+
+        if fired:
+            self.stats['fired'] += fired
+            event_dispatcher.notify()
+        return fired
+
+    def fire_due(self, now=None):
+        """
+        直接从数据库领取所有已到期的定时器，不经过时间轮（命令行和 inline 模式使用）
+        :return: 成功领取的定时器数
+        """
+        now = now or datetime.utcnow()
+        timer_ids = [row.id for row in db.session.query(WorkflowTimer.id)
+                     .filter(WorkflowTimer.status == 'pending', WorkflowTimer.due_at <= now)
+                     .order_by(WorkflowTimer.due_at)]
+        return self.fire(timer_ids)
+
+    def poll_due(self):
+        """
+        按 WORKFLOW_TIMER_POLL_INTERVAL 限制频率领取到期的定时器（inline 模式使用）
+        同一时刻只有一个线程检查，其余线程直接返回；失败只记录日志，不影响当前请求
+        :return: 成功领取的定时器数
+        """
+        now = time.monotonic()
+        if now < self._next_poll or not self._poll_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_poll = now + self.app.config.get('WORKFLOW_TIMER_POLL_INTERVAL', 30)
+            return self.fire_due()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.exception(f"检查到期定时器失败: {str(e)}")
+            return 0
+        finally:
+            self._poll_lock.release()
+
+    def tick(self, now=None):
+        """
+        推进时间轮并处理到期的定时器，按加载间隔补充近期定时器
+        :return: 成功领取的定时器数
+        """
+        now = now or datetime.utcnow()
+        if self.wheel is None or _timestamp(now) >= self._next_load:
+            self.load(now)
+            self._next_load = _timestamp(now) + self.app.config.get('WORKFLOW_TIMER_LOAD_INTERVAL', 30)
+        self.stats['ticks'] += 1
+        due = self.wheel.advance(_timestamp(now))
+        return self.fire(due) if due else 0
+
+    def run_forever(self):
+        """阻塞运行定时器循环，直到调用 stop()"""
+        self.logger.info("工作流定时器服务启动")
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    try:
+                        self.tick()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.exception(f"处理工作流定时器失败: {str(e)}")
+            self._stop_event.wait(self.app.config.get('WORKFLOW_TIMER_TICK', 1))
+
+    def start(self):
+        """以守护线程方式启动定时器循环"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='workflow-timers', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定时器循环"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """获取定时器服务状态"""
+        pending = db.session.query(db.func.count(WorkflowTimer.id)) \
+            .filter(WorkflowTimer.status == 'pending').scalar()
+        return dict(self.stats, running=self.running, in_memory=len(self.wheel) if self.wheel else 0,
+                    pending=pending)
+
+# 创建实例
+timer_service = TimerService()
@@ -1,48 +1,75 @@
 import os
 from datetime import datetime
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
 from flask import current_app
 from flask_login import current_user
+from app.utils.metrics import metrics
 
-def get_font(size=24):
-    """获取字体，优先使用系统中文字体"""
-    # 尝试常见的中文字体路径
-    font_paths = [
-        # Windows 常见中文字体
-        "c:/windows/fonts/simhei.ttf",
-        "c:/windows/fonts/msyh.ttc",
-        # Linux 常见中文字体
-        "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
-        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-        # macOS 常见中文字体
-        "/System/Library/Fonts/PingFang.ttc",
-        "/Library/Fonts/Arial Unicode.ttf"
-    ]
-    
-    # 尝试从应用静态资源加载字体
+# 应用字体目录中没有合适字体时尝试的操作系统中文字体
+SYSTEM_FONT_PATHS = [
+    # Windows 常见中文字体
+    "c:/windows/fonts/simhei.ttf",
+    "c:/windows/fonts/msyh.ttc",
+    # Linux 常见中文字体
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    # macOS 常见中文字体
+    "/System/Library/Fonts/PingFang.ttc",
+    "/Library/Fonts/Arial Unicode.ttf"
+]
+
+def select_font_path(text, suffixes=None):
+    """根据字形覆盖索引选择包含水印文本全部字符的字体，优先使用应用字体目录中的字体"""
+    from app.services.font_service import font_manager
     try:
-        font_path = os.path.join(current_app.static_folder, 'fonts', 'msyh.ttf')
-        font_paths.insert(0, font_path)  # 优先使用应用内字体
-    except:
-        pass
+        return font_manager.select_font(text, fallback=SYSTEM_FONT_PATHS, suffixes=suffixes)
+    except Exception as e:
+        current_app.logger.error(f"选择水印字体失败: {str(e)}")
+        return None
+
+def get_font(size=24, text=''):
+    """获取能显示水印文本（中文姓名和英文用户名混排）的字体"""
+    from PIL import ImageFont
     
-    # 尝试加载字体
-    for path in font_paths:
-        if os.path.exists(path):
-            try:
-                return ImageFont.truetype(path, size)
-            except:
-                continue
+    path = select_font_path(text)
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
     
-    # 如果所有尝试都失败，使用默认字体
+    # 没有可用字体时使用默认字体
     return ImageFont.load_default()
 
+def get_pdf_font(text):
+    """
+    为PDF水印注册能显示文本的 TrueType 字体
+    :return: reportlab 字体名，没有可用字体时返回 Helvetica
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    
+    # reportlab 只能嵌入 TrueType 轮廓的字体
+    path = select_font_path(text, suffixes=('.ttf', '.ttc'))
+    if not path:
+        return 'Helvetica'
+    name = 'Watermark-' + os.path.splitext(os.path.basename(path))[0]
+    if name not in pdfmetrics.getRegisteredFontNames():
+        try:
+            pdfmetrics.registerFont(TTFont(name, path, subfontIndex=0))
+        except Exception as e:
+            current_app.logger.error(f"注册PDF水印字体失败 {path}: {str(e)}")
+            return 'Helvetica'
+    return name
+
+@metrics.timed('file_processing_seconds', operation='image_view_watermark')
 def add_viewing_watermark(image_data, file_type='pdf'):
     """
     为在线查看的文件添加水印
     水印内容：用户名+用户真实姓名+服务器时间
     """
+    from PIL import Image, ImageDraw
+    
     # 对于非图片类型的文件（如PDF），需要在应用层面进行处理
     if file_type.lower() not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
         return image_data
@@ -55,15 +82,15 @@ def add_viewing_watermark(image_data, file_type='pdf'):
         watermark = Image.new('RGBA', img.size, (0, 0, 0, 0))
         draw = ImageDraw.Draw(watermark)
         
-        # 获取字体
-        font = get_font(size=int(min(img.width, img.height) / 30))
-        
         # 构建水印内容
         username = current_user.username
         fullname = current_user.full_name or "未知用户"
         server_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         watermark_text = f"{username} {fullname} {server_time}"
         
+        # 获取包含水印文本全部字符的字体
+        font = get_font(size=int(min(img.width, img.height) / 30), text=watermark_text)
+        
         # 在图片上绘制多行水印（斜向排列）
         width, height = img.size
         for i in range(0, width + height, int(min(width, height) / 5)):
@@ -87,11 +114,14 @@ def add_viewing_watermark(image_data, file_type='pdf'):
         current_app.logger.error(f"添加查看水印失败: {str(e)}")
         return image_data  # 出错时返回原始图像
 
+@metrics.timed('file_processing_seconds', operation='image_print_watermark')
 def add_printing_watermark(image_data, file_type='pdf'):
     """
     为在线打印的文件添加水印
     水印内容：克分行在线流程系统+用户名+用户真实姓名+服务器时间
     """
+    from PIL import Image, ImageDraw
+    
     # 对于非图片类型的文件（如PDF），需要在应用层面进行处理
     if file_type.lower() not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
         return image_data
@@ -104,15 +134,15 @@ def add_printing_watermark(image_data, file_type='pdf'):
         watermark = Image.new('RGBA', img.size, (0, 0, 0, 0))
         draw = ImageDraw.Draw(watermark)
         
-        # 获取字体
-        font = get_font(size=int(min(img.width, img.height) / 25))
-        
         # 构建水印内容
         username = current_user.username
         fullname = current_user.full_name or "未知用户"
         server_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         watermark_text = f"克分行在线流程系统 {username} {fullname} {server_time}"
         
+        # 获取包含水印文本全部字符的字体
+        font = get_font(size=int(min(img.width, img.height) / 25), text=watermark_text)
+        
         # 在图片上绘制多行水印（斜向排列）
         width, height = img.size
         for i in range(0, width + height, int(min(width, height) / 4)):
@@ -136,6 +166,7 @@ def add_printing_watermark(image_data, file_type='pdf'):
         current_app.logger.error(f"添加打印水印失败: {str(e)}")
         return image_data  # 出错时返回原始图像
 
+@metrics.timed('file_processing_seconds', operation='pdf_watermark')
 def add_pdf_watermark(pdf_data, watermark_type='view'):
     """
     为PDF文件添加水印
@@ -170,7 +201,7 @@ def add_pdf_watermark(pdf_data, watermark_type='view'):
         c = canvas.Canvas(packet, pagesize=letter)
         
         # 设置水印文本属性
-        c.setFont("Helvetica", 12)
+        c.setFont(get_pdf_font(watermark_text), 12)
         c.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.3)  # 灰色，透明度0.3
         
         # 绘制旋转的水印文本
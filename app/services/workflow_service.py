@@ -1,10 +1,18 @@
 from app import db
-from app.models import WorkflowTemplate, WorkflowInstance, WorkflowApproval, WorkflowLog, User, Role
-from app.services.log_service import log_workflow_activity
+from app.models import WorkflowTemplate, WorkflowInstance, WorkflowApproval, WorkflowLog, WorkflowEvent, WorkflowRecoveryRun, WorkflowToken, User, Role, users_roles
+from app.services.log_service import log_workflow_activity, log_workflow_activities
+from app.services.event_service import emit_event, event_dispatcher
+from app.services.timer_service import schedule_timer, cancel_timers
 from flask import current_app
-from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime, timedelta
 import json
 
+class WorkflowConflictError(ValueError):
+    """工作流实例已被其他请求并发修改"""
+    pass
+
 def get_workflow_definition(workflow_id):
     """
     获取工作流定义
@@ -43,15 +51,18 @@ def create_workflow_instance(workflow_id, title, data, user_id):
     instance.set_data(data)
     
     db.session.add(instance)
-    db.session.commit()
+    # 先刷新以获取实例ID，日志与实例在同一事务中提交
+    db.session.flush()
     
     # 记录日志
     log_workflow_activity(
         instance_id=instance.id,
         user_id=user_id,
         action='create',
-        message='创建工作流实例'
+        message='创建工作流实例',
+        commit=False
     )
+    db.session.commit()
     
     return instance
 
@@ -185,66 +196,13 @@ def get_user_pending_tasks(user_id, page=1, per_page=10):
         return [], 0
 
     # 超级管理员可以看到所有任务
-    if user.is_admin:
-        query = WorkflowInstance.query.filter_by(status='running')
-    else:
-        # 获取用户角色
-        role_ids = [role.id for role in user.roles]
-        
-        # 查询所有运行中的工作流实例
-        instances = WorkflowInstance.query.filter_by(status='running').all()
-        
-        # 存储用户可以处理的实例ID
-        instance_ids = []
-        
-        for instance in instances:
-            workflow = WorkflowTemplate.query.get(instance.workflow_id)
-            if not workflow:
-                continue
-                
-            definition = workflow.get_definition()
-            steps = definition.get('steps', [])
-            
-            # 查找当前步骤
-            current_step = None
-            for step in steps:
-                if step['id'] == instance.current_step:
-                    current_step = step
-                    break
-            
-            if not current_step:
-                continue
-                
-            # 检查步骤类型，只处理需要人工审批的步骤
-            if current_step.get('type') != 'approval':
-                continue
-                
-            # 检查审批人设置
-            approvers = current_step.get('approvers', {})
-            
-            # 检查用户是否在审批人列表中
-            if 'users' in approvers and user_id in approvers['users']:
-                instance_ids.append(instance.id)
-                continue
-                
-            # 检查用户角色是否在审批角色列表中
-            if 'roles' in approvers and any(role_id in approvers['roles'] for role_id in role_ids):
-                instance_ids.append(instance.id)
-                continue
-                
-            # 检查是否为部门主管审批
-            if approvers.get('department_manager') and user.position and 'manager' in user.position.lower():
-                # 获取创建人
-                creator = User.query.get(instance.created_by)
-                if creator and creator.department_obj == user.department_obj:
-                    instance_ids.append(instance.id)
-                    continue
-        
-        # 如果没有待处理任务，直接返回空列表
-        if not instance_ids:
+    query = WorkflowInstance.query.filter_by(status='running')
+    if not user.is_admin:
+        # 按流程定义算出用户可审批的步骤，筛选在数据库中完成，不加载全部运行中的实例
+        condition = _approvable_condition(user)
+        if condition is None:
             return [], 0
-            
-        query = WorkflowInstance.query.filter(WorkflowInstance.id.in_(instance_ids))
+        query = query.filter(condition)
     
     # 计算总数
     total = query.count()
@@ -252,18 +210,33 @@ def get_user_pending_tasks(user_id, page=1, per_page=10):
     # 分页查询
     instances = query.order_by(WorkflowInstance.updated_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
     
+    # 当前页用到的工作流、发起人和活动分支一次加载
+    workflows = {
+        workflow.id: workflow
+        for workflow in WorkflowTemplate.query.filter(
+            WorkflowTemplate.id.in_({instance.workflow_id for instance in instances}))
+    } if instances else {}
+    creator_names = _user_names(User.query.filter(
+        User.id.in_({instance.created_by for instance in instances}))) if instances else {}
+    tokens_by_instance = {}
+    if instances:
+        for token in WorkflowToken.query.filter(
+                WorkflowToken.instance_id.in_([instance.id for instance in instances]),
+                WorkflowToken.status == 'active'):
+            tokens_by_instance.setdefault(token.instance_id, []).append(token)
+    
     # 构建任务列表
     tasks = []
     for instance in instances:
-        workflow = WorkflowTemplate.query.get(instance.workflow_id)
-        creator = User.query.get(instance.created_by)
+        workflow = workflows.get(instance.workflow_id)
         
         task = {
             'instance_id': instance.id,
             'title': instance.title,
             'workflow_name': workflow.name if workflow else '未知工作流',
-            'creator_name': (creator.fullname or creator.username) if creator else '未知用户',
+            'creator_name': creator_names.get(instance.created_by, '未知用户'),
             'current_step': instance.current_step,
+            'active_steps': get_active_steps(instance, tokens_by_instance.get(instance.id, [])),
             'created_at': instance.created_at.isoformat(),
             'updated_at': instance.updated_at.isoformat()
         }
@@ -271,186 +244,737 @@ def get_user_pending_tasks(user_id, page=1, per_page=10):
     
     return tasks, total
 
-def process_workflow_step(instance_id, step_id, action, user_id, comment=None):
+def _approvable_condition(user):
+    """
+    生成"实例当前步骤或任一活动并行分支需要该用户审批"的查询条件
+    只加载有运行中实例的流程模板，按审批人设置（用户、角色、部门主管）算出可审批的步骤，
+    部门主管审批的步骤还要求发起人与用户同部门
+    :param user: 非管理员用户
+    :return: 查询条件，没有可审批的步骤时返回None
+    """
+    role_ids = [role.id for role in user.roles]
+    running_workflows = db.session.query(WorkflowInstance.workflow_id) \
+        .filter(WorkflowInstance.status == 'running').distinct()
+    
+    # 流程ID -> 可直接审批的步骤ID / 作为部门主管可审批的步骤ID
+    direct, managed = {}, {}
+    for workflow in WorkflowTemplate.query.filter(WorkflowTemplate.id.in_(running_workflows)):
+        for step in workflow.get_definition().get('steps', []):
+            if _can_approve(user, step, lambda: role_ids, lambda: None):
+                direct.setdefault(workflow.id, []).append(step['id'])
+            elif step.get('type') == 'approval' and step.get('approvers', {}).get('department_manager') \
+                    and _is_manager(user):
+                managed.setdefault(workflow.id, []).append(step['id'])
+    if not direct and not managed:
+        return None
+    
+    def at_steps(step_column):
+        conditions = [and_(WorkflowInstance.workflow_id == workflow_id, step_column.in_(step_ids))
+                      for workflow_id, step_ids in direct.items()]
+        if managed:
+            same_department = WorkflowInstance.created_by.in_(
+                db.session.query(User.id).filter(User.department_id == user.department_id))
+            conditions.append(and_(same_department, or_(*[
+                and_(WorkflowInstance.workflow_id == workflow_id, step_column.in_(step_ids))
+                for workflow_id, step_ids in managed.items()])))
+        return or_(*conditions)
+    
+    # 并行步骤本身不是审批步骤，当前步骤匹配即为串行步骤；并行区段中按活动分支所在的步骤匹配
+    in_branch = WorkflowToken.query.filter(
+        WorkflowToken.instance_id == WorkflowInstance.id,
+        WorkflowToken.split_step_id == WorkflowInstance.current_step,
+        WorkflowToken.status == 'active',
+        at_steps(WorkflowToken.current_step)
+    ).exists()
+    return or_(at_steps(WorkflowInstance.current_step), in_branch)
+
+def _find_step(definition, step_id):
+    for step in definition.get('steps', []):
+        if step['id'] == step_id:
+            return step
+    return None
+
+def _log_step(log_entries, **entry):
+    # log_entries 为列表时先收集，由调用方批量写入
+    if log_entries is None:
+        log_workflow_activity(commit=False, **entry)
+    else:
+        log_entries.append(entry)
+
+def _active_tokens(instance):
+    """获取实例在并行区段中的活动分支令牌，不在并行区段时返回空列表"""
+    if instance.current_step is None:
+        return []
+    return WorkflowToken.query.filter_by(instance_id=instance.id, split_step_id=instance.current_step,
+                                         status='active').all()
+
+def _active_token(instance, step_id, tokens=None):
+    """
+    获取停在指定步骤的活动分支令牌
+    :param tokens: 预先加载的令牌列表，为None时查询
+    """
+    if tokens is None:
+        tokens = _active_tokens(instance)
+    for token in tokens:
+        if token.status == 'active' and token.split_step_id == instance.current_step and token.current_step == step_id:
+            return token
+    return None
+
+def get_active_steps(instance, tokens=None):
+    """
+    获取实例当前可处理的步骤ID列表
+    串行时为当前步骤；在并行区段中为各活动分支所在的步骤
+    :param instance: 工作流实例
+    :param tokens: 预先加载的令牌列表，为None时查询
+    :return: 步骤ID列表
+    """
+    if tokens is None:
+        tokens = _active_tokens(instance)
+    branch_steps = [token.current_step for token in tokens
+                    if token.status == 'active' and token.split_step_id == instance.current_step]
+    if branch_steps:
+        return branch_steps
+    return [instance.current_step] if instance.current_step is not None else []
+
+def _is_step_active(instance, step_id, tokens=None):
+    return instance.status == 'running' and step_id in get_active_steps(instance, tokens)
+
+def _join_required(join_step, total):
+    """汇聚步骤需要到达的分支数: all 全部（默认）、any 任一、count 指定数量（N-of-M）"""
+    mode = join_step.get('mode', 'all')
+    if mode == 'any':
+        return 1
+    if mode == 'count':
+        return max(1, min(int(join_step.get('count', total)), total))
+    return total
+
+def _reject_instance(instance, tokens=None):
+    """拒绝实例并取消仍在进行的并行分支"""
+    instance.status = 'rejected'
+    for token in _active_tokens(instance) if tokens is None else tokens:
+        if token.status == 'active':
+            token.status = 'canceled'
+
+def cancel_workflow_instance(instance):
+    """
+    取消实例：结束仍在进行的并行分支，取消未触发的截止时间和超时定时器，由调用方提交
+    :param instance: 工作流实例
+    """
+    instance.status = 'cancelled'
+    WorkflowToken.query.filter_by(instance_id=instance.id, status='active') \
+        .update({'status': 'canceled'}, synchronize_session=False)
+    cancel_timers(instance.id)
+
+def _advance_instance(instance, definition, step_id, user_id, log_entries=None, events=None, auto_chain=0,
+                      tokens=None):
+    """
+    完成指定步骤并推进实例，写入对应的工作流事件
+    步骤位于并行分支中时只推进该分支；下一步骤为自动步骤时只进入该步骤，由事件分发器在后台执行
+    :param instance: 工作流实例
+    :param definition: 工作流定义
+    :param step_id: 已完成的步骤ID
+    :param user_id: 操作用户ID
+    :param log_entries: 日志收集列表，为None时直接写入会话
+    :param events: 事件收集列表，为None时直接写入会话
+    :param auto_chain: 已完成步骤在连续自动步骤中的序号，人工步骤为0
+    :param tokens: 预先加载的活动令牌列表，为None时查询
+    :return: 下一个步骤，流程结束时返回None
+    """
+    token = _active_token(instance, step_id, tokens)
+    if token:
+        return _advance_token(instance, definition, token, user_id, log_entries, events, auto_chain)
+    
+    next_step = get_workflow_next_step(definition, step_id, instance.get_data())
+    return _enter_step(instance, definition, next_step, user_id, log_entries, events, auto_chain)
+
+def enter_workflow_step(instance, definition, step, user_id):
+    """
+    让实例进入指定步骤，随调用方的事务一起提交
+    并行步骤为每个分支创建令牌并进入分支的第一个步骤
+    :param instance: 工作流实例
+    :param definition: 工作流定义
+    :param step: 步骤定义，为None时流程结束
+    :param user_id: 操作用户ID
+    :return: 进入的步骤
+    """
+    return _enter_step(instance, definition, step, user_id)
+
+def _enter_step(instance, definition, next_step, user_id, log_entries=None, events=None, auto_chain=0):
+    """
+    让实例进入下一步骤: 普通步骤成为当前步骤，并行步骤为每个分支创建令牌，没有下一步骤时流程结束
+    """
+    # 不在并行区段中的汇聚步骤直接通过
+    while next_step and next_step.get('type') == 'join':
+        next_step = get_workflow_next_step(definition, next_step['id'], instance.get_data())
+    
+    if next_step and next_step.get('type') == 'parallel':
+        branches = next_step.get('branches', [])
+        if not branches:
+            raise ValueError(f"并行步骤 {next_step['id']} 没有定义分支")
+        instance.current_step = next_step['id']
+        for branch_step_id in branches:
+            branch_step = _find_step(definition, branch_step_id)
+            if not branch_step or branch_step.get('type') in ['parallel', 'join']:
+                raise ValueError(f"并行步骤 {next_step['id']} 的分支步骤 {branch_step_id} 无效")
+            db.session.add(WorkflowToken(instance_id=instance.id, split_step_id=next_step['id'],
+                                         branch_step_id=branch_step_id, current_step=branch_step_id))
+            _emit_step_entered(instance, branch_step, user_id, events, auto_chain)
+    elif next_step:
+        instance.current_step = next_step['id']
+        _emit_step_entered(instance, next_step, user_id, events, auto_chain)
+    else:
+        # 流程结束
+        instance.status = 'completed'
+        instance.current_step = None
+        instance.completed_at = datetime.utcnow()
+        _log_step(
+            log_entries,
+            instance_id=instance.id,
+            user_id=user_id,
+            action='complete',
+            message='工作流完成'
+        )
+        emit_event(instance.id, 'instance.completed', collect=events, payload={'user_id': user_id})
+    
+    return next_step
+
+def _emit_step_entered(instance, step, user_id, events, auto_chain):
+    emit_event(instance.id, 'step.entered', step_id=step['id'], collect=events, payload={
+        'user_id': user_id,
+        'auto_chain': auto_chain + 1 if step.get('type') == 'auto' else 0
+    })
+
+def _advance_token(instance, definition, token, user_id, log_entries, events, auto_chain):
+    """
+    推进一个并行分支，分支到达汇聚步骤且满足汇聚条件时取消其余分支并继续主流程
+    同时更新实例以递增版本号，并发完成的分支按乐观锁串行化，保证汇聚条件只被判断一次
+    """
+    instance.updated_at = datetime.utcnow()
+    next_step = get_workflow_next_step(definition, token.current_step, instance.get_data())
+    if not next_step or next_step.get('type') == 'parallel':
+        raise ValueError(f"并行分支步骤 {token.current_step} 之后必须是汇聚步骤或分支内的步骤")
+    
+    token.current_step = next_step['id']
+    if next_step.get('type') != 'join':
+        _emit_step_entered(instance, next_step, user_id, events, auto_chain)
+        return next_step
+    
+    token.status = 'arrived'
+    db.session.flush()
+    tokens = WorkflowToken.query.filter_by(instance_id=instance.id, split_step_id=token.split_step_id) \
+        .filter(WorkflowToken.status.in_(['active', 'arrived'])).all()
+    arrived = sum(1 for t in tokens if t.status == 'arrived')
+    if arrived < _join_required(next_step, len(tokens)):
+        # 等待其他分支
+        return next_step
+    
+    # 满足汇聚条件，取消仍在进行的分支
+    for t in tokens:
+        if t.status == 'active':
+            t.status = 'canceled'
+    _log_step(
+        log_entries,
+        instance_id=instance.id,
+        user_id=user_id,
+        action='join',
+        step_id=next_step['id'],
+        message=f"并行分支汇聚: {arrived}/{len(tokens)} 个分支完成"
+    )
+    instance.current_step = next_step['id']
+    return _enter_step(instance, definition, get_workflow_next_step(definition, next_step['id'], instance.get_data()),
+                       user_id, log_entries, events, auto_chain)
+
+def process_workflow_step(instance_id, step_id, action, user_id, comment=None, commit=True):
     """
     处理工作流步骤
+    审批记录、日志和实例状态在同一个事务中写入，整个处理过程只提交一次。
+    实例更新时比较版本号（乐观锁），不加行锁；版本冲突时重新加载实例重试，
+    重试时发现步骤已被他人处理或多次冲突则抛出 WorkflowConflictError
     :param instance_id: 实例ID
     :param step_id: 步骤ID
     :param action: 操作（approve, reject, auto）
     :param user_id: 用户ID
     :param comment: 评论
+    :param commit: 是否提交事务；为False时由调用方统一提交，出错时不回滚调用方的事务，冲突时不重试
     :return: 处理结果
+    :raises WorkflowConflictError: 并发冲突
     """
+    retries = current_app.config.get('WORKFLOW_CONFLICT_RETRIES', 2) if commit else 0
+    
+    for attempt in range(retries + 1):
+        try:
+            result = _process_workflow_step(instance_id, step_id, action, user_id, comment,
+                                            commit=commit, retrying=attempt > 0)
+        except StaleDataError:
+            if not commit:
+                # 事务由调用方负责，回滚和重试都交给调用方
+                raise WorkflowConflictError(f"工作流实例 {instance_id} 正在被其他用户处理，请刷新后重试")
+            db.session.rollback()
+            current_app.logger.info(f"工作流实例 #{instance_id} 版本冲突，第 {attempt + 1} 次")
+            continue
+        
+        if commit:
+            # 后续的自动步骤和通知由事件分发器处理
+            event_dispatcher.notify(instance_id)
+        return result
+    
+    raise WorkflowConflictError(f"工作流实例 {instance_id} 正在被其他用户处理，请刷新后重试")
+
+def _process_workflow_step(instance_id, step_id, action, user_id, comment=None, commit=True, retrying=False):
     instance = WorkflowInstance.query.get(instance_id)
     if not instance:
         raise ValueError(f"工作流实例ID {instance_id} 不存在")
+    
+    tokens = _active_tokens(instance)
+    
+    # 重试时状态或步骤已变化，说明冲突的请求已处理了该步骤
+    if retrying and not _is_step_active(instance, step_id, tokens):
+        raise WorkflowConflictError(f"工作流实例 {instance_id} 的步骤 {step_id} 已被其他用户处理")
         
     if instance.status != 'running':
         raise ValueError(f"工作流实例状态为 {instance.status}，无法处理步骤")
         
-    if instance.current_step != step_id:
+    if step_id not in get_active_steps(instance, tokens):
         raise ValueError(f"工作流实例当前步骤为 {instance.current_step}，不是 {step_id}")
     
     # 获取工作流定义
-    workflow = WorkflowTemplate.query.get(instance.workflow_id)
-    if not workflow:
-        raise ValueError(f"工作流ID {instance.workflow_id} 不存在")
-        
-    definition = workflow.get_definition()
+    definition = get_workflow_definition(instance.workflow_id)
     
     # 获取当前步骤定义
-    steps = definition.get('steps', [])
-    current_step = None
-    for step in steps:
-        if step['id'] == step_id:
-            current_step = step
-            break
-    
+    current_step = _find_step(definition, step_id)
     if not current_step:
         raise ValueError(f"步骤ID {step_id} 不存在")
     
     # 处理不同类型的步骤
     step_type = current_step.get('type', 'approval')
     
-    # 处理自动步骤
-    if step_type == 'auto' and action == 'auto':
-        # 记录日志
-        log_workflow_activity(
-            instance_id=instance.id,
-            user_id=user_id,
-            action='auto',
-            step_id=step_id,
-            message='自动处理步骤'
-        )
-        
-        # 获取下一步
-        next_step = get_workflow_next_step(definition, step_id, instance.get_data())
+    try:
+        if step_type == 'auto' and action == 'auto':
+            log_workflow_activity(
+                instance_id=instance.id,
+                user_id=user_id,
+                action='auto',
+                step_id=step_id,
+                message='自动处理步骤',
+                commit=False
+            )
+            next_step = _advance_instance(instance, definition, step_id, user_id, tokens=tokens)
         
-        if next_step:
-            # 更新实例状态
-            instance.current_step = next_step['id']
-            db.session.commit()
+        elif step_type == 'approval':
+            # 验证用户是否有权限审批
+            if not can_user_approve_step(instance, user_id, step_id):
+                raise ValueError("无权审批此工作流步骤")
             
-            # 如果下一步也是自动步骤，则递归处理
-            if next_step.get('type') == 'auto':
-                return process_workflow_step(
-                    instance_id=instance.id,
-                    step_id=next_step['id'],
-                    action='auto',
-                    user_id=user_id
-                )
-            
-            return {
-                'instance': instance.to_dict(),
-                'next_step': next_step
-            }
-        else:
-            # 流程结束
-            instance.status = 'completed'
-            instance.current_step = None
-            db.session.commit()
+            # 创建审批记录
+            db.session.add(WorkflowApproval(
+                instance_id=instance.id,
+                step_id=step_id,
+                approver_id=user_id,
+                action=action,
+                comment=comment
+            ))
             
             # 记录日志
+            action_map = {
+                'approve': '批准',
+                'reject': '拒绝'
+            }
             log_workflow_activity(
                 instance_id=instance.id,
                 user_id=user_id,
-                action='complete',
-                message='工作流完成'
+                action=action,
+                step_id=step_id,
+                message=f"{action_map.get(action, action)}步骤 {current_step.get('name', step_id)}",
+                commit=False
             )
             
-            return {
-                'instance': instance.to_dict(),
-                'next_step': None
-            }
+            if action == 'reject':
+                # 拒绝则结束流程，任一并行分支拒绝时整个流程结束
+                _reject_instance(instance, tokens)
+                next_step = None
+                emit_event(instance.id, 'instance.rejected', step_id=step_id, payload={'user_id': user_id})
+            else:
+                next_step = _advance_instance(instance, definition, step_id, user_id, tokens=tokens)
+        
+        else:
+            raise ValueError(f"不支持的步骤类型: {step_type}")
+        
+        if commit:
+            db.session.commit()
+        else:
+            # 立即执行带版本比较的 UPDATE，冲突在这里暴露而不是在调用方提交时
+            db.session.flush()
+    except Exception:
+        # 只回滚本函数负责的事务，commit=False 时由调用方决定
+        if commit:
+            db.session.rollback()
+        raise
     
-    # 处理审批步骤
-    elif step_type == 'approval':
-        # 验证用户是否有权限审批
-        if not can_user_approve_step(instance, user_id):
-            raise ValueError("无权审批此工作流步骤")
+    return {
+        'instance': instance.to_dict(),
+        'next_step': next_step
+    }
+
+def process_workflow_steps_batch(items, user_id):
+    """
+    批量处理工作流审批步骤
+    实例、模板和创建人各用一次查询加载，同一模板的流程定义只解析一次，
+    审批记录和日志批量插入，整批只提交一次；单项校验失败不影响其他项。
+    版本冲突时整批重新加载后重试，已被他人处理的项在结果中标记为 conflict；
+    某一项在修改实例后失败（例如流程定义有误）时整批回滚，跳过该项（标记为 invalid）重新处理
+    :param items: 审批项列表，每项包含 instance_id, step_id, action（approve, reject）, comment
+    :param user_id: 审批人ID
+    :return: 与 items 顺序一致的处理结果列表
+    :raises WorkflowConflictError: 多次重试后仍有并发冲突
+    """
+    max_items = current_app.config.get('WORKFLOW_BATCH_MAX_ITEMS', 200)
+    if len(items) > max_items:
+        raise ValueError(f"单次最多批量处理 {max_items} 项")
+    
+    user = User.query.get(user_id)
+    if not user:
+        raise ValueError(f"用户ID {user_id} 不存在")
+    
+    retries = current_app.config.get('WORKFLOW_CONFLICT_RETRIES', 2)
+    conflicts = 0
+    # 处理中途失败的项（序号 -> 错误信息），整批回滚后跳过这些项重新处理
+    invalid = {}
+    
+    while True:
+        try:
+            results = _process_workflow_steps_batch(items, user, retrying=conflicts > 0, invalid=invalid)
+        except StaleDataError:
+            db.session.rollback()
+            conflicts += 1
+            current_app.logger.info(f"批量审批版本冲突，第 {conflicts} 次")
+            if conflicts > retries:
+                raise WorkflowConflictError("批量审批的工作流实例正在被其他用户处理，请刷新后重试")
+            continue
+        except _BatchItemFailed:
+            continue
         
-        # 创建审批记录
-        approval = WorkflowApproval(
-            instance_id=instance.id,
-            step_id=step_id,
-            user_id=user_id,
-            status=action,
-            comment=comment
-        )
+        event_dispatcher.notify()
+        return results
+
+class _BatchItemFailed(Exception):
+    """批量审批中某一项在修改实例后失败，整批已回滚，需要跳过该项重新处理"""
+    pass
+
+def _coerce_id(value):
+    """把请求中的实例ID转换为整数，无效时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+def _process_workflow_steps_batch(items, user, retrying=False, invalid=None):
+    invalid = invalid if invalid is not None else {}
+    items = [item if isinstance(item, dict) else {} for item in items]
+    
+    instance_ids = {_coerce_id(item.get('instance_id')) for item in items} - {None}
+    instances = {
+        instance.id: instance
+        for instance in WorkflowInstance.query.filter(WorkflowInstance.id.in_(instance_ids))
+    }
+    
+    # 每个模板只解析一次定义，并按步骤ID建立索引
+    workflow_ids = {instance.workflow_id for instance in instances.values()}
+    definitions = {}
+    steps_by_workflow = {}
+    for workflow in WorkflowTemplate.query.filter(WorkflowTemplate.id.in_(workflow_ids)):
+        definitions[workflow.id] = workflow.get_definition()
+        steps_by_workflow[workflow.id] = {step['id']: step for step in definitions[workflow.id].get('steps', [])}
+    
+    # 并行区段中的活动分支一次加载，处理过的实例需要时重新查询
+    tokens_by_instance = {instance_id: [] for instance_id in instances}
+    for token in WorkflowToken.query.filter(WorkflowToken.instance_id.in_(instance_ids),
+                                            WorkflowToken.status == 'active'):
+        tokens_by_instance[token.instance_id].append(token)
+    
+    # 权限检查需要的角色和创建人一次加载
+    role_ids = [role.id for role in user.roles]
+    creators = {}
+    if not user.is_admin and _is_manager(user):
+        creator_ids = {instance.created_by for instance in instances.values()}
+        creators = {creator.id: creator for creator in User.query.filter(User.id.in_(creator_ids))}
+    
+    action_map = {
+        'approve': '批准',
+        'reject': '拒绝'
+    }
+    results = []
+    approvals = []
+    log_entries = []
+    events = []
+    processed = set()
+    
+    for index, item in enumerate(items):
+        step_id = item.get('step_id')
+        action = item.get('action', 'approve')
+        result = {'instance_id': item.get('instance_id'), 'step_id': step_id, 'action': action, 'success': False}
+        results.append(result)
         
-        db.session.add(approval)
-        db.session.commit()
+        instance_id = _coerce_id(item.get('instance_id'))
+        if index in invalid:
+            result.update(error='invalid', message=invalid[index])
+            continue
+        if instance_id is None:
+            result.update(error='invalid', message=f"无效的工作流实例ID: {item.get('instance_id')}")
+            continue
+        if isinstance(step_id, bool) or not isinstance(step_id, (int, str)):
+            result.update(error='invalid', message=f"无效的步骤ID: {step_id}")
+            continue
+        if not isinstance(action, str) or action not in action_map:
+            result.update(error='invalid', message=f"无效的操作类型: {action}")
+            continue
+        result['instance_id'] = instance_id
+        instance = instances.get(instance_id)
+        if not instance:
+            result.update(error='not_found', message=f"工作流实例ID {instance_id} 不存在")
+            continue
+        if (instance_id, step_id) in processed:
+            result.update(error='invalid', message="同一步骤在本批次中重复出现")
+            continue
+        tokens = tokens_by_instance.get(instance_id)
+        if not _is_step_active(instance, step_id, tokens):
+            if retrying:
+                result.update(error='conflict', message=f"工作流实例 {instance_id} 的步骤 {step_id} 已被其他用户处理")
+            elif instance.status != 'running':
+                result.update(error='invalid', message=f"工作流实例状态为 {instance.status}，无法处理步骤")
+            else:
+                result.update(error='invalid', message=f"工作流实例当前步骤为 {instance.current_step}，不是 {step_id}")
+            continue
         
-        # 记录日志
-        action_map = {
-            'approve': '批准',
-            'reject': '拒绝'
-        }
-        log_workflow_activity(
+        step = steps_by_workflow.get(instance.workflow_id, {}).get(step_id)
+        if not step:
+            result.update(error='invalid', message=f"步骤ID {step_id} 不存在")
+            continue
+        if step.get('type', 'approval') != 'approval':
+            result.update(error='invalid', message=f"不支持批量处理的步骤类型: {step.get('type')}")
+            continue
+        if not user.is_admin and not _can_approve(user, step, lambda: role_ids,
+                                                  lambda: creators.get(instance.created_by)):
+            result.update(error='forbidden', message="无权审批此工作流步骤")
+            continue
+        
+        item_logs = [dict(
             instance_id=instance.id,
-            user_id=user_id,
+            user_id=user.id,
             action=action,
             step_id=step_id,
-            message=f"{action_map.get(action, action)}步骤 {current_step.get('name', step_id)}"
-        )
+            message=f"{action_map[action]}步骤 {step.get('name', step_id)}"
+        )]
         
-        # 如果拒绝，则结束流程
         if action == 'reject':
-            instance.status = 'rejected'
-            db.session.commit()
-            
-            return {
-                'instance': instance.to_dict(),
-                'next_step': None
-            }
+            # 拒绝则结束流程
+            _reject_instance(instance, tokens)
+            next_step = None
+            emit_event(instance.id, 'instance.rejected', step_id=step_id, collect=events,
+                       payload={'user_id': user.id})
+        else:
+            try:
+                next_step = _advance_instance(instance, definitions[instance.workflow_id], step_id, user.id,
+                                              item_logs, events, tokens=tokens)
+            except ValueError as e:
+                # 流程定义有误时实例可能已被部分修改，回滚整批后跳过该项重新处理
+                db.session.rollback()
+                invalid[index] = str(e)
+                raise _BatchItemFailed()
         
-        # 获取下一步
-        next_step = get_workflow_next_step(definition, step_id, instance.get_data())
+        processed.add((instance_id, step_id))
+        tokens_by_instance[instance_id] = None
+        approvals.append(dict(
+            instance_id=instance.id,
+            step_id=step_id,
+            approver_id=user.id,
+            action=action,
+            comment=item.get('comment')
+        ))
+        log_entries.extend(item_logs)
+        result.update(success=True, status=instance.status, current_step=instance.current_step,
+                      next_step=next_step, message='工作流步骤处理成功')
+    
+    try:
+        if approvals:
+            db.session.bulk_insert_mappings(WorkflowApproval, approvals)
+            db.session.bulk_insert_mappings(WorkflowEvent, events)
+            log_workflow_activities(log_entries)
+        # 实例状态在提交时按版本号比较后更新
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return results
+
+def handle_step_entered(event):
+    """
+    处理 step.entered 事件：执行自动步骤并推进实例，审批步骤则通知审批人
+    事件重复投递或实例已离开该步骤时直接忽略
+    :param event: 工作流事件
+    """
+    instance = WorkflowInstance.query.get(event.instance_id)
+    if not instance or not _is_step_active(instance, event.step_id):
+        return
+    
+    definition = get_workflow_definition(instance.workflow_id)
+    step = _find_step(definition, event.step_id)
+    if not step:
+        raise ValueError(f"步骤ID {event.step_id} 不存在")
+    
+    payload = event.get_payload()
+    user_id = payload.get('user_id')
+    
+    if step.get('type') == 'auto':
+        auto_chain = payload.get('auto_chain', 1)
+        max_steps = current_app.config.get('MAX_WORKFLOW_STEPS', 20)
+        if auto_chain > max_steps:
+            raise ValueError(f"自动步骤超过 {max_steps} 个，请检查流程定义是否存在循环")
         
-        if next_step:
-            # 更新实例状态
-            instance.current_step = next_step['id']
-            db.session.commit()
-            
-            # 如果下一步是自动步骤，则自动处理
-            if next_step.get('type') == 'auto':
-                return process_workflow_step(
-                    instance_id=instance.id,
-                    step_id=next_step['id'],
-                    action='auto',
-                    user_id=user_id
-                )
-            
-            return {
-                'instance': instance.to_dict(),
-                'next_step': next_step
-            }
-        else:
-            # 流程结束
-            instance.status = 'completed'
-            instance.current_step = None
-            db.session.commit()
-            
-            # 记录日志
-            log_workflow_activity(
-                instance_id=instance.id,
-                user_id=user_id,
-                action='complete',
-                message='工作流完成'
-            )
-            
-            return {
-                'instance': instance.to_dict(),
-                'next_step': None
-            }
+        log_workflow_activity(
+            instance_id=instance.id,
+            user_id=user_id,
+            action='auto',
+            step_id=step['id'],
+            message='自动处理步骤',
+            commit=False
+        )
+        _advance_instance(instance, definition, step['id'], user_id, auto_chain=auto_chain)
+    elif step.get('type', 'approval') == 'approval':
+        # 上一步骤的截止时间不再有效；并行分支各自计时，汇聚时统一取消
+        if instance.current_step == step['id']:
+            cancel_timers(instance.id, 'step.deadline')
+        if step.get('timeout'):
+            schedule_timer(instance.id, 'step.deadline', datetime.utcnow() + timedelta(seconds=step['timeout']),
+                           step_id=step['id'])
+        _notify_users(
+            _step_approvers(instance, step),
+            f"待审批: {instance.title}",
+            f"工作流实例 #{instance.id}「{instance.title}」已进入步骤「{step.get('name', step['id'])}」，请及时审批。"
+        )
+
+def handle_timer_fired(event):
+    """
+    处理 timer.fired 事件
+    步骤截止时间按步骤定义的 on_timeout 处理: remind 再次提醒审批人（默认），
+    escalate 通知 escalate_to 中的用户或角色，reject 自动拒绝；
+    流程超时按 WORKFLOW_INSTANCE_TIMEOUT_ACTION 处理
+    :param event: 工作流事件
+    """
+    instance = WorkflowInstance.query.get(event.instance_id)
+    if not instance or instance.status != 'running':
+        return
+    
+    payload = event.get_payload()
+    if payload.get('timer_type') == 'instance.timeout':
+        action = current_app.config.get('WORKFLOW_INSTANCE_TIMEOUT_ACTION', 'remind')
+        step = None
     else:
-        raise ValueError(f"不支持的步骤类型: {step_type}")
+        # 实例已离开该步骤
+        if not _is_step_active(instance, event.step_id):
+            return
+        step = _find_step(get_workflow_definition(instance.workflow_id), event.step_id)
+        if not step:
+            return
+        action = step.get('on_timeout', 'remind')
+    
+    title = f"审批超时: {instance.title}"
+    step_name = step.get('name', step['id']) if step else instance.current_step
+    
+    if action == 'reject':
+        _reject_instance(instance)
+        log_workflow_activity(
+            instance_id=instance.id,
+            user_id=None,
+            action='timeout',
+            step_id=instance.current_step,
+            message='流程超时，自动拒绝' if step is None else f"步骤 {step_name} 审批超时，自动拒绝",
+            commit=False
+        )
+        emit_event(instance.id, 'instance.rejected', step_id=instance.current_step, payload={'reason': 'timeout'})
+    elif action == 'escalate' and step:
+        log_workflow_activity(
+            instance_id=instance.id,
+            user_id=None,
+            action='escalate',
+            step_id=step['id'],
+            message=f"步骤 {step_name} 审批超时，已升级处理",
+            commit=False
+        )
+        _notify_users(
+            _step_approvers(instance, {'approvers': step.get('escalate_to', {})}),
+            title,
+            f"工作流实例 #{instance.id}「{instance.title}」的步骤「{step_name}」审批超时，请督办处理。"
+        )
+    else:
+        current_step = step or _find_step(get_workflow_definition(instance.workflow_id), instance.current_step)
+        if current_step:
+            _notify_users(
+                _step_approvers(instance, current_step),
+                title,
+                f"工作流实例 #{instance.id}「{instance.title}」的步骤「{step_name}」已超过审批期限，请尽快处理。"
+            )
 
-def can_user_approve_step(instance, user_id):
+def handle_instance_finished(event):
+    """
+    处理 instance.completed / instance.rejected 事件：通知发起人
+    :param event: 工作流事件
+    """
+    instance = WorkflowInstance.query.get(event.instance_id)
+    if not instance:
+        return
+    
+    # 流程结束后不再需要的截止时间和超时定时器
+    cancel_timers(instance.id)
+    if not instance.creator:
+        return
+    
+    result_text = '已完成' if event.event_type == 'instance.completed' else '已被拒绝'
+    _notify_users(
+        [instance.creator],
+        f"流程{result_text}: {instance.title}",
+        f"您发起的工作流实例 #{instance.id}「{instance.title}」{result_text}。"
+    )
+
+def _step_approvers(instance, step):
+    """获取审批步骤中指定的审批用户和审批角色下的用户"""
+    approvers = step.get('approvers', {})
+    conditions = []
+    if approvers.get('users'):
+        conditions.append(User.id.in_(approvers['users']))
+    if approvers.get('roles'):
+        conditions.append(User.roles.any(Role.id.in_(approvers['roles'])))
+    if not conditions:
+        return []
+    return User.query.filter(db.or_(*conditions)).all()
+
+def _notify_users(users, subject, body):
+    """
+    发送工作流通知，未配置邮件服务器时只记录日志；在事件处理中调用时，事件提交后才发送
+    :param users: 接收用户列表
+    :param subject: 标题
+    :param body: 正文
+    """
+    recipients = [user.email for user in users if user.email]
+    current_app.logger.info(f"[工作流通知] {subject} -> {', '.join(recipients) or '无接收人'}")
+    if not recipients or not current_app.config.get('MAIL_SERVER'):
+        return
+    
+    from flask_mail import Message
+    from app import mail
+    # 事件提交后才发送，事件处理失败重试时不会重复发送
+    message = Message(subject, recipients=recipients, body=body)
+    event_dispatcher.after_done(lambda: mail.send(message))
+
+def can_user_approve_step(instance, user_id, step_id=None):
     """
     检查用户是否有权限审批步骤
     :param instance: 工作流实例
     :param user_id: 用户ID
+    :param step_id: 步骤ID，默认为实例当前步骤；并行区段中为分支所在的步骤
     :return: 是否有权限
     """
     # 超级管理员始终有权限
@@ -466,110 +990,315 @@ def can_user_approve_step(instance, user_id):
     if not workflow:
         return False
         
-    definition = workflow.get_definition()
-    
     # 获取当前步骤定义
-    steps = definition.get('steps', [])
-    current_step = None
-    for step in steps:
-        if step['id'] == instance.current_step:
-            current_step = step
-            break
+    current_step = _find_step(workflow.get_definition(), instance.current_step if step_id is None else step_id)
     
-    if not current_step:
+    return _can_approve(user, current_step, lambda: [role.id for role in user.roles],
+                        lambda: User.query.get(instance.created_by))
+
+def _can_approve(user, step, get_role_ids, get_creator):
+    """
+    按步骤的审批人设置检查用户权限
+    :param user: 用户
+    :param step: 当前步骤定义
+    :param get_role_ids: 返回用户角色ID列表的函数，只在需要时调用
+    :param get_creator: 返回实例创建人的函数，只在需要时调用
+    :return: 是否有权限
+    """
+    if not step:
         return False
     
     # 检查步骤类型，只有审批步骤才需要检查权限
-    if current_step.get('type') != 'approval':
+    if step.get('type') != 'approval':
         return False
     
     # 检查审批人设置
-    approvers = current_step.get('approvers', {})
+    approvers = step.get('approvers', {})
     
     # 检查用户是否在审批人列表中
-    if 'users' in approvers and user_id in approvers['users']:
+    if 'users' in approvers and user.id in approvers['users']:
         return True
     
     # 检查用户角色是否在审批角色列表中
     if 'roles' in approvers:
-        role_ids = [role.id for role in user.roles]
-        if any(role_id in approvers['roles'] for role_id in role_ids):
+        if any(role_id in approvers['roles'] for role_id in get_role_ids()):
             return True
     
     # 检查是否为部门主管审批
-    if approvers.get('department_manager') and user.position and 'manager' in user.position.lower():
-        # 获取创建人
-        creator = User.query.get(instance.created_by)
-        if creator and creator.department_obj == user.department_obj:
+    if approvers.get('department_manager') and _is_manager(user):
+        creator = get_creator()
+        if creator and creator.department_id == user.department_id:
             return True
     
     return False
 
-def get_workflow_history(instance_id):
+def _is_manager(user):
+    return bool(user.position and 'manager' in user.position.lower())
+
+def get_workflow_history(instance_id, user_names=None):
     """
     获取工作流历史
     :param instance_id: 实例ID
+    :param user_names: 用户ID到显示名称的映射，为None时一次查询日志中的用户
     :return: 历史记录列表
     """
     logs = WorkflowLog.query.filter_by(instance_id=instance_id).order_by(WorkflowLog.created_at).all()
+    if user_names is None:
+        user_names = _user_names(User.query.filter(User.id.in_({log.user_id for log in logs})))
     
-    history = []
-    for log in logs:
-        user = User.query.get(log.user_id)
-        username = (user.fullname or user.username) if user else '系统'
-        
-        history.append({
-            'id': log.id,
-            'user_id': log.user_id,
-            'username': username,
-            'action': log.action,
-            'step_id': log.step_id,
-            'message': log.message,
-            'created_at': log.created_at.isoformat()
-        })
+    return [_history_entry(log, user_names) for log in logs]
+
+def _history_entry(log, user_names):
+    return {
+        'id': log.id,
+        'user_id': log.user_id,
+        'username': user_names.get(log.user_id, '系统'),
+        'action': log.action,
+        'step_id': log.step_id,
+        'message': log.message,
+        'created_at': log.created_at.isoformat()
+    }
+
+def get_instance_detail(instance, compact=False):
+    """
+    获取工作流实例详情（实例、流程模板、审批记录和历史）
+    审批人、日志用户、发起人和模板创建人一次查询加载，各部分共用同一个用户映射，
+    查询次数与审批和日志条数无关
+    :param instance: 工作流实例
+    :param compact: 精简模式，只返回用户名称，不内嵌用户详情
+    :return: 详情字典
+    """
+    template = WorkflowTemplate.query.get(instance.workflow_id)
+    approvals = WorkflowApproval.query.filter_by(instance_id=instance.id) \
+        .order_by(WorkflowApproval.created_at).all()
+    logs = WorkflowLog.query.filter_by(instance_id=instance.id).order_by(WorkflowLog.created_at).all()
+    
+    user_ids = {instance.created_by, template.created_by if template else None}
+    user_ids.update(approval.approver_id for approval in approvals)
+    user_ids.update(log.user_id for log in logs)
+    user_ids.discard(None)
+    # 加载后关系属性（creator、approver）直接从会话的标识映射中取得，不再查询
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    user_names = _user_names(users.values())
     
-    return history
+    user_dicts = {}
+    if not compact:
+        role_names = {user_id: [] for user_id in users}
+        if users:
+            for user_id, role_name in db.session.query(users_roles.c.user_id, Role.name) \
+                    .join(Role, Role.id == users_roles.c.role_id) \
+                    .filter(users_roles.c.user_id.in_(users.keys())):
+                role_names[user_id].append(role_name)
+        user_dicts = {user_id: user.to_dict(role_names[user_id]) for user_id, user in users.items()}
+    
+    instance_data = instance.to_dict()
+    instance_data['active_steps'] = get_active_steps(instance)
+    
+    approvals_data = []
+    for approval in approvals:
+        approval_data = approval.to_dict()
+        approval_data['approver_name'] = user_names.get(approval.approver_id)
+        approvals_data.append(approval_data)
+    
+    history = [_history_entry(log, user_names) for log in logs]
+    
+    if not compact:
+        instance_data['creator'] = user_dicts.get(instance.created_by)
+        for approval_data in approvals_data:
+            approval_data['approver'] = user_dicts.get(approval_data['approver_id'])
+        for entry in history:
+            entry['user'] = user_dicts.get(entry['user_id'])
+    
+    return {
+        'instance': instance_data,
+        'workflow': template.to_dict() if template else None,
+        'approvals': approvals_data,
+        'history': history
+    }
 
-def recover_workflows():
+def _user_names(users):
+    """用户ID到显示名称（姓名，未设置时为用户名）的映射"""
+    return {user.id: user.full_name or user.username for user in users}
+
+def mark_instances_for_recovery(instance_ids=None):
     """
-    恢复异常终止的工作流
-    :return: 恢复的工作流实例数
+    标记需要恢复检查的运行中实例
+    :param instance_ids: 实例ID列表，为None时标记所有运行中的实例（升级后首次全面检查使用）
+    :return: 标记的实例数
     """
-    try:
-        # 查找所有运行中但超时的工作流实例
-        timeout = current_app.config.get('WORKFLOW_INSTANCE_TIMEOUT', 24 * 60 * 60)  # 默认24小时
-        instances = WorkflowInstance.query.filter_by(status='running').all()
-        
-        recovered_count = 0
+    query = WorkflowInstance.query.filter(WorkflowInstance.status == 'running')
+    if instance_ids is not None:
+        query = query.filter(WorkflowInstance.id.in_(instance_ids))
+    # 保持 updated_at 不变，恢复时据此判断审批是否晚于实例最后一次更新
+    count = query.update({'needs_recovery': True, 'updated_at': WorkflowInstance.updated_at},
+                         synchronize_session=False)
+    db.session.commit()
+    return count
+
+def recover_workflows(max_batches=None):
+    """
+    增量恢复被标记的工作流实例
+    只检查 needs_recovery 标记的实例，按ID顺序分批处理，每批提交时记录检查点；
+    达到批次上限后下次调用从检查点继续，全部检查完后本轮恢复任务结束
+    :param max_batches: 本次最多处理的批数，默认按 WORKFLOW_RECOVERY_MAX_BATCHES 配置
+    :return: 本次处理数量和恢复进度
+    """
+    config = current_app.config
+    batch_size = config.get('WORKFLOW_RECOVERY_BATCH_SIZE', 100)
+    if max_batches is None:
+        max_batches = config.get('WORKFLOW_RECOVERY_MAX_BATCHES', 10)
+    
+    result = {'examined': 0, 'recovered': 0, 'failed': 0}
+    marked = WorkflowInstance.query.filter(WorkflowInstance.needs_recovery.is_(True))
+    
+    run = WorkflowRecoveryRun.query.filter_by(status='running').order_by(WorkflowRecoveryRun.id.desc()).first()
+    if not run:
+        if not marked.with_entities(WorkflowInstance.id).first():
+            return dict(result, **get_recovery_status())
+        run = WorkflowRecoveryRun()
+        db.session.add(run)
+        db.session.commit()
+    
+    for _ in range(max_batches):
+        instances = marked.filter(WorkflowInstance.id > run.checkpoint_id) \
+            .order_by(WorkflowInstance.id).limit(batch_size).all()
+        if not instances:
+            run.status = 'completed'
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+            break
         
-        for instance in instances:
-            # 尝试恢复工作流
-            try:
-                # 检查是否有审批记录但未更新状态
-                approvals = WorkflowApproval.query.filter_by(instance_id=instance.id, step_id=instance.current_step).all()
-                
-                if approvals:
-                    # 获取最新的审批记录
-                    latest_approval = max(approvals, key=lambda a: a.created_at)
-                    
-                    # 如果已审批但未更新状态，则尝试更新
-                    if latest_approval.status in ['approve', 'reject']:
-                        process_workflow_step(
-                            instance_id=instance.id,
-                            step_id=instance.current_step,
-                            action=latest_approval.status,
-                            user_id=latest_approval.user_id,
-                            comment=f"自动恢复: {latest_approval.comment}" if latest_approval.comment else "自动恢复"
-                        )
-                        recovered_count += 1
-            except Exception as e:
-                current_app.logger.error(f"恢复工作流实例 #{instance.instance_id} 失败: {str(e)}")
+        try:
+            recovered, failed, error = _recover_batch(instances)
+            run.checkpoint_id = instances[-1].id
+            run.examined += len(instances)
+            run.recovered += recovered
+            run.failed += failed
+            if error:
+                run.last_error = error
+            # 恢复结果与检查点一起提交
+            db.session.commit()
+        except StaleDataError:
+            # 实例在检查期间被其他请求更新，重新加载本批
+            db.session.rollback()
+            continue
         
-        return recovered_count
+        result['examined'] += len(instances)
+        result['recovered'] += recovered
+        result['failed'] += failed
+    
+    if result['recovered']:
+        event_dispatcher.notify()
+    current_app.logger.info(f"工作流恢复: 检查 {result['examined']} 个实例，恢复 {result['recovered']} 个，"
+                            f"失败 {result['failed']} 个")
+    return dict(result, **get_recovery_status())
+
+def _recover_batch(instances):
+    """
+    检查并恢复一批实例，审批记录、待处理事件和流程定义按批加载
+    :return: (恢复数, 失败数, 最后一个错误)
+    """
+    instance_ids = [instance.id for instance in instances]
+    
+    latest_approvals = {}
+    for approval in WorkflowApproval.query.filter(WorkflowApproval.instance_id.in_(instance_ids)) \
+            .order_by(WorkflowApproval.created_at):
+        latest_approvals[(approval.instance_id, approval.step_id)] = approval
+    
+    open_events = set(
+        db.session.query(WorkflowEvent.instance_id, WorkflowEvent.step_id)
+        .filter(WorkflowEvent.instance_id.in_(instance_ids),
+                WorkflowEvent.status.in_(['pending', 'processing']))
+    )
+    
+    definitions = {
+        workflow.id: workflow.get_definition()
+        for workflow in WorkflowTemplate.query.filter(
+            WorkflowTemplate.id.in_({instance.workflow_id for instance in instances}))
+    }
+    
+    tokens_by_instance = {instance_id: [] for instance_id in instance_ids}
+    for token in WorkflowToken.query.filter(WorkflowToken.instance_id.in_(instance_ids),
+                                            WorkflowToken.status == 'active'):
+        tokens_by_instance[token.instance_id].append(token)
     
-    except Exception as e:
-        current_app.logger.error(f"恢复工作流失败: {str(e)}")
-        return 0
+    recovered = failed = 0
+    error = None
+    for instance in instances:
+        try:
+            # 并行区段中逐个检查活动分支所在的步骤
+            for step_id in get_active_steps(instance, tokens_by_instance[instance.id]):
+                if instance.status == 'running' and _recover_instance(
+                        instance,
+                        definitions.get(instance.workflow_id),
+                        step_id,
+                        latest_approvals.get((instance.id, step_id)),
+                        (instance.id, step_id) in open_events):
+                    recovered += 1
+            instance.needs_recovery = False
+        except ValueError as e:
+            # 保留标记，下一轮恢复任务再检查
+            failed += 1
+            error = f"工作流实例 #{instance.id}: {str(e)}"
+            current_app.logger.error(f"恢复工作流实例 #{instance.id} 失败: {str(e)}")
+    
+    return recovered, failed, error
+
+def _recover_instance(instance, definition, step_id, approval, has_open_event):
+    """
+    恢复单个实例
+    :param instance: 运行中的工作流实例
+    :param definition: 工作流定义
+    :param step_id: 要检查的步骤ID（当前步骤或并行分支所在的步骤）
+    :param approval: 该步骤最新的审批记录
+    :param has_open_event: 当前步骤是否有待处理的事件
+    :return: 是否进行了恢复
+    """
+    if definition is None:
+        raise ValueError(f"工作流ID {instance.workflow_id} 不存在")
+    
+    step = _find_step(definition, step_id)
+    if not step:
+        raise ValueError(f"步骤ID {step_id} 不存在")
+    
+    # 已审批但实例状态未推进（审批晚于实例最后一次更新）
+    if approval and approval.action in ['approve', 'reject'] and \
+            (instance.updated_at is None or approval.created_at > instance.updated_at):
+        log_workflow_activity(
+            instance_id=instance.id,
+            user_id=approval.approver_id,
+            action='recover',
+            step_id=step['id'],
+            message=f"自动恢复: 按审批记录#{approval.id}推进流程",
+            commit=False
+        )
+        if approval.action == 'reject':
+            _reject_instance(instance)
+            emit_event(instance.id, 'instance.rejected', step_id=step['id'], payload={'user_id': approval.approver_id})
+        else:
+            _advance_instance(instance, definition, step['id'], approval.approver_id)
+        return True
+    
+    # 停在自动步骤但没有待处理事件（事件处理失败或升级前的数据），重新写入事件
+    if step.get('type') == 'auto' and not has_open_event:
+        emit_event(instance.id, 'step.entered', step_id=step['id'],
+                   payload={'user_id': instance.created_by, 'auto_chain': 1})
+        return True
+    
+    return False
+
+def get_recovery_status():
+    """
+    获取恢复进度
+    :return: 最近一次恢复任务和待检查的实例数
+    """
+    run = WorkflowRecoveryRun.query.order_by(WorkflowRecoveryRun.id.desc()).first()
+    pending = db.session.query(db.func.count(WorkflowInstance.id)) \
+        .filter(WorkflowInstance.needs_recovery.is_(True)).scalar()
+    return {
+        'run': run.to_dict() if run else None,
+        'pending': pending
+    }
 
 def get_current_step_id(instance_id):
     """
@@ -0,0 +1,160 @@
+"""
+单写入线程的追加写队列（组提交）
+
+系统日志、登录日志、文件查看记录等只追加、不回读的写入，在 SQLite 生产模式下
+不再由请求线程各自提交，而是放入队列，由唯一的写入线程批量插入，
+多条记录合并为一次事务提交，减少写锁争用和 fsync 次数。
+
+未启用时 append() 直接写入当前会话并提交，行为与原来一致。
+"""
+import queue
+import atexit
+import logging
+import threading
+import time
+from app import db
+
+
+class WriteQueue:
+    """
+    追加写队列
+
+    启用条件: 数据库为 SQLite 且开启 SQLITE_PRODUCTION_MODE（或显式设置 WRITE_QUEUE_ENABLED），
+    测试环境下始终同步写入。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.enabled = False
+        self.batch_size = 200
+        self.flush_interval = 0.05
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.stats = {'batches': 0, 'rows': 0, 'failed': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，按配置决定是否启用写入线程"""
+        self.app = app
+        enabled = app.config.get('WRITE_QUEUE_ENABLED')
+        if enabled is None:
+            enabled = app.config.get('SQLITE_PRODUCTION_MODE') and \
+                app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+        self.enabled = bool(enabled) and not app.testing
+        self.batch_size = app.config.get('WRITE_QUEUE_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('WRITE_QUEUE_FLUSH_INTERVAL', 0.05)
+
+        if self.enabled:
+            self.start()
+            atexit.register(self.stop)
+
+    def append(self, model, **values):
+        """
+        追加一条记录
+        :param model: 模型类
+        :param values: 字段值
+        """
+        if not self.enabled or not self.running:
+            db.session.add(model(**values))
+            db.session.commit()
+            return
+
+        # 时间等默认值在入队时计算，保证记录时间是操作发生的时间
+        for column in model.__table__.columns:
+            if column.key in values or column.primary_key or column.default is None:
+                continue
+            if column.default.is_callable:
+                values[column.key] = column.default.arg(None)
+            elif column.default.is_scalar:
+                values[column.key] = column.default.arg
+        self._queue.put((model.__table__, values))
+
+    def _drain(self, first):
+        """收集一批待写入的记录，最多等待 flush_interval 秒"""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        rows_by_table = {}
+        for table, values in batch:
+            rows_by_table.setdefault(table, []).append(values)
+
+        with self.app.app_context():
+            engine = db.get_engine(self.app)
+            try:
+                # 一个事务写入整批记录
+                with engine.begin() as conn:
+                    for table, rows in rows_by_table.items():
+                        conn.execute(table.insert(), rows)
+                self.stats['batches'] += 1
+                self.stats['rows'] += len(batch)
+            except Exception as e:
+                self.logger.error(f"批量写入失败，改为逐条写入: {str(e)}")
+                for table, values in batch:
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(table.insert(), values)
+                        self.stats['rows'] += 1
+                    except Exception as row_error:
+                        self.stats['failed'] += 1
+                        self.logger.error(f"写入 {table.name} 记录失败: {str(row_error)}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    break
+                continue
+            batch = self._drain(first)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        """启动写入线程"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """阻塞等待队列中的记录全部写入"""
+        if self.running:
+            self._queue.join()
+
+    def stop(self):
+        """写完剩余记录后停止写入线程"""
+        self.flush()
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """获取队列状态"""
+        return dict(self.stats, enabled=self.enabled, pending=self._queue.qsize())
+
+# 创建实例
+write_queue = WriteQueue()
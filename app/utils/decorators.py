@@ -2,6 +2,7 @@ from functools import wraps
 from flask import request, jsonify, current_app, flash, redirect, url_for
 from flask_login import current_user
 from app.utils.security import verify_jwt_token
+from app.services.db_service import use_read_replica
 
 def api_required(f):
     """验证API请求的装饰器，同时支持session和JWT认证"""
@@ -103,4 +104,12 @@ def jwt_required(f):
         request.user_id = payload.get('user_id')
         
         return f(*args, **kwargs)
-    return decorated_function 
\ No newline at end of file
+    return decorated_function 
+
+def read_replica(f):
+    """标记只读接口，GET 请求在配置了只读副本时从副本读取"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        use_read_replica()
+        return f(*args, **kwargs)
+    return decorated_function
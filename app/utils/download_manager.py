@@ -0,0 +1,316 @@
+"""
+字体等资源文件的下载管理
+
+多个文件用线程池并发下载，workers 限制同时进行的下载数。每个文件边下载边写入缓存目录中的
+.part 文件，不在内存中缓存整个文件；下载中断后再次下载时用 Range 请求从已下载的位置继续，
+服务器不支持断点续传时从头下载。同一个压缩包中的多个字体只下载一次，解压时逐个文件流式写出。
+
+下载完成后检查长度和字体文件头，条目提供 sha256 时校验内容哈希，全部通过后才原子替换到目标目录，
+目标目录中不会出现写了一半或校验失败的文件。指定镜像目录时优先从镜像目录取文件（按字体文件名或
+下载URL中的文件名查找），可用于没有外网的离线安装。
+
+不依赖 Flask 应用上下文，字体管理器和 download_fonts*.py 脚本共用。
+"""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import zipfile
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+# 压缩包中可作为字体提取的文件类型
+FONT_SUFFIXES = ('.ttf', '.otf', '.ttc')
+
+# 字体文件头: TrueType、OpenType(CFF)、TrueType Collection、Apple TrueType、WOFF、WOFF2
+FONT_SIGNATURES = (b'\x00\x01\x00\x00', b'OTTO', b'ttcf', b'true', b'wOFF', b'wOF2')
+
+
+class DownloadError(Exception):
+    """下载失败或文件校验失败"""
+    pass
+
+
+def file_sha256(path):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _range_total(content_range):
+    """从 Content-Range 响应头（bytes 0-99/1000 或 bytes */1000）中取文件总长度"""
+    if not content_range or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _range_start(content_range):
+    """从 Content-Range 响应头中取本次响应的起始位置"""
+    try:
+        return int(content_range.split()[1].split('-', 1)[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class DownloadManager:
+    """
+    并发、可断点续传的下载管理器
+
+    下载条目为字典: name 名称、file 目标文件名、url 下载地址（文件或 zip 压缩包），
+    可选 sha256 为目标文件（压缩包则为解压出的字体）的内容哈希。
+    """
+
+    def __init__(self, dest_dir, cache_dir, mirror_dir=None, workers=4, timeout=60, retries=3, verify_ssl=True,
+                 logger=None):
+        """
+        :param dest_dir: 目标目录（字体目录）
+        :param cache_dir: 下载缓存目录，保存未完成的 .part 文件和待解压的压缩包
+        :param mirror_dir: 本地镜像目录，为None时只从网络下载
+        :param workers: 最大并发下载数
+        :param timeout: 单次请求的连接和读取超时（秒）
+        :param retries: 每个文件的最大尝试次数，重试时从已下载的位置继续
+        :param verify_ssl: 是否校验 HTTPS 证书
+        """
+        self.dest_dir = dest_dir
+        self.cache_dir = cache_dir
+        self.mirror_dir = mirror_dir
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.verify_ssl = verify_ssl
+        self.logger = logger or logging.getLogger(__name__)
+        self._local = threading.local()
+        self._url_locks = {}
+        self._url_locks_lock = threading.Lock()
+        self._downloaded = set()
+
+    def download_all(self, items):
+        """
+        并发下载多个条目，全部结束后删除已解压的压缩包（未完成的 .part 文件保留，供下次继续）
+        :return: 与 items 顺序一致的结果列表，每项为 {name, file, success, source, error}，
+                 source 为 existing（已存在）、mirror（镜像目录）或 network（网络下载）
+        """
+        if not items:
+            return []
+        os.makedirs(self.dest_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as executor:
+                return list(executor.map(self.fetch, items))
+        finally:
+            for path in self._downloaded:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._downloaded.clear()
+
+    def fetch(self, item):
+        """下载一个条目，不抛出异常，失败原因记录在结果的 error 中"""
+        result = {'name': item.get('name', item.get('file')), 'file': item.get('file'), 'success': False,
+                  'source': None, 'error': None}
+        started = time.perf_counter()
+        try:
+            result['source'] = self._fetch(item)
+            result['success'] = True
+            if result['source'] != 'existing':
+                size = os.path.getsize(os.path.join(self.dest_dir, item['file']))
+                self.logger.info(f"字体已安装: {result['name']} ({item['file']}, {size / 1024 / 1024:.1f}MB, "
+                                 f"来源 {result['source']}, 耗时 {time.perf_counter() - started:.1f}s)")
+        except Exception as e:
+            result['error'] = str(e)
+            self.logger.error(f"下载字体失败 {result['name']}: {str(e)}")
+        return result
+
+    def _fetch(self, item):
+        target = os.path.join(self.dest_dir, item['file'])
+        expected = item.get('sha256')
+
+        # 已存在且校验通过时跳过，校验失败时重新下载
+        if os.path.exists(target):
+            if not expected or file_sha256(target) == expected:
+                self.logger.info(f"字体已存在，跳过下载: {item.get('name')} ({item['file']})")
+                return 'existing'
+            self.logger.warning(f"字体文件校验失败，重新下载: {item['file']}")
+
+        source = 'mirror'
+        path = self._find_in_mirror(item)
+        if path is None:
+            if not item.get('url'):
+                raise DownloadError('缺少下载URL')
+            source = 'network'
+            path = self._download(item['url'])
+
+        try:
+            if zipfile.is_zipfile(path):
+                self._extract(path, item, target, expected)
+            else:
+                self._install(path, target, expected)
+        except DownloadError:
+            # 下载的文件有问题时删除，下次重新下载
+            if source == 'network' and os.path.exists(path):
+                os.remove(path)
+            raise
+        return source
+
+    def _find_in_mirror(self, item):
+        """在镜像目录中按字体文件名或下载URL中的文件名查找"""
+        if not self.mirror_dir:
+            return None
+        names = [item['file']]
+        if item.get('url'):
+            names.append(os.path.basename(urlparse(item['url']).path))
+        for name in names:
+            path = os.path.join(self.mirror_dir, name)
+            if name and os.path.isfile(path):
+                return path
+        return None
+
+    def _session(self):
+        """每个下载线程使用自己的会话，复用连接"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            # 不接受压缩编码，Range 的字节位置与文件一致
+            session.headers['Accept-Encoding'] = 'identity'
+        return session
+
+    def _url_lock(self, url):
+        with self._url_locks_lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _download(self, url):
+        """
+        下载文件到缓存目录，失败时从已下载的位置重试
+        :return: 下载完成的文件路径
+        """
+        name = os.path.basename(urlparse(url).path) or 'download'
+        path = os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}-{name}")
+        part_path = path + '.part'
+
+        # 同一个URL（例如包含多个字体的压缩包）只下载一次
+        with self._url_lock(url):
+            if os.path.exists(path):
+                self._downloaded.add(path)
+                return path
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self._stream(url, part_path)
+                    os.replace(part_path, path)
+                    self._downloaded.add(path)
+                    return path
+                except (requests.RequestException, DownloadError) as e:
+                    # 404 等客户端错误重试也不会成功
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    if attempt == self.retries or (status and 400 <= status < 500 and status not in (408, 429)):
+                        raise DownloadError(f'下载失败（已尝试 {attempt} 次）: {str(e)}')
+                    delay = min(2 ** attempt, 30)
+                    self.logger.warning(f"下载中断，{delay} 秒后继续 ({attempt}/{self.retries}): {url}: {str(e)}")
+                    time.sleep(delay)
+
+    def _stream(self, url, part_path):
+        """流式写入 .part 文件，已有部分内容时用 Range 请求继续"""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        with self._session().get(url, headers=headers, stream=True, timeout=self.timeout,
+                                 verify=self.verify_ssl) as response:
+            if response.status_code == 416:
+                # 请求的位置超出文件长度: 已下载完整，或服务器上的文件已变化
+                if _range_total(response.headers.get('Content-Range')) == offset:
+                    return
+                os.remove(part_path)
+                raise DownloadError('服务器上的文件已变化，重新下载')
+            response.raise_for_status()
+
+            if offset and (response.status_code != 206 or
+                           _range_start(response.headers.get('Content-Range')) != offset):
+                # 服务器不支持断点续传，从头下载
+                offset = 0
+            if response.status_code == 206:
+                total = _range_total(response.headers.get('Content-Range'))
+            else:
+                length = response.headers.get('Content-Length')
+                total = int(length) if length and length.isdigit() else None
+
+            if offset:
+                self.logger.info(f"从 {offset / 1024 / 1024:.1f}MB 处继续下载: {url}")
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            raise DownloadError(f'下载不完整: {size}/{total} 字节')
+
+    def _check_font(self, path, expected):
+        """检查字体文件头和内容哈希，防止把错误页面或损坏的文件当作字体安装"""
+        with open(path, 'rb') as f:
+            header = f.read(4)
+        if header not in FONT_SIGNATURES:
+            raise DownloadError('文件不是有效的字体文件')
+        if expected:
+            actual = file_sha256(path)
+            if actual != expected:
+                raise DownloadError(f'SHA-256 校验失败: 期望 {expected}，实际 {actual}')
+
+    def _install(self, path, target, expected):
+        """校验后复制到目标目录，先写临时文件再原子替换"""
+        self._check_font(path, expected)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dest_dir, prefix='.tmp-')
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _extract(self, archive, item, target, expected):
+        """从压缩包中流式解压字体，校验后原子替换到目标位置"""
+        try:
+            zf = zipfile.ZipFile(archive)
+        except zipfile.BadZipFile:
+            raise DownloadError('压缩包已损坏')
+
+        with zf:
+            member = self._find_member(zf, item)
+            if member is None:
+                raise DownloadError(f"在压缩包中未找到匹配的字体文件: {item['file']}")
+            fd, tmp_path = tempfile.mkstemp(dir=self.dest_dir, prefix='.tmp-')
+            try:
+                with zf.open(member) as src, os.fdopen(fd, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                self._check_font(tmp_path, expected)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.logger.info(f"从压缩包中提取字体: {member.filename} -> {item['file']}")
+
+    def _find_member(self, zf, item):
+        """在压缩包中查找字体: 先按文件名精确匹配，再按字体名称或文件名模糊匹配"""
+        fonts = [info for info in zf.infolist() if info.filename.lower().endswith(FONT_SUFFIXES)]
+        for info in fonts:
+            if os.path.basename(info.filename) == item['file']:
+                return info
+        name = (item.get('name') or '').lower()
+        stem = os.path.splitext(item['file'])[0].lower()
+        for info in fonts:
+            filename = info.filename.lower()
+            if (name and name in filename) or stem in filename:
+                return info
+        return None
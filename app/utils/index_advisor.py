@@ -0,0 +1,159 @@
+"""
+索引顾问（开发模式）
+
+按接口收集请求中执行的 SQL，请求结束后对每种查询执行一次 EXPLAIN，
+发现全表扫描时记录警告，便于在上线前发现缺失索引导致的性能退化。
+
+- SQLite: EXPLAIN QUERY PLAN 中出现 "SCAN <表名>" 且未使用索引
+- PostgreSQL: 执行计划中出现 Seq Scan 节点
+- MySQL: EXPLAIN 结果中 type 为 ALL
+"""
+import re
+import json
+import logging
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 只分析带过滤或排序条件的查询，无条件的全表查询本身就需要扫描
+_ANALYZE_PATTERN = re.compile(r'\b(WHERE|ORDER BY)\b', re.IGNORECASE)
+_SQLITE_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+class IndexAdvisor:
+    """
+    索引顾问
+
+    启用后在每个请求中记录执行的 SELECT 语句，请求结束时用 EXPLAIN 分析，
+    同一接口的同一条语句只分析一次。分析结果可通过 get_report() 获取。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.findings = {}
+        self._analyzed = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，仅在 INDEX_ADVISOR_ENABLED 时注册钩子"""
+        self.app = app
+        if not app.config.get('INDEX_ADVISOR_ENABLED'):
+            return
+
+        self.ignore_tables = set(app.config.get('INDEX_ADVISOR_IGNORE_TABLES', ()))
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._capture)
+            self._listening = True
+
+        app.after_request(self._after_request)
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        """记录当前请求执行的查询语句"""
+        if executemany or getattr(self._local, 'explaining', False) or not has_request_context():
+            return
+        if not statement.lstrip().upper().startswith('SELECT') or not _ANALYZE_PATTERN.search(statement):
+            return
+        captured = g.setdefault('_index_advisor_statements', {})
+        captured.setdefault(statement, (conn.engine, parameters))
+
+    def _after_request(self, response):
+        captured = g.pop('_index_advisor_statements', None)
+        if not captured:
+            return response
+
+        endpoint = request.endpoint or request.path
+        for statement, (engine, parameters) in captured.items():
+            key = (endpoint, statement)
+            with self._lock:
+                if key in self._analyzed:
+                    continue
+                self._analyzed.add(key)
+
+            try:
+                tables = self.find_full_scans(engine, statement, parameters)
+            except Exception as e:
+                self.logger.debug(f"索引顾问无法分析查询: {str(e)}")
+                continue
+
+            tables = [t for t in tables if t not in self.ignore_tables]
+            if tables:
+                self._record(endpoint, statement, tables)
+
+        return response
+
+    def find_full_scans(self, engine, statement, parameters=()):
+        """
+        执行 EXPLAIN 并返回被全表扫描的表名列表
+        :param engine: 数据库引擎
+        :param statement: SQL语句
+        :param parameters: 语句参数
+        """
+        dialect = engine.dialect.name
+        self._local.explaining = True
+        try:
+            with engine.connect() as conn:
+                if dialect == 'sqlite':
+                    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                    tables = []
+                    for row in rows:
+                        match = _SQLITE_SCAN_PATTERN.match(row[-1])
+                        if match:
+                            tables.append(match.group(1))
+                    return tables
+
+                if dialect == 'postgresql':
+                    plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    return self._pg_seq_scans(plan[0]['Plan'])
+
+                if dialect == 'mysql':
+                    rows = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters).mappings().all()
+                    return [row['table'] for row in rows if row.get('type') == 'ALL' and row.get('table')]
+        finally:
+            self._local.explaining = False
+
+        return []
+
+    def _pg_seq_scans(self, node):
+        tables = []
+        if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name'):
+            tables.append(node['Relation Name'])
+        for child in node.get('Plans', []):
+            tables.extend(self._pg_seq_scans(child))
+        return tables
+
+    def _record(self, endpoint, statement, tables):
+        with self._lock:
+            for table in tables:
+                self.findings.setdefault((endpoint, table), []).append(statement)
+        self.logger.warning(
+            f"索引顾问: 接口 {endpoint} 的查询对表 {', '.join(tables)} 进行了全表扫描\n{statement}")
+
+    def get_report(self):
+        """
+        获取全表扫描报告
+        :return: [{'endpoint', 'table', 'statements'}] 列表
+        """
+        with self._lock:
+            return [
+                {'endpoint': endpoint, 'table': table, 'statements': list(statements)}
+                for (endpoint, table), statements in sorted(self.findings.items())
+            ]
+
+    def reset(self):
+        """清空分析结果"""
+        with self._lock:
+            self.findings.clear()
+            self._analyzed.clear()
+
+# 创建实例
+index_advisor = IndexAdvisor()
@@ -0,0 +1,258 @@
+"""
+性能指标
+
+记录每个接口的请求耗时、数据库耗时、查询次数和等待 SQLite 写锁的时间，水印/PDF处理耗时以及上传字节数，
+在 /metrics 以 Prometheus 文本格式导出（管理员登录或携带 METRICS_TOKEN）。
+启用 METRICS_RESPONSE_HEADERS 时，每个响应还在 X-DB-Time、X-DB-Queries、X-DB-Lock-Wait 头中
+返回本次请求的数据库耗时、语句数和写锁等待秒数，供压测工具跨进程汇总。
+
+未启用 METRICS_ENABLED 时不注册请求钩子和数据库事件，业务代码中的 inc/observe/timed
+只做一次属性判断后直接返回。指标保存在进程内存中，多进程部署时每个进程分别导出。
+"""
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from flask import g, request, jsonify, Response
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """累加计数器"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items()) or ([((), 0)] if not self.labels else [])
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labels, key)} {value}'
+
+
+class Histogram:
+    """分桶直方图，桶计数在导出时累加"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {count}'
+
+
+class Metrics:
+    """
+    指标注册表
+
+    请求指标在 init_app 中通过请求钩子和数据库事件采集；
+    业务代码通过 inc()、observe()、timer() 和 timed() 记录自定义指标。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self._metrics = {}
+        self._local = threading.local()
+        self._listening = False
+        self.response_headers = False
+
+        self.histogram('http_request_duration_seconds', '接口请求耗时（秒）', ('method', 'endpoint'))
+        self.counter('http_requests_total', '接口请求数', ('method', 'endpoint', 'status'))
+        self.histogram('http_request_db_seconds', '单次请求中数据库语句的总耗时（秒）', ('endpoint',))
+        self.histogram('http_request_queries', '单次请求执行的数据库语句数', ('endpoint',), buckets=COUNT_BUCKETS)
+        self.histogram('http_request_db_lock_wait_seconds', '单次请求等待 SQLite 写锁的总时间（秒）', ('endpoint',))
+        self.histogram('file_processing_seconds', '水印和PDF处理耗时（秒）', ('operation',))
+        self.counter('file_upload_bytes_total', '上传文件的总字节数')
+        self.counter('file_uploads_total', '上传文件数')
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，仅在 METRICS_ENABLED 时注册请求钩子、数据库事件和 /metrics 接口"""
+        self.app = app
+        self.enabled = bool(app.config.get('METRICS_ENABLED'))
+        if not self.enabled:
+            return
+        self.response_headers = bool(app.config.get('METRICS_RESPONSE_HEADERS'))
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self._export)
+
+    def counter(self, name, documentation, labels=()):
+        """注册计数器"""
+        return self._metrics.setdefault(name, Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """注册直方图"""
+        return self._metrics.setdefault(name, Histogram(name, documentation, labels, buckets))
+
+    def inc(self, name, amount=1, **labels):
+        """计数器增加 amount，未启用时忽略"""
+        if self.enabled:
+            self._metrics[name].inc(amount, **labels)
+
+    def observe(self, name, value, **labels):
+        """直方图记录一个观测值，未启用时忽略"""
+        if self.enabled:
+            self._metrics[name].observe(value, **labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """记录代码块的耗时"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._metrics[name].observe(time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """记录函数耗时的装饰器，是否启用在调用时判断"""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self._metrics[name].observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def record_lock_wait(self, seconds):
+        """记录当前请求等待数据库写锁的时间，由 db_service 的写锁调用"""
+        if self.enabled and getattr(self._local, 'active', False):
+            self._local.lock_wait += seconds
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'active', False):
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is not None and getattr(self._local, 'active', False):
+            self._local.db_time += time.perf_counter() - started
+            self._local.queries += 1
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        self._local.active = True
+        self._local.db_time = 0.0
+        self._local.queries = 0
+        self._local.lock_wait = 0.0
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        self._local.active = False
+        if started is None:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        self._metrics['http_request_duration_seconds'].observe(
+            time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        self._metrics['http_requests_total'].inc(
+            method=request.method, endpoint=endpoint, status=response.status_code)
+        self._metrics['http_request_db_seconds'].observe(self._local.db_time, endpoint=endpoint)
+        self._metrics['http_request_queries'].observe(self._local.queries, endpoint=endpoint)
+        self._metrics['http_request_db_lock_wait_seconds'].observe(self._local.lock_wait, endpoint=endpoint)
+        if self.response_headers:
+            response.headers['X-DB-Time'] = f'{self._local.db_time:.6f}'
+            response.headers['X-DB-Queries'] = str(self._local.queries)
+            response.headers['X-DB-Lock-Wait'] = f'{self._local.lock_wait:.6f}'
+        return response
+
+    def _teardown_request(self, exc=None):
+        # 请求异常时 after_request 不会执行
+        self._local.active = False
+
+    def _export(self):
+        """导出 Prometheus 文本格式的指标，需要管理员登录或 Bearer METRICS_TOKEN"""
+        token = self.app.config.get('METRICS_TOKEN')
+        authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+        if not authorized and not (current_user.is_authenticated and current_user.is_admin):
+            return jsonify({
+                'success': False,
+                'message': '需要管理员权限'
+            }), 403
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+# 创建实例
+metrics = Metrics()
@@ -0,0 +1,237 @@
+"""
+游标（keyset）分页工具
+
+按 (排序字段, id) 构造不透明游标，翻页时使用 WHERE 条件定位而不是 OFFSET，
+深分页与首页耗时一致。同时保留原有的页码分页方式以兼容旧客户端。
+"""
+import base64
+import json
+from datetime import datetime, date
+from flask import request
+from sqlalchemy import and_, or_, select, func
+from app import db
+
+# 近似总数模式下，SQLite 最多精确统计的行数
+APPROX_COUNT_CAP = 10000
+
+
+class InvalidCursorError(ValueError):
+    """游标无效、与当前排序方式不匹配或排序字段不支持游标分页"""
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    return ['v', value]
+
+
+def _decode_value(item):
+    kind, value = item
+    if kind == 'dt':
+        return datetime.fromisoformat(value)
+    if kind == 'd':
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(sort_key, descending, sort_value, row_id):
+    """
+    生成游标
+    :param sort_key: 排序字段名
+    :param descending: 是否降序
+    :param sort_value: 最后一行的排序字段值
+    :param row_id: 最后一行的ID
+    :return: URL安全的游标字符串
+    """
+    payload = {
+        'k': sort_key,
+        'd': 1 if descending else 0,
+        'v': [_encode_value(sort_value), row_id]
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key, descending):
+    """
+    解析游标
+    :param cursor: 游标字符串
+    :param sort_key: 当前排序字段名
+    :param descending: 当前是否降序
+    :return: (排序字段值, ID)
+    :raises InvalidCursorError: 游标格式错误或排序方式不匹配
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        sort_value = _decode_value(payload['v'][0])
+        row_id = int(payload['v'][1])
+    except Exception:
+        raise InvalidCursorError('无效的分页游标')
+
+    if payload.get('k') != sort_key or bool(payload.get('d')) != bool(descending):
+        raise InvalidCursorError('分页游标与当前排序方式不匹配')
+
+    return sort_value, row_id
+
+
+def estimate_count(query):
+    """
+    估算查询结果总数
+    PostgreSQL/MySQL 读取执行计划中的行数估计，SQLite 精确统计但最多 APPROX_COUNT_CAP 行
+    :param query: 查询对象
+    :return: (总数, 是否为估计值)
+    """
+    query = query.order_by(None)
+    dialect = db.engine.dialect.name
+
+    if dialect in ('postgresql', 'mysql'):
+        try:
+            compiled = query.statement.compile(dialect=db.engine.dialect)
+            connection = db.session.connection()
+            if dialect == 'postgresql':
+                plan = connection.exec_driver_sql(
+                    f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]['Plan']['Plan Rows']), True
+            row = connection.exec_driver_sql(f'EXPLAIN {compiled}', compiled.params).mappings().first()
+            return int(row['rows'] or 0), True
+        except Exception:
+            pass
+
+    capped = query.limit(APPROX_COUNT_CAP + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(capped)).scalar()
+    if count > APPROX_COUNT_CAP:
+        return APPROX_COUNT_CAP, True
+    return count, False
+
+
+def _ordering(sort_column, id_column, descending):
+    columns = [sort_column] if sort_column.key == id_column.key else [sort_column, id_column]
+    return [column.desc() if descending else column.asc() for column in columns]
+
+
+def _after_condition(sort_column, id_column, descending, sort_value, row_id):
+    """
+    游标之后的行，条件与 (排序字段, id) 复合索引的顺序一致
+    外层的范围条件让数据库从游标位置开始读索引，而不是从头扫描后逐行过滤
+    """
+    id_after = id_column < row_id if descending else id_column > row_id
+    if sort_column.key == id_column.key:
+        return id_after
+    if descending:
+        return and_(sort_column <= sort_value, or_(sort_column < sort_value, id_after))
+    return and_(sort_column >= sort_value, or_(sort_column > sort_value, id_after))
+
+
+class KeysetPage:
+    """游标分页结果"""
+
+    def __init__(self, items, next_cursor, per_page, total=None, total_is_estimate=False):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def meta(self):
+        meta = {
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_more,
+            'per_page': self.per_page
+        }
+        if self.total is not None:
+            meta['total'] = self.total
+            meta['total_is_estimate'] = self.total_is_estimate
+        return meta
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=10,
+                    descending=True, total=None):
+    """
+    按 (排序字段, id) 进行游标分页
+    排序字段必须是非空列: NULL 不满足比较条件，翻页时会漏掉这些行，
+    而为 NULL 增加的排序和条件分支又会让查询无法使用 (排序字段, id) 复合索引
+    :param query: 查询对象（不应包含 order_by）
+    :param sort_column: 排序字段
+    :param id_column: 主键字段，用于排序值相同时的稳定排序
+    :param cursor: 上一页返回的游标，为空表示第一页
+    :param per_page: 每页条数
+    :param descending: 是否降序
+    :param total: 总数模式: None 不统计, 'exact' 精确统计, 'approx' 估算
+    :return: KeysetPage
+    :raises InvalidCursorError: 游标无效，或排序字段可为空
+    """
+    sort_key = sort_column.key
+    if sort_key != id_column.key and getattr(sort_column, 'nullable', True):
+        raise InvalidCursorError(f'排序字段 {sort_key} 可能为空，不支持游标分页，请使用页码分页')
+    base_query = query
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_key, descending)
+        query = query.filter(_after_condition(sort_column, id_column, descending, sort_value, row_id))
+
+    # 多取一条用于判断是否还有下一页
+    rows = query.order_by(*_ordering(sort_column, id_column, descending)).limit(per_page + 1).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page and items:
+        last = items[-1]
+        next_cursor = encode_cursor(sort_key, descending,
+                                    getattr(last, sort_key), getattr(last, id_column.key))
+
+    total_count = None
+    total_is_estimate = False
+    if total == 'exact':
+        total_count = base_query.order_by(None).count()
+    elif total == 'approx':
+        total_count, total_is_estimate = estimate_count(base_query)
+
+    return KeysetPage(items, next_cursor, per_page, total_count, total_is_estimate)
+
+
+def paginate_request(query, sort_column, id_column, per_page, descending=True):
+    """
+    根据请求参数分页
+    请求中带有 cursor 参数（可为空字符串，表示第一页）时使用游标分页，
+    否则沿用 page 参数的页码分页
+    :param query: 查询对象（不应包含 order_by）
+    :param sort_column: 排序字段
+    :param id_column: 主键字段
+    :param per_page: 每页条数
+    :param descending: 是否降序
+    :return: (当前页数据列表, 分页信息字典)
+    :raises InvalidCursorError: 游标无效或排序字段不支持游标分页
+    """
+    if 'cursor' in request.args:
+        total = request.args.get('total')
+        if total not in ('exact', 'approx'):
+            total = None
+        page = keyset_paginate(
+            query, sort_column, id_column,
+            cursor=request.args.get('cursor') or None,
+            per_page=per_page,
+            descending=descending,
+            total=total
+        )
+        return page.items, page.meta()
+
+    page = request.args.get('page', 1, type=int)
+    query = query.order_by(*_ordering(sort_column, id_column, descending))
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+
+    return pagination.items, {
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'page': page,
+        'per_page': per_page
+    }
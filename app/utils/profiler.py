@@ -0,0 +1,237 @@
+"""
+慢请求采样分析
+
+启用 PROFILER_ENABLED 后，一个采样线程每隔 PROFILER_SAMPLE_INTERVAL 秒读取一次
+正在处理请求的线程的调用栈（sys._current_frames），按折叠栈格式累计次数。
+请求耗时超过 PROFILER_SLOW_THRESHOLD 秒时，把采样结果连同接口、路由参数和查询参数
+保存到 request_profiles 表，并写一条 profiler 模块的系统日志。
+令牌、密码等敏感参数（见 REDACTED_PARAMS 和 PROFILER_REDACT_PARAMS）只保存参数名，值替换为 [REDACTED]，
+路径中的敏感路由参数同样替换。
+
+折叠栈每行为 "外层帧;...;内层帧 次数"，可以直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+没有进行中的请求时采样线程只做一次空循环；未启用时不注册任何钩子。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import request, current_app
+from flask_login import current_user
+from app import db
+from app.models import RequestProfile
+from app.services.write_queue import write_queue
+
+
+# 值不保存的参数名（不区分大小写），名称中包含 REDACTED_PARAM_PARTS 的参数同样处理
+REDACTED_PARAMS = frozenset({
+    't', 'token', 'access_token', 'refresh_token', 'id_token', 'jwt', 'auth', 'authorization',
+    'password', 'passwd', 'pwd', 'secret', 'api_key', 'apikey', 'signature', 'sig', 'code', 'session'
+})
+REDACTED_PARAM_PARTS = ('token', 'password', 'secret')
+REDACTED = '[REDACTED]'
+
+
+def _is_sensitive(name, extra=()):
+    name = name.lower()
+    return name in REDACTED_PARAMS or name in extra or any(part in name for part in REDACTED_PARAM_PARTS)
+
+
+def redact_params(params, extra=()):
+    """
+    替换敏感参数的值
+    :param params: 参数字典
+    :param extra: 额外的敏感参数名（小写）
+    :return: 新的参数字典，敏感参数的值为 [REDACTED]
+    """
+    return {name: REDACTED if _is_sensitive(name, extra) else value for name, value in params.items()}
+
+
+class _ActiveRequest:
+    __slots__ = ('started', 'stacks', 'samples')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stacks = {}
+        self.samples = 0
+
+
+class SlowRequestProfiler:
+    """
+    慢请求采样分析器
+
+    采样线程只读取已登记的请求线程的栈，不影响其他后台线程；
+    采样结果在请求结束时判断是否保存，快请求的数据直接丢弃。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.threshold = 1.0
+        self.interval = 0.01
+        self.max_depth = 64
+        self.redact = frozenset()
+        self.stats = {'samples': 0, 'saved': 0}
+        self._active = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，仅在 PROFILER_ENABLED 时注册请求钩子"""
+        self.app = app
+        if not app.config.get('PROFILER_ENABLED'):
+            return
+
+        self.threshold = app.config.get('PROFILER_SLOW_THRESHOLD', 1.0)
+        self.interval = app.config.get('PROFILER_SAMPLE_INTERVAL', 0.01)
+        self.max_depth = app.config.get('PROFILER_MAX_DEPTH', 64)
+        self.redact = frozenset(name.lower() for name in app.config.get('PROFILER_REDACT_PARAMS') or ())
+        # 应用本身的帧显示为相对路径
+        self._root = os.path.dirname(app.root_path) + os.sep
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        if not self.running:
+            self.start()
+        self._active[threading.get_ident()] = _ActiveRequest()
+
+    def _after_request(self, response):
+        active = self._active.pop(threading.get_ident(), None)
+        if active is None:
+            return response
+
+        duration = time.perf_counter() - active.started
+        if duration >= self.threshold and active.stacks:
+            try:
+                self._save(active, duration, response.status_code)
+            except Exception as e:
+                self.logger.error(f"保存慢请求采样失败: {str(e)}")
+        return response
+
+    def _teardown_request(self, exc=None):
+        # 请求异常时 after_request 不会执行
+        self._active.pop(threading.get_ident(), None)
+
+    def _save(self, active, duration, status_code):
+        from app.services.log_service import log_system_activity
+
+        endpoint = request.endpoint or 'unmatched'
+        duration_ms = int(duration * 1000)
+        user_id = current_user.id if current_user.is_authenticated else None
+        stacks = '\n'.join(f'{stack} {count}' for stack, count in
+                           sorted(active.stacks.items(), key=lambda item: -item[1]))
+        view_args = request.view_args or {}
+        path = request.path
+        for name, value in view_args.items():
+            if _is_sensitive(name, self.redact) and str(value):
+                path = path.replace(str(value), REDACTED)
+
+        write_queue.append(
+            RequestProfile,
+            endpoint=endpoint,
+            method=request.method,
+            path=path[:512],
+            params=json.dumps({'view_args': redact_params(view_args, self.redact),
+                               'args': redact_params(request.args.to_dict(flat=False), self.redact)},
+                              ensure_ascii=False, default=str),
+            status_code=status_code,
+            duration_ms=duration_ms,
+            sample_count=active.samples,
+            stacks=stacks,
+            user_id=user_id
+        )
+        log_system_activity(
+            'WARNING', 'profiler',
+            f"慢请求 {request.method} {path}（{endpoint}）耗时 {duration_ms}ms，已保存 {active.samples} 次调用栈采样",
+            user_id=user_id
+        )
+        self.stats['saved'] += 1
+
+    def _frame_name(self, frame):
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(self._root):
+            filename = filename[len(self._root):]
+        else:
+            filename = os.path.basename(filename)
+        return f'{code.co_name} ({filename}:{frame.f_lineno})'
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+    def sample(self):
+        """对所有进行中的请求采样一次"""
+        if not self._active:
+            return
+        frames = sys._current_frames()
+        for ident, active in list(self._active.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = self._collapse(frame)
+            active.stacks[stack] = active.stacks.get(stack, 0) + 1
+            active.samples += 1
+            self.stats['samples'] += 1
+
+    def run_forever(self):
+        """阻塞运行采样循环，直到调用 stop()"""
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.debug(f"调用栈采样失败: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """以守护线程方式启动采样循环"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样循环"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """获取采样分析器状态"""
+        return dict(self.stats, running=self.running, active_requests=len(self._active),
+                    threshold=self.threshold, interval=self.interval)
+
+
+def purge_request_profiles(retention_days=None):
+    """
+    删除超过保留期的慢请求采样
+    :param retention_days: 保留天数，默认按 PROFILER_RETENTION_DAYS 配置
+    :return: 删除的记录数
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('PROFILER_RETENTION_DAYS', 7)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = RequestProfile.query.filter(RequestProfile.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# 创建实例
+request_profiler = SlowRequestProfiler()
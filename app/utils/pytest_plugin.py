@@ -0,0 +1,44 @@
+"""
+pytest 插件: 接口查询预算
+
+在 conftest.py 中启用（tests/conftest.py 已启用）:
+
+    pytest_plugins = ['app.utils.pytest_plugin']
+
+用法:
+
+    def test_instance_detail(instance, query_budget):
+        with query_budget(6):
+            get_instance_detail(instance)
+
+查询次数超过预算或出现 N+1 查询（同一语句以不同参数重复执行
+QUERY_COUNTER_N_PLUS_ONE_THRESHOLD 次以上）时测试失败，并列出执行的语句。
+"""
+from contextlib import contextmanager
+import pytest
+from app.utils.query_counter import query_counter
+
+
+@pytest.fixture
+def query_budget():
+    """
+    返回限制查询次数的上下文管理器
+    query_budget(max_queries, allow_n_plus_one=False)
+    """
+    @contextmanager
+    def budget(max_queries, allow_n_plus_one=False):
+        with query_counter.record() as recorder:
+            yield recorder
+
+        problems = []
+        if recorder.count > max_queries:
+            problems.append(f"执行了 {recorder.count} 次查询，超过预算 {max_queries} 次:")
+            problems.extend(f"  {statement}" for statement, _ in recorder.statements)
+        repeated = [] if allow_n_plus_one else recorder.repeated(query_counter.threshold)
+        if repeated:
+            problems.append("存在 N+1 查询:")
+            problems.extend(f"  [{count} 次] {statement}" for statement, count in repeated)
+        if problems:
+            pytest.fail('\n'.join(problems), pytrace=False)
+
+    return budget
@@ -0,0 +1,158 @@
+"""
+查询计数器
+
+通过 SQLAlchemy 的 before_cursor_execute 事件统计每个请求执行的 SQL 语句数，
+同一条语句在一个请求中以不同参数重复执行多次时视为 N+1 查询并记录警告。
+开发模式下在响应头 X-Query-Count 中返回查询次数；测试中可以用 record() 统计
+任意代码块的查询，配合 app.utils.pytest_plugin 中的 query_budget 夹具限制接口的查询预算。
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryRecorder:
+    """一段代码中执行的查询记录"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold=5):
+        """
+        找出以不同参数重复执行的语句（N+1 查询）
+        :param threshold: 执行次数达到该值时视为重复
+        :return: [(语句, 执行次数)] 列表，按次数从多到少排序
+        """
+        counts = {}
+        parameters = {}
+        for statement, params in self.statements:
+            counts[statement] = counts.get(statement, 0) + 1
+            parameters.setdefault(statement, set()).add(repr(params))
+        return sorted(
+            ((statement, count) for statement, count in counts.items()
+             if count >= threshold and len(parameters[statement]) > 1),
+            key=lambda item: -item[1]
+        )
+
+
+class QueryCounter:
+    """
+    查询计数器
+
+    record() 可以嵌套使用，语句计入当前线程所有正在记录的 QueryRecorder；
+    启用 QUERY_COUNTER_ENABLED 时每个请求自动记录，N+1 查询按接口汇总，可通过 get_report() 获取。
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.threshold = 5
+        self.findings = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，仅在 QUERY_COUNTER_ENABLED 时为请求注册钩子"""
+        self.app = app
+        self.threshold = app.config.get('QUERY_COUNTER_N_PLUS_ONE_THRESHOLD', 5)
+        if not app.config.get('QUERY_COUNTER_ENABLED'):
+            return
+
+        self._listen()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _listen(self):
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._capture)
+            self._listening = True
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        for recorder in getattr(self._local, 'recorders', ()):
+            recorder.statements.append((statement, parameters))
+
+    def _push(self, recorder):
+        if not hasattr(self._local, 'recorders'):
+            self._local.recorders = []
+        self._local.recorders.append(recorder)
+
+    def _pop(self, recorder):
+        recorders = getattr(self._local, 'recorders', [])
+        if recorder in recorders:
+            recorders.remove(recorder)
+
+    @contextmanager
+    def record(self):
+        """
+        统计代码块中执行的查询
+        :return: QueryRecorder
+        """
+        self._listen()
+        recorder = QueryRecorder()
+        self._push(recorder)
+        try:
+            yield recorder
+        finally:
+            self._pop(recorder)
+
+    def _before_request(self):
+        g._query_recorder = QueryRecorder()
+        self._push(g._query_recorder)
+
+    def _after_request(self, response):
+        recorder = g.pop('_query_recorder', None)
+        if recorder is None:
+            return response
+        self._pop(recorder)
+
+        response.headers['X-Query-Count'] = str(recorder.count)
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            self._record(request.endpoint or request.path, repeated)
+        return response
+
+    def _teardown_request(self, exc=None):
+        # 请求异常时 after_request 不会执行
+        recorder = g.pop('_query_recorder', None)
+        if recorder is not None:
+            self._pop(recorder)
+
+    def _record(self, endpoint, repeated):
+        with self._lock:
+            for statement, count in repeated:
+                key = (endpoint, statement)
+                self.findings[key] = max(self.findings.get(key, 0), count)
+        self.logger.warning(
+            f"查询计数器: 接口 {endpoint} 存在 N+1 查询\n" +
+            '\n'.join(f"[{count} 次] {statement}" for statement, count in repeated))
+
+    def get_report(self):
+        """
+        获取 N+1 查询报告
+        :return: [{'endpoint', 'statement', 'max_count'}] 列表
+        """
+        with self._lock:
+            return [
+                {'endpoint': endpoint, 'statement': statement, 'max_count': count}
+                for (endpoint, statement), count in sorted(self.findings.items())
+            ]
+
+    def reset(self):
+        """清空统计结果"""
+        with self._lock:
+            self.findings.clear()
+
+# 创建实例
+query_counter = QueryCounter()
@@ -0,0 +1,108 @@
+"""
+分层时间轮
+
+每一层是一个环形槽数组，第0层每槽一个刻度，第 i 层每槽覆盖下层一整圈。
+定时器按到期时间放入能容纳它的最低层；指针每前进一个刻度只处理第0层的一个槽，
+走完一圈时把上一层的下一个槽拆分到下层。每个刻度的开销与定时器总数无关。
+"""
+import time
+
+
+class HierarchicalTimingWheel:
+    """
+    分层时间轮
+    :param tick: 刻度（秒）
+    :param wheel_sizes: 各层槽数，默认 60秒 x 60分 x 24时，可容纳一天内到期的定时器
+    :param start: 起始时间戳，默认当前时间
+    """
+
+    def __init__(self, tick=1.0, wheel_sizes=(60, 60, 24), start=None):
+        self.tick = tick
+        self.wheel_sizes = wheel_sizes
+        # 第 i 层一个槽覆盖的刻度数
+        self.spans = []
+        span = 1
+        for size in wheel_sizes:
+            self.spans.append(span)
+            span *= size
+        # 保证可以放入的最大提前量
+        self.capacity = span - self.spans[-1]
+        self.wheels = [[[] for _ in range(size)] for size in wheel_sizes]
+        self.current = int((time.time() if start is None else start) // tick)
+        self._entries = {}
+        self._expired = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, due, item=None):
+        """
+        添加或重新设置定时器
+        :param key: 定时器标识，重复添加时以最后一次为准
+        :param due: 到期时间戳
+        :param item: 到期时返回的数据，默认为 key
+        :return: 是否加入时间轮；超出容量时返回 False，由调用方稍后再加入
+        """
+        due_tick = max(int(due // self.tick), self.current)
+        if not self._place(key, due_tick):
+            return False
+        self._entries[key] = (due_tick, key if item is None else item)
+        return True
+
+    def cancel(self, key):
+        """取消定时器，槽中的旧记录在经过时丢弃"""
+        self._entries.pop(key, None)
+
+    def _place(self, key, due_tick):
+        if due_tick <= self.current:
+            self._expired.append((key, due_tick))
+            return True
+        for level, size in enumerate(self.wheel_sizes):
+            span = self.spans[level]
+            if due_tick // span - self.current // span < size:
+                self.wheels[level][(due_tick // span) % size].append((key, due_tick))
+                return True
+        return False
+
+    def _collect(self, bucket, due_items):
+        for key, due_tick in bucket:
+            entry = self._entries.get(key)
+            # 已取消或重新设置过的记录直接丢弃
+            if entry is None or entry[0] != due_tick:
+                continue
+            del self._entries[key]
+            due_items.append(entry[1])
+
+    def advance(self, now=None):
+        """
+        把指针推进到指定时间
+        :param now: 当前时间戳，默认当前时间
+        :return: 到期的定时器数据列表
+        """
+        target = int((time.time() if now is None else now) // self.tick)
+        due_items = []
+
+        expired, self._expired = self._expired, []
+        self._collect(expired, due_items)
+
+        while self.current < target:
+            self.current += 1
+            # 从高层到低层，把当前刻度开始的上层槽拆分到下层
+            for level in range(len(self.wheel_sizes) - 1, 0, -1):
+                span = self.spans[level]
+                if self.current % span == 0:
+                    slot = (self.current // span) % self.wheel_sizes[level]
+                    bucket, self.wheels[level][slot] = self.wheels[level][slot], []
+                    for key, due_tick in bucket:
+                        if self._entries.get(key, (None,))[0] == due_tick:
+                            self._place(key, due_tick)
+            slot = self.current % self.wheel_sizes[0]
+            bucket, self.wheels[0][slot] = self.wheels[0][slot], []
+            self._collect(bucket, due_items)
+
+        expired, self._expired = self._expired, []
+        self._collect(expired, due_items)
+        return due_items
@@ -9,7 +9,6 @@ from werkzeug.security import generate_password_hash
 import sqlalchemy
 import shutil
 import platform
-import psutil
 import sys
 
 # 日志配置
@@ -102,6 +101,8 @@ def handle_welcome():
 
 def handle_system_check():
     """处理系统检查页面"""
+    import psutil
+    
     # 收集系统信息
     system_info = {
         'os': platform.system() + ' ' + platform.release(),
@@ -243,6 +244,12 @@ def handle_database():
                 current_app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
                 with current_app.app_context():
                     db.create_all()
+                    # 补建复合索引
+                    from ..services.index_service import ensure_indexes
+                    ensure_indexes()
+                    # 创建日志全文索引
+                    from ..services.search_service import ensure_fulltext_index
+                    ensure_fulltext_index()
                 flash('数据库配置成功并初始化', 'success')
                 return redirect(url_for('wizard.step', step=STEP_ADMIN))
             except Exception as e:
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+审批提交次数统计脚本
+
+构造 "审批 -> 自动 -> 自动 -> 审批" 的流程，统计每次 process_workflow_step
+产生的数据库提交次数和耗时，以及事件分发器在请求之外处理自动步骤的开销。
+
+用法:
+    python bench/approval_commits.py --instances 200
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from common import make_app, CommitCounter
+from app import db
+from app.models import User, WorkflowTemplate, WorkflowInstance
+from app.services.event_service import event_dispatcher
+from app.services.workflow_service import process_workflow_step, handle_step_entered, handle_instance_finished
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}},
+    {'id': 2, 'name': '自动归档', 'type': 'auto'},
+    {'id': 3, 'name': '自动通知', 'type': 'auto'},
+    {'id': 4, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='统计每次审批的数据库提交次数')
+    parser.add_argument('--instances', type=int, default=200, help='流程实例数')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'approval_commits.db')
+    # 审批请求只写入事件，由下面的 dispatch_pending 单独统计事件处理
+    app = make_app('sqlite:///' + path, WORKFLOW_EVENT_DISPATCH='background', WORKFLOW_EVENT_WORKER_ENABLED=False)
+    event_dispatcher.register('step.entered', handle_step_entered)
+    event_dispatcher.register('instance.completed', handle_instance_finished)
+    event_dispatcher.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', is_admin=True)
+        workflow = WorkflowTemplate(name='提交次数统计')
+        workflow.set_steps(STEPS)
+        db.session.add_all([admin, workflow])
+        db.session.flush()
+        db.session.add_all([
+            WorkflowInstance(workflow_id=workflow.id, title=f'实例 {i}', status='running',
+                             current_step=1, created_by=admin.id)
+            for i in range(args.instances)
+        ])
+        db.session.commit()
+        instance_ids = [i.id for i in WorkflowInstance.query.all()]
+        admin_id = admin.id
+
+        counter = CommitCounter(db.get_engine(app))
+        for step_id in (1, 4):
+            counter.count = 0
+            started = time.perf_counter()
+            for instance_id in instance_ids:
+                process_workflow_step(instance_id, step_id, 'approve', admin_id, comment='同意')
+                db.session.remove()
+            elapsed = time.perf_counter() - started
+            label = '审批（后续2个自动步骤）' if step_id == 1 else '最后一步审批（流程完成）'
+            print(f'{label}: 每次审批提交 {counter.count / len(instance_ids):.2f} 次, '
+                  f'平均耗时 {elapsed / len(instance_ids) * 1000:.2f} ms')
+
+            # 自动步骤和通知在请求之外由事件分发器处理
+            counter.count = 0
+            started = time.perf_counter()
+            events = event_dispatcher.dispatch_pending()
+            db.session.remove()
+            elapsed = time.perf_counter() - started
+            print(f'  事件分发: 处理 {events} 个事件, 每个实例提交 {counter.count / len(instance_ids):.2f} 次, '
+                  f'平均耗时 {elapsed / len(instance_ids) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量审批压测脚本
+
+同一批待审批实例分别用逐个 process_workflow_step 和 process_workflow_steps_batch
+处理，对比每项耗时、SQL 语句数和提交次数。
+
+用法:
+    python bench/batch_approval.py --instances 500 --batch-size 100
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from sqlalchemy import event
+
+from common import make_app, CommitCounter
+from app import db
+from app.models import User, WorkflowTemplate, WorkflowInstance
+from app.services.workflow_service import process_workflow_step, process_workflow_steps_batch
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {'users': []}},
+    {'id': 2, 'name': '自动归档', 'type': 'auto'},
+    {'id': 3, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+def prepare(instances):
+    db.drop_all()
+    db.create_all()
+    approver = User(username='approver', email='approver@example.com')
+    db.session.add(approver)
+    db.session.flush()
+    STEPS[0]['approvers']['users'] = [approver.id]
+
+    # 分散到多个模板，模拟审批人待办来自不同流程
+    workflows = []
+    for i in range(5):
+        workflow = WorkflowTemplate(name=f'流程 {i}')
+        workflow.set_steps(STEPS)
+        workflows.append(workflow)
+    db.session.add_all(workflows)
+    db.session.flush()
+    db.session.add_all([
+        WorkflowInstance(workflow_id=workflows[i % len(workflows)].id, title=f'实例 {i}',
+                         status='running', current_step=1, created_by=approver.id)
+        for i in range(instances)
+    ])
+    db.session.commit()
+    return approver.id, [instance.id for instance in WorkflowInstance.query.order_by(WorkflowInstance.id)]
+
+
+def run(mode, app, args):
+    with app.app_context():
+        user_id, instance_ids = prepare(args.instances)
+        engine = db.get_engine(app)
+        commits = CommitCounter(engine)
+        statements = [0]
+
+        def count_statement(*_):
+            statements[0] += 1
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+        started = time.perf_counter()
+        if mode == 'single':
+            for instance_id in instance_ids:
+                process_workflow_step(instance_id, 1, 'approve', user_id, comment='同意')
+                db.session.remove()
+        else:
+            for offset in range(0, len(instance_ids), args.batch_size):
+                items = [{'instance_id': instance_id, 'step_id': 1, 'action': 'approve', 'comment': '同意'}
+                         for instance_id in instance_ids[offset:offset + args.batch_size]]
+                results = process_workflow_steps_batch(items, user_id)
+                assert all(result['success'] for result in results), results
+                db.session.remove()
+        elapsed = time.perf_counter() - started
+
+        event.remove(engine, 'before_cursor_execute', count_statement)
+        count = len(instance_ids)
+        return {
+            'ms': elapsed / count * 1000,
+            'statements': statements[0] / count,
+            'commits': commits.count / count
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='逐个审批与批量审批对比')
+    parser.add_argument('--instances', type=int, default=500, help='待审批实例数')
+    parser.add_argument('--batch-size', type=int, default=100, help='每批审批项数')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'batch_approval.db')
+    app = make_app('sqlite:///' + path)
+
+    print(f'实例数: {args.instances}, 批大小: {args.batch_size}')
+    print(f"{'mode':>8} {'ms/item':>9} {'sql/item':>9} {'commits/item':>13}")
+    for mode in ('single', 'batch'):
+        r = run(mode, app, args)
+        print(f"{mode:>8} {r['ms']:>9.2f} {r['statements']:>9.2f} {r['commits']:>13.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+压测脚本公共工具
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from config import Config
+from app import db
+from app.services.write_queue import write_queue
+
+
+def make_app(database_uri, **overrides):
+    """
+    创建只包含数据库的最小应用，避免加载字体等启动流程
+    :param database_uri: 数据库URL
+    :param overrides: 覆盖的配置项
+    """
+    app = Flask('bench')
+    app.config.from_object(Config)
+    app.config.update(overrides)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    # 压测中只关心结果统计，忽略应用日志输出
+    app.logger.disabled = True
+    db.init_app(app)
+    write_queue.init_app(app)
+    return app
+
+
+class CommitCounter:
+    """统计引擎上的事务提交次数"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_commit(self, conn):
+        self.count += 1
+
+
+def make_full_app(database_uri, config_name='testing', **overrides):
+    """
+    通过应用工厂创建完整应用（注册全部蓝图和请求钩子），用于测试客户端压测
+    :param database_uri: 数据库URL
+    :param config_name: 基础配置名称
+    :param overrides: 覆盖的配置项
+    """
+    from config import config
+    from app import create_app
+    settings = dict(overrides, SQLALCHEMY_DATABASE_URI=database_uri)
+    config['bench'] = type('BenchConfig', (config[config_name],), settings)
+    app = create_app('bench')
+    app.logger.disabled = True
+    return app
+
+
+def percentile(values, pct):
+    """
+    计算百分位数（线性插值）
+    :param values: 已排序的数值列表
+    :param pct: 百分位（0-100）
+    """
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+合成数据生成器
+
+按给定规模生成部门、角色、用户、流程模板、不同状态的流程实例及其审批记录、
+工作流日志、系统日志、附件和文件操作记录。相同的参数和随机种子总是生成相同的数据，
+压测结果可以与基线对比。
+
+生成前会删除并重建所有表，数据库中已有数据时拒绝执行，除非指定 --force。
+
+用法:
+    python bench/datagen.py --database sqlite:////tmp/bench.db --users 200 --instances 5000
+"""
+
+import os
+import io
+import json
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+from werkzeug.security import generate_password_hash
+
+from common import make_app
+from app import db
+from app.models import (Department, Role, User, users_roles, WorkflowTemplate, WorkflowInstance, WorkflowApproval,
+                        WorkflowLog, SystemLog, FileAttachment, FileOperation)
+
+BENCH_PASSWORD = 'bench-password'
+
+# 实例状态分布
+STATUS_WEIGHTS = (('running', 0.6), ('completed', 0.25), ('rejected', 0.1), ('pending', 0.05))
+
+DEFAULT_SCALE = {
+    'departments': 10,
+    'roles': 8,
+    'users': 200,
+    'templates': 10,
+    'steps': 5,
+    'instances': 2000,
+    'file_ratio': 0.1,  # 带附件的实例比例
+    'history_days': 90,
+}
+
+
+def _insert(model, rows, chunk=5000):
+    for offset in range(0, len(rows), chunk):
+        db.session.bulk_insert_mappings(model, rows[offset:offset + chunk])
+
+
+def _sample_image():
+    """生成一张用于水印压测的 PNG 图片"""
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (1200, 900), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, 900, 30):
+        draw.line([(0, y), (1200, y)], fill=(200, 200, 220))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+class DatabaseNotEmptyError(RuntimeError):
+    """目标数据库中已有数据"""
+    pass
+
+
+def non_empty_tables():
+    """返回数据库中有数据的表名"""
+    tables = []
+    for table in inspect(db.engine).get_table_names():
+        if db.session.execute(text(f'SELECT 1 FROM "{table}" LIMIT 1')).first() is not None:
+            tables.append(table)
+    db.session.rollback()
+    return tables
+
+
+def generate(scale=None, seed=42, basedir=None, force=False):
+    """
+    生成合成数据（需要在应用上下文中调用，会先删除并重建所有表）
+    :param scale: 规模，未给出的项使用 DEFAULT_SCALE
+    :param seed: 随机种子
+    :param basedir: 附件文件的根目录（对应 BASEDIR 配置），为None时不生成附件
+    :param force: 数据库中已有数据时仍然清空
+    :return: 压测场景需要的数据摘要
+    :raises DatabaseNotEmptyError: 数据库中已有数据且未指定 force
+    """
+    if not force:
+        tables = non_empty_tables()
+        if tables:
+            raise DatabaseNotEmptyError(f"数据库中已有数据（{', '.join(tables[:5])}），"
+                                        f"确认可以清空时使用 --force")
+
+    scale = dict(DEFAULT_SCALE, **(scale or {}))
+    rnd = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=scale['history_days'])
+
+    db.drop_all()
+    db.create_all()
+
+    _insert(Department, [dict(id=i + 1, name=f'部门{i + 1}', code=f'D{i + 1:03d}')
+                         for i in range(scale['departments'])])
+    _insert(Role, [dict(id=i + 1, name=f'角色{i + 1}', description='压测角色')
+                   for i in range(scale['roles'])])
+
+    # 所有用户共用一个密码哈希，避免生成数据时大量计算哈希
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    users = []
+    for i in range(scale['users']):
+        users.append(dict(
+            id=i + 1,
+            username='admin' if i == 0 else f'user{i}',
+            email=f'user{i}@bench.local',
+            full_name=f'压测用户{i}',
+            password_hash=password_hash,
+            is_active=True,
+            is_admin=i == 0,
+            department_id=rnd.randint(1, scale['departments']),
+            position='manager' if i % 20 == 1 else 'staff',
+            created_at=start
+        ))
+    _insert(User, users)
+    role_rows = {(user['id'], rnd.randint(1, scale['roles'])) for user in users}
+    db.session.execute(users_roles.insert(), [dict(user_id=u, role_id=r) for u, r in sorted(role_rows)])
+
+    templates = []
+    for t in range(scale['templates']):
+        steps = []
+        for s in range(scale['steps']):
+            approvers = {'department_manager': True} if s == 0 else \
+                {'roles': [rnd.randint(1, scale['roles'])]}
+            steps.append({'id': s + 1, 'name': f'第{s + 1}步审批', 'type': 'approval', 'approvers': approvers})
+        templates.append(dict(id=t + 1, name=f'压测流程{t + 1}', description='压测流程', steps=json.dumps(steps),
+                              created_by=1, created_at=start, is_active=True))
+    _insert(WorkflowTemplate, templates)
+
+    statuses = [status for status, _ in STATUS_WEIGHTS]
+    weights = [weight for _, weight in STATUS_WEIGHTS]
+    instances, approvals, logs, system_logs = [], [], [], []
+    for i in range(scale['instances']):
+        instance_id = i + 1
+        status = rnd.choices(statuses, weights)[0]
+        creator = rnd.randint(2, scale['users']) if scale['users'] > 1 else 1
+        created_at = start + timedelta(seconds=rnd.randint(0, scale['history_days'] * 86400 - 3600))
+        if status == 'running':
+            done_steps = rnd.randint(0, scale['steps'] - 1)
+        elif status == 'completed':
+            done_steps = scale['steps']
+        elif status == 'rejected':
+            done_steps = rnd.randint(1, scale['steps'])
+        else:
+            done_steps = 0
+
+        moment = created_at
+        if status != 'pending':
+            logs.append(dict(instance_id=instance_id, user_id=creator, action='submit',
+                             message='提交工作流实例，开始流程', created_at=moment))
+        for step in range(1, done_steps + 1):
+            moment += timedelta(minutes=rnd.randint(5, 600))
+            action = 'reject' if status == 'rejected' and step == done_steps else 'approve'
+            approver = rnd.randint(1, scale['users'])
+            approvals.append(dict(instance_id=instance_id, step_id=step, approver_id=approver, action=action,
+                                  comment='同意' if action == 'approve' else '不同意', created_at=moment))
+            logs.append(dict(instance_id=instance_id, user_id=approver, action=action, step_id=step,
+                             message=f"{'批准' if action == 'approve' else '拒绝'}步骤 第{step}步审批",
+                             created_at=moment))
+            system_logs.append(dict(level='INFO', module='workflow', user_id=approver, ip_address='127.0.0.1',
+                                    message=f"工作流实例 #{instance_id} 步骤 {step}: {action}", created_at=moment))
+        if status == 'completed':
+            logs.append(dict(instance_id=instance_id, user_id=None, action='complete', message='工作流完成',
+                             created_at=moment))
+
+        instances.append(dict(
+            id=instance_id,
+            workflow_id=rnd.randint(1, scale['templates']),
+            title=f'压测申请 {instance_id}',
+            data=json.dumps({'amount': rnd.randint(100, 100000), 'reason': '压测数据'}, ensure_ascii=False),
+            status=status,
+            current_step=done_steps + 1 if status == 'running' else None,
+            created_by=creator,
+            created_at=created_at,
+            updated_at=moment,
+            completed_at=moment if status in ('completed', 'rejected') else None,
+            version=1,
+            needs_recovery=False
+        ))
+    _insert(WorkflowInstance, instances)
+    _insert(WorkflowApproval, approvals)
+    _insert(WorkflowLog, logs)
+    _insert(SystemLog, system_logs)
+
+    files, operations = [], []
+    if basedir:
+        upload_dir = os.path.join(basedir, 'uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        image = _sample_image()
+        file_path = os.path.join('uploads', 'bench-sample.png')
+        with open(os.path.join(basedir, file_path), 'wb') as f:
+            f.write(image)
+        for instance in instances:
+            if rnd.random() >= scale['file_ratio']:
+                continue
+            file_id = len(files) + 1
+            files.append(dict(id=file_id, original_filename=f'附件{file_id}.png', file_path=file_path,
+                              file_type='png', content_type='image/png', file_size=len(image),
+                              instance_id=instance['id'], created_by=instance['created_by'],
+                              created_at=instance['created_at'], is_deleted=False))
+            operations.append(dict(file_id=file_id, user_id=instance['created_by'], operation_type='upload',
+                                   operation_time=instance['created_at'],
+                                   operation_detail=json.dumps({'action': 'upload', 'instance_id': instance['id']})))
+            for _ in range(rnd.randint(0, 5)):
+                operations.append(dict(file_id=file_id, user_id=rnd.randint(1, scale['users']), operation_type='view',
+                                       operation_time=instance['updated_at'],
+                                       operation_detail=json.dumps({'action': 'view', 'instance_id': instance['id']})))
+        _insert(FileAttachment, files)
+        _insert(FileOperation, operations)
+
+    db.session.commit()
+
+    running = [(instance['id'], instance['current_step']) for instance in instances if instance['status'] == 'running']
+    return {
+        'scale': scale,
+        'seed': seed,
+        'admin_id': 1,
+        'manager_ids': [user['id'] for user in users if user['position'] == 'manager'],
+        'running': running,
+        'file_ids': [f['id'] for f in files],
+        'file_owners': {f['id']: f['created_by'] for f in files},
+        'instance_owners': {instance['id']: instance['created_by'] for instance in instances},
+        'counts': {
+            'users': len(users),
+            'instances': len(instances),
+            'approvals': len(approvals),
+            'workflow_logs': len(logs),
+            'system_logs': len(system_logs),
+            'files': len(files),
+            'file_operations': len(operations),
+        }
+    }
+
+
+def add_scale_arguments(parser):
+    """添加数据规模参数"""
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    for key, value in DEFAULT_SCALE.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value, dest=key)
+
+
+def scale_from_args(args):
+    return {key: getattr(args, key) for key in DEFAULT_SCALE}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成压测用的合成数据')
+    parser.add_argument('--database', default=None, help='数据库URL，默认在临时目录创建 SQLite 数据库')
+    parser.add_argument('--basedir', default=None, help='附件文件根目录，默认与数据库同目录')
+    parser.add_argument('--force', action='store_true', help='数据库中已有数据时仍然清空')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database = args.database or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    app = make_app(database)
+    with app.app_context():
+        try:
+            summary = generate(scale_from_args(args), seed=args.seed, basedir=args.basedir or workdir,
+                               force=args.force)
+        except DatabaseNotEmptyError as e:
+            parser.error(str(e))
+    print(f'数据库: {database}')
+    for name, count in summary['counts'].items():
+        print(f'{name}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+应用启动耗时压测脚本
+
+每次在新的解释器进程中导入 app 并调用 create_app，分别记录导入耗时和创建应用耗时，
+对应 gunicorn 不使用 --preload 时每个 worker 的冷启动时间（使用 --preload 时只有主进程付出导入耗时）。
+默认对比两种模式:
+    manifest    启动时只读取字体清单（默认配置，需先执行 flask fonts install）
+    font-check  FONT_CHECK_ON_STARTUP=1，每次启动检查字体并重新生成 fonts.css
+
+--importtime N 额外输出一次 -X importtime 中累计耗时最多的 N 个模块。
+
+用法:
+    python bench/startup_benchmark.py --runs 10
+    python bench/startup_benchmark.py --runs 10 --modes manifest --importtime 20 --save startup.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from common import percentile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'manifest': {},
+    'font-check': {'FONT_CHECK_ON_STARTUP': '1'},
+}
+
+# 子进程中执行: 分别计时导入和创建应用
+CHILD_SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app(sys.argv[1])
+created = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported}))
+"""
+
+
+def child_env(mode, workdir):
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'startup.db'),
+               PYTHONPATH=os.pathsep.join([ROOT_DIR, os.environ.get('PYTHONPATH', '')]))
+    env.pop('FONT_CHECK_ON_STARTUP', None)
+    env.pop('WORKFLOW_EVENT_WORKER_ENABLED', None)
+    env.update(MODES[mode])
+    return env
+
+
+def boot(mode, config_name, workdir):
+    """在新进程中启动一次应用，返回各阶段耗时（秒）"""
+    result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT, config_name], env=child_env(mode, workdir),
+                            cwd=workdir, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['total'] = timings['import'] + timings['create_app']
+    return timings
+
+
+def import_profile(config_name, workdir, top):
+    """用 -X importtime 统计一次启动中累计耗时最多的模块"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, config_name],
+                            env=child_env('manifest', workdir), cwd=workdir, capture_output=True, text=True,
+                            check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(':', 1)[1].split('|')]
+        modules.append((int(cumulative_us), int(self_us), name))
+    modules.sort(reverse=True)
+    return modules[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时压测')
+    parser.add_argument('--runs', type=int, default=10, help='每种模式启动的次数')
+    parser.add_argument('--modes', default=','.join(MODES), help='逗号分隔的模式: ' + ', '.join(MODES))
+    parser.add_argument('--config', default='production', help='create_app 使用的配置名称')
+    parser.add_argument('--importtime', type=int, default=0, help='输出导入耗时最多的模块数')
+    parser.add_argument('--save', help='保存结果的 JSON 文件')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    results = {}
+    for mode in [name.strip() for name in args.modes.split(',') if name.strip()]:
+        # 第一次启动用于预热文件系统缓存和 .pyc，不计入结果
+        boot(mode, args.config, workdir)
+        runs = [boot(mode, args.config, workdir) for _ in range(args.runs)]
+        results[mode] = {}
+        for phase in ('import', 'create_app', 'total'):
+            values = sorted(run[phase] for run in runs)
+            results[mode][phase] = {
+                'mean_ms': sum(values) / len(values) * 1000,
+                'p50_ms': percentile(values, 50) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+
+    print(f"{'模式':<12}{'阶段':<12}{'平均 ms':>10}{'p50 ms':>10}{'最大 ms':>10}")
+    for mode, phases in results.items():
+        for phase, stats in phases.items():
+            print(f"{mode:<12}{phase:<12}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+    if args.importtime:
+        print(f'\n导入耗时最多的 {args.importtime} 个模块（累计 ms / 自身 ms）:')
+        for cumulative_us, self_us, name in import_profile(args.config, workdir, args.importtime):
+            print(f'{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {name}')
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'runs': args.runs, 'config': args.config, 'results': results}, f, ensure_ascii=False,
+                      indent=2)
+        print(f'结果已保存到 {args.save}')
+
+
+if __name__ == '__main__':
+    main()
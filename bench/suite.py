@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+场景压测套件
+
+用 datagen 生成固定规模、固定随机种子的数据，通过 Flask 测试客户端依次执行各场景，
+输出每个场景的吞吐量和 p50/p95/p99 延迟。--save 保存结果作为基线，
+--baseline 与已保存的基线对比，便于衡量每次性能改动的效果。
+选中的场景因端点未注册而无法执行时以非零状态退出，避免把不完整的结果当作基线。
+
+场景:
+    pending_tasks   审批人（部门主管）查询待办列表
+    approve         管理员审批运行中的实例
+    instance_detail 查看实例详情（审批记录和历史）
+    file_view       查看带水印的图片附件
+    login           获取验证码并登录
+    admin_summary   管理员查看系统概览
+
+用法:
+    python bench/suite.py --iterations 200 --save baseline.json
+    python bench/suite.py --iterations 200 --baseline baseline.json
+    python bench/suite.py --scenarios pending_tasks,approve --instances 20000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from common import make_full_app, percentile
+from datagen import generate, add_scale_arguments, scale_from_args, BENCH_PASSWORD
+from app.auth.captcha import captcha_store
+
+SCENARIOS = {}
+
+
+def scenario(name, endpoint, user='admin'):
+    """
+    注册压测场景
+    :param name: 场景名称
+    :param endpoint: 场景依赖的视图端点，应用中不存在时跳过
+    :param user: 登录身份: admin 管理员、manager 部门主管、None 匿名
+    """
+    def decorator(f):
+        SCENARIOS[name] = {'name': name, 'endpoint': endpoint, 'user': user, 'run': f, 'doc': f.__doc__}
+        return f
+    return decorator
+
+
+@scenario('pending_tasks', 'workflow.get_tasks', user='manager')
+def pending_tasks(client, data, i):
+    """待办列表"""
+    return client.get('/api/workflow/tasks?per_page=20')
+
+
+@scenario('approve', 'workflow.approve_instance')
+def approve(client, data, i):
+    """审批运行中的实例，每次迭代消耗一个实例"""
+    instance_id, step_id = data['running'][i % len(data['running'])]
+    return client.post(f'/api/workflow/instances/{instance_id}/approve',
+                       json={'action': 'approve', 'comment': '压测审批', 'step_id': step_id})
+
+
+@scenario('instance_detail', 'workflow.get_instance')
+def instance_detail(client, data, i):
+    """实例详情"""
+    instance_id, _ = data['running'][i % len(data['running'])]
+    return client.get(f'/api/workflow/instances/{instance_id}')
+
+
+@scenario('file_view', 'file.file_content')
+def file_view(client, data, i):
+    """带查看水印的附件内容"""
+    return client.get(f"/content/{data['file_ids'][i % len(data['file_ids'])]}")
+
+
+@scenario('login', 'auth.login', user=None)
+def login(client, data, i):
+    """获取验证码后提交登录表单（两次请求）"""
+    client.cookie_jar.clear()
+    response = client.get('/auth/captcha')
+    if response.status_code >= 400:
+        return response
+    with client.session_transaction() as session:
+        captcha = captcha_store.get(session.get('captcha_id'), {}).get('text', '')
+    return client.post('/auth/login', data={'username': f'user{i % 50 + 2}', 'password': BENCH_PASSWORD,
+                                            'captcha': captcha})
+
+
+@scenario('admin_summary', 'api_admin.get_system_summary')
+def admin_summary(client, data, i):
+    """系统概览"""
+    return client.get('/api/admin/system/summary')
+
+
+def login_as(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def run_scenario(app, spec, data, iterations, warmup):
+    """
+    执行一个场景
+    :return: 结果字典；依赖的端点不存在时返回 skipped
+    """
+    if spec['endpoint'] not in app.view_functions:
+        return {'skipped': f"端点 {spec['endpoint']} 未注册"}
+
+    client = app.test_client()
+    if spec['user'] == 'admin':
+        login_as(client, data['admin_id'])
+    elif spec['user'] == 'manager':
+        login_as(client, data['manager_ids'][0])
+
+    for i in range(warmup):
+        try:
+            spec['run'](client, data, iterations + i)
+        except Exception:
+            pass
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        request_started = time.perf_counter()
+        try:
+            response = spec['run'](client, data, i)
+            if response.status_code >= 400:
+                errors += 1
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'throughput': iterations / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{'场景':<16}{'吞吐量/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'错误':>8}")
+    for name, result in results.items():
+        if 'skipped' in result:
+            print(f"{name:<16}跳过: {result['skipped']}")
+            continue
+        line = (f"{name:<16}{result['throughput']:>10.1f}{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}")
+        base = (baseline or {}).get(name)
+        if base and 'skipped' not in base and base.get('p95_ms'):
+            change = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100
+            line += f"   p95 相比基线 {change:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='场景压测套件')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔的场景名称')
+    parser.add_argument('--iterations', type=int, default=200, help='每个场景的迭代次数')
+    parser.add_argument('--warmup', type=int, default=10, help='每个场景的预热次数')
+    parser.add_argument('--save', help='保存结果的 JSON 文件')
+    parser.add_argument('--baseline', help='对比的基线 JSON 文件')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp()
+    app = make_full_app('sqlite:///' + os.path.join(workdir, 'suite.db'), BASEDIR=workdir,
+                        WORKFLOW_EVENT_WORKER_ENABLED=False)
+
+    with app.app_context():
+        started = time.perf_counter()
+        data = generate(scale_from_args(args), seed=args.seed, basedir=workdir)
+        print(f"生成数据 {time.perf_counter() - started:.1f}s: " +
+              ', '.join(f'{key} {value}' for key, value in data['counts'].items()))
+
+    results = {}
+    for name in names:
+        with app.app_context():
+            results[name] = run_scenario(app, SCENARIOS[name], data, args.iterations, args.warmup)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    skipped = [name for name, result in results.items() if 'skipped' in result]
+    if skipped:
+        print(f"以下场景未执行，不保存结果: {', '.join(skipped)}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'scale': data['scale'], 'seed': data['seed'], 'iterations': args.iterations,
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存到 {args.save}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,12 @@ from datetime import timedelta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def env_flag(name):
+    """读取布尔型环境变量，1/true/yes/on 为真，未设置或 0/false/no/off 为假"""
+    return (os.environ.get(name) or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 class Config:
     # 基本配置
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard-to-guess-string'
@@ -33,6 +39,7 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or MAIL_USERNAME
     
     # OAuth2配置
     OAUTH2_PROVIDERS = {
@@ -54,21 +61,109 @@ class Config:
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
     
+    # 字体配置
+    FONT_CHECK_ON_STARTUP = env_flag('FONT_CHECK_ON_STARTUP')  # 每次启动时检查字体并重新生成CSS，默认由 flask fonts install 完成
+    STATIC_VERSIONED_MAX_AGE = 365 * 24 * 60 * 60  # 带内容哈希版本号（?v=）的静态文件的浏览器缓存秒数
+    FONT_MIRROR_DIR = os.environ.get('FONT_MIRROR_DIR')  # 字体本地镜像目录（离线安装），下载前先从这里查找
+    FONT_DOWNLOAD_WORKERS = int(os.environ.get('FONT_DOWNLOAD_WORKERS') or 4)  # 字体并发下载数
+    FONT_SUBSET_ENABLED = not env_flag('FONT_SUBSET_DISABLED')  # 字体CSS按 unicode-range 分片引用 WOFF2 子集（需要 fontTools 和 brotli）
+    
     # 缓存配置
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
     
     # 流程配置
-    WORKFLOW_INSTANCE_TIMEOUT = 24 * 60 * 60  # 24小时
+    WORKFLOW_INSTANCE_TIMEOUT = 24 * 60 * 60  # 24小时，0表示不限制
+    WORKFLOW_INSTANCE_TIMEOUT_ACTION = os.environ.get('WORKFLOW_INSTANCE_TIMEOUT_ACTION') or 'remind'  # 流程超时处理: remind 提醒当前审批人, reject 自动拒绝
     MAX_WORKFLOW_STEPS = 20  # 最大步骤数
+    WORKFLOW_CONFLICT_RETRIES = 2  # 审批遇到并发版本冲突时的重试次数
+    WORKFLOW_BATCH_MAX_ITEMS = 200  # 批量审批单次最多处理的项数
+    
+    # 工作流事件配置（自动步骤和通知由事件分发器在请求之外处理）
+    WORKFLOW_EVENT_WORKER_ENABLED = env_flag('WORKFLOW_EVENT_WORKER_ENABLED')  # 是否在应用进程内运行分发线程（处理第一个请求时启动）
+    # background: 由分发线程或 flask events run 进程处理; inline: 请求提交后立即处理。
+    # 未设置时启用了进程内分发线程则为 background，否则为 inline，避免没有分发进程时事件无人处理
+    WORKFLOW_EVENT_DISPATCH = os.environ.get('WORKFLOW_EVENT_DISPATCH') or \
+        ('background' if WORKFLOW_EVENT_WORKER_ENABLED else 'inline')
+    WORKFLOW_EVENT_POLL_INTERVAL = 1  # 轮询其他进程写入事件的间隔（秒）
+    WORKFLOW_EVENT_BATCH_SIZE = 100  # 每次领取的事件数
+    WORKFLOW_EVENT_LEASE_SECONDS = 60  # 领取后的处理租约，超时未完成的事件会被重新领取
+    WORKFLOW_EVENT_MAX_ATTEMPTS = 5  # 最大处理次数，超过后标记为 failed
+    WORKFLOW_EVENT_RETENTION_DAYS = 7  # 已处理事件的保留天数
+    WORKFLOW_EVENT_PURGE_INTERVAL = 24 * 60 * 60  # 清理已处理事件的间隔（秒）
+    WORKFLOW_RECOVERY_BATCH_SIZE = 100  # 恢复任务每批检查的实例数
+    WORKFLOW_RECOVERY_MAX_BATCHES = 10  # 恢复任务每次运行最多处理的批数，未完成的从检查点继续
+    WORKFLOW_RECOVERY_INTERVAL = 5 * 60  # 恢复任务执行间隔（秒）
+    WORKFLOW_TIMER_TICK = 1  # 定时器时间轮刻度（秒）
+    WORKFLOW_TIMER_HORIZON = 60 * 60  # 只把该时长内到期的定时器加载到内存
+    WORKFLOW_TIMER_LOAD_INTERVAL = 30  # 加载新定时器的间隔（秒）
+    WORKFLOW_TIMER_POLL_INTERVAL = 30  # inline 模式下检查到期定时器的间隔（秒）
+    
+    # 日志保留与归档配置
+    LOG_ARCHIVE_FOLDER = os.environ.get('LOG_ARCHIVE_FOLDER') or os.path.join(basedir, 'archives')
+    LOG_RETENTION_DAYS = {  # 各日志表在主库中的保留天数，0表示不归档（工作流日志是实例的审批记录，不归档）
+        'system_logs': 90,
+        'login_logs': 180,
+        'file_operations': 365
+    }
+    LOG_ARCHIVE_BATCH_SIZE = 5000  # 每批归档行数
+    LOG_ARCHIVE_INTERVAL = 24 * 60 * 60  # 归档任务执行间隔（秒）
+    
+    # 后台任务配置
+    SCHEDULER_ENABLED = env_flag('SCHEDULER_ENABLED')  # 是否在应用进程内运行后台任务
+    
+    # 索引顾问配置（开发模式下分析每个接口的查询是否存在全表扫描）
+    INDEX_ADVISOR_ENABLED = env_flag('INDEX_ADVISOR_ENABLED')
+    INDEX_ADVISOR_IGNORE_TABLES = (  # 数据量很小、全表扫描可接受的表
+        'permissions', 'roles', 'roles_permissions', 'users_roles', 'departments'
+    )
+    
+    # 查询计数器配置（开发模式下统计每个请求的查询次数并检测 N+1 查询）
+    QUERY_COUNTER_ENABLED = env_flag('QUERY_COUNTER_ENABLED')
+    QUERY_COUNTER_N_PLUS_ONE_THRESHOLD = 5  # 同一语句以不同参数执行达到该次数时视为 N+1 查询
+    
+    # 性能指标配置（/metrics 以 Prometheus 文本格式导出，未启用时不采集）
+    METRICS_ENABLED = env_flag('METRICS_ENABLED')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # 采集端通过 Authorization: Bearer <token> 访问
+    METRICS_RESPONSE_HEADERS = env_flag('METRICS_RESPONSE_HEADERS')  # 在响应头返回数据库耗时和写锁等待（压测用）
+    
+    # 慢请求采样分析配置（采样耗时超过阈值的请求的调用栈，保存为折叠栈）
+    PROFILER_ENABLED = env_flag('PROFILER_ENABLED')
+    PROFILER_SLOW_THRESHOLD = float(os.environ.get('PROFILER_SLOW_THRESHOLD') or 1.0)  # 慢请求阈值（秒）
+    PROFILER_SAMPLE_INTERVAL = 0.01  # 采样间隔（秒）
+    PROFILER_MAX_DEPTH = 64  # 每个调用栈最多保留的帧数
+    PROFILER_RETENTION_DAYS = 7  # 采样记录保留天数
+    PROFILER_REDACT_PARAMS = []  # 除内置的令牌、密码等参数外，额外不保存值的参数名
+    PROFILER_PURGE_INTERVAL = 24 * 60 * 60  # 清理任务执行间隔（秒）
     
     # 高并发配置
-    POOL_SIZE = 10  # 数据库连接池大小
+    POOL_SIZE = int(os.environ.get('POOL_SIZE') or 10)  # 数据库连接池大小
+    POOL_MAX_OVERFLOW = int(os.environ.get('POOL_MAX_OVERFLOW') or 10)  # 连接池满时允许额外创建的连接数
     POOL_TIMEOUT = 10  # 数据库连接池超时时间
     POOL_RECYCLE = 3600  # 数据库连接回收时间
+    POOL_PRE_PING = True  # 借出连接前检测连接是否可用
+    SQLITE_JOURNAL_MODE = 'WAL'  # SQLite 日志模式，WAL 允许读写并发
+    SQLITE_BUSY_TIMEOUT = 5000  # SQLite 等待写锁的毫秒数
+    
+    # 只读副本配置（逗号分隔的数据库URL，仅用于 PostgreSQL/MySQL 部署）
+    SQLALCHEMY_REPLICA_URLS = [url.strip() for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',')
+                               if url.strip()]
+    REPLICA_MAX_LAG = 5  # 副本复制延迟超过该秒数时暂停使用
+    REPLICA_LAG_CHECK_INTERVAL = 5  # 检查副本延迟的间隔（秒）
+    REPLICA_STICKY_SECONDS = 10  # 用户写入后该时长内的读请求固定走主库
+    
+    # SQLite 生产模式（调整同步/缓存参数，串行化写事务，日志类写入走写队列组提交）
+    SQLITE_PRODUCTION_MODE = env_flag('SQLITE_PRODUCTION_MODE')
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_CACHE_SIZE = -64000  # 负数表示KB，约64MB
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 内存映射读取的字节数
+    WRITE_QUEUE_BATCH_SIZE = 200  # 每次组提交最多写入的记录数
+    WRITE_QUEUE_FLUSH_INTERVAL = 0.05  # 组提交等待更多记录的秒数
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    INDEX_ADVISOR_ENABLED = not env_flag('INDEX_ADVISOR_DISABLED')
+    QUERY_COUNTER_ENABLED = not env_flag('QUERY_COUNTER_DISABLED')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app-dev.db')
 
@@ -77,8 +172,10 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app-test.db')
     WTF_CSRF_ENABLED = False
+    WORKFLOW_EVENT_DISPATCH = 'inline'
 
 class ProductionConfig(Config):
+    SQLITE_PRODUCTION_MODE = not env_flag('SQLITE_PRODUCTION_MODE_DISABLED')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app-prod.db')
 
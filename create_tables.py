@@ -1,11 +1,28 @@
 from app import create_app, db
 from app.models import User, Role, Permission, Department, WorkflowTemplate, WorkflowInstance, WorkflowApproval, WorkflowLog, SystemLog, LoginLog
+from app.services.search_service import ensure_fulltext_index
+from app.services.schema_service import upgrade_schema
 
 app = create_app()
 with app.app_context():
     print("正在创建数据库表...")
-    db.create_all()
+    # 创建缺失的表，并为已有的表补建新增的列和索引
+    upgraded = upgrade_schema()
     print("数据库表创建完成")
+    if upgraded['columns']:
+        print(f"已补建列: {', '.join(upgraded['columns'])}")
+    if upgraded['backfilled']:
+        print(f"已回填空值: {', '.join(upgraded['backfilled'])}")
+    if upgraded['indexes']:
+        print(f"已补建索引: {', '.join(upgraded['indexes'])}")
+    # 新库在这里创建全部默认权限，已有数据库补建新增的权限
+    if upgraded['permissions']:
+        print(f"已补建权限: {', '.join(upgraded['permissions'])}")
+
+    # 创建日志全文索引
+    indexed_tables = ensure_fulltext_index()
+    if indexed_tables:
+        print(f"日志全文索引已就绪: {', '.join(indexed_tables)}")
 
     # 检查是否需要创建默认权限
     if Permission.query.count() == 0:
@@ -25,12 +25,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger('字体下载')
 
-def create_app():
-    """创建一个临时Flask应用实例"""
-    app = Flask(__name__)
+def create_app(mirror_dir=None, workers=4):
+    """创建一个临时Flask应用实例，静态目录和 instance 目录与正式应用一致"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    app = Flask(__name__,
+                static_folder=os.path.join(base_dir, 'app', 'static'),
+                instance_path=os.path.join(base_dir, 'instance'))
     app.config.from_mapping(
         SECRET_KEY='temp_key_for_font_download',
-        STATIC_FOLDER='app/static'
+        FONT_MIRROR_DIR=mirror_dir,
+        FONT_DOWNLOAD_WORKERS=workers
     )
     return app
 
@@ -40,19 +44,25 @@ def main():
     parser.add_argument('--all', action='store_true', help='下载所有字体')
     parser.add_argument('--css', action='store_true', help='只生成CSS文件')
     parser.add_argument('--category', type=str, help='指定要下载的字体类别')
+    parser.add_argument('--mirror', type=str, help='本地镜像目录，离线安装时从这里复制字体')
+    parser.add_argument('--workers', type=int, default=4, help='最大并发下载数')
     
     args = parser.parse_args()
-    print(f"解析参数: --all={args.all}, --css={args.css}, --category={args.category}")
+    print(f"解析参数: --all={args.all}, --css={args.css}, --category={args.category}, "
+          f"--mirror={args.mirror}, --workers={args.workers}")
     
     # 创建临时应用上下文
     try:
         print("创建Flask应用上下文...")
-        app = create_app()
+        app = create_app(args.mirror, args.workers)
         
         with app.app_context():
             print("正在导入font_manager...")
             # 动态导入字体管理器，避免循环导入
             from app.services.font_service import font_manager
+            from app.services.font_subset_service import font_subsetter
+            font_subsetter.init_app(app)
+            font_manager.init_app(app)
             
             # 确保目录存在
             font_dir = os.path.join(app.static_folder, 'fonts')
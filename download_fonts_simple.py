@@ -10,12 +10,13 @@ import os
 import sys
 import logging
 import time
-import zipfile
-import io
+import argparse
 import requests
 import warnings
 from datetime import datetime
 
+from app.utils.download_manager import DownloadManager
+
 # 设置日志格式
 logging.basicConfig(
     level=logging.INFO,
@@ -70,75 +71,32 @@ requests.packages.urllib3.disable_warnings()
 # Windows系统字体路径
 WINDOWS_FONT_PATH = 'C:\\Windows\\Fonts'
 
-def download_font(font_info):
-    """从网络下载字体文件
+# 下载缓存目录（未完成的 .part 文件），中断后再次运行时继续下载
+DOWNLOAD_CACHE_DIR = os.path.join('instance', 'font_downloads')
+
+def create_download_manager(mirror_dir=None, workers=4):
+    """创建下载管理器，不验证SSL证书以避免可能的SSL错误"""
+    return DownloadManager(FONT_DIR, DOWNLOAD_CACHE_DIR, mirror_dir=mirror_dir, workers=workers, verify_ssl=False,
+                           logger=logger)
+
+def download_font(font_info, mirror_dir=None):
+    """从镜像目录或网络下载字体文件
     
     Args:
-        font_info: 包含字体信息的字典，必须包含name、file字段，可选包含url和category字段
+        font_info: 包含字体信息的字典，必须包含name、file字段，可选包含url、category和sha256字段
+        mirror_dir: 本地镜像目录
         
     Returns:
         bool: 下载是否成功
     """
-    if 'url' not in font_info:
-        logger.error(f"缺少下载URL: {font_info.get('name', '未知字体')}")
-        return False
-        
-    target_path = os.path.join(FONT_DIR, font_info['file'])
-    
-    # 如果已存在，跳过下载
-    if os.path.exists(target_path):
-        logger.info(f"字体已存在，跳过下载: {font_info['name']} ({font_info['file']})")
-        return True
-    
-    logger.info(f"正在下载字体: {font_info['name']} ({font_info.get('category', '未分类')})")
-    
-    try:
-        # 获取文件扩展名
-        _, file_ext = os.path.splitext(font_info['url'])
-        
-        # 下载字体文件，不验证SSL证书以避免可能的SSL错误
-        response = requests.get(font_info['url'], stream=True, timeout=60, verify=False)
-        response.raise_for_status()  # 确保请求成功
-        
-        # 检查是否为压缩文件
-        if file_ext.lower() in ['.zip']:
-            # 解压缩文件并获取目标字体
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
-                font_filename = font_info['file']
-                # 查找压缩包中的字体文件
-                for file_info in zf.infolist():
-                    if file_info.filename.endswith(('.ttf', '.otf', '.ttc')) and os.path.basename(file_info.filename) == font_filename:
-                        # 发现目标字体
-                        with open(target_path, 'wb') as f:
-                            f.write(zf.read(file_info.filename))
-                        logger.info(f"从压缩包中提取并保存字体: {font_filename}")
-                        return True
-                
-                # 如果没有直接匹配，尝试找任何相关字体
-                for file_info in zf.infolist():
-                    if file_info.filename.endswith(('.ttf', '.otf', '.ttc')) and (
-                       font_info['name'].lower() in file_info.filename.lower() or
-                       os.path.splitext(font_filename)[0].lower() in file_info.filename.lower()):
-                        with open(target_path, 'wb') as f:
-                            f.write(zf.read(file_info.filename))
-                        logger.info(f"从压缩包中提取并保存字体: {file_info.filename} -> {font_filename}")
-                        return True
-                        
-                logger.error(f"在压缩包中未找到匹配的字体文件: {font_filename}")
-                return False
-        else:
-            # 直接保存字体文件
-            with open(target_path, 'wb') as f:
-                f.write(response.content)
-            logger.info(f"字体下载并保存成功: {font_info['file']}")
-            return True
-            
-    except Exception as e:
-        logger.error(f"下载字体失败 {font_info['name']}: {str(e)}")
-        return False
+    return create_download_manager(mirror_dir).download_all([font_info])[0]['success']
 
-def download_all_fonts():
-    """下载所有预定义的常用字体
+def download_all_fonts(mirror_dir=None, workers=4):
+    """并发下载所有预定义的常用字体
+    
+    Args:
+        mirror_dir: 本地镜像目录，离线安装时从这里复制字体
+        workers: 最大并发下载数
     
     Returns:
         tuple: (成功数量, 总数量, 错误信息列表)
@@ -147,14 +105,10 @@ def download_all_fonts():
     os.makedirs(FONT_DIR, exist_ok=True)
     os.makedirs(CSS_DIR, exist_ok=True)
     
-    success_count = 0
-    errors = []
-    
-    for font in OPEN_SOURCE_FONTS:
-        if download_font(font):
-            success_count += 1
-        else:
-            errors.append(f"下载失败: {font['name']} ({font['file']})")
+    results = create_download_manager(mirror_dir, workers).download_all(OPEN_SOURCE_FONTS)
+    success_count = sum(1 for result in results if result['success'])
+    errors = [f"下载失败: {result['name']} ({result['file']}): {result['error']}"
+              for result in results if not result['success']]
     
     # 如果成功，更新字体CSS
     if success_count > 0:
@@ -318,6 +272,11 @@ def copy_system_fonts():
     return success_count, len(system_fonts), errors
 
 def main():
+    parser = argparse.ArgumentParser(description='下载系统所需的开源字体资源')
+    parser.add_argument('--mirror', help='本地镜像目录，离线安装时从这里复制字体')
+    parser.add_argument('--workers', type=int, default=4, help='最大并发下载数')
+    args = parser.parse_args()
+    
     print("简化版字体下载工具启动...")
     
     # 确保目录存在
@@ -341,7 +300,7 @@ def main():
     print('开始下载开源字体资源...')
     start_time = time.time()
     
-    success_count, total_count, errors = download_all_fonts()
+    success_count, total_count, errors = download_all_fonts(args.mirror, args.workers)
     
     end_time = time.time()
     duration = end_time - start_time
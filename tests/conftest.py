@@ -0,0 +1,100 @@
+import os
+import tempfile
+import pytest
+from flask import Flask
+
+# 测试使用临时数据库，必须在导入配置之前设置
+_db_dir = tempfile.mkdtemp(prefix='workflow-tests-')
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(_db_dir, 'test.db'))
+
+from app import create_app, db
+from app.models import User, WorkflowTemplate, WorkflowInstance
+from app.services.font_service import FontManager
+from app.services.font_subset_service import font_subsetter
+from app.services.glyph_index import glyph_index
+
+pytest_plugins = ['app.utils.pytest_plugin']
+
+
+@pytest.fixture
+def app():
+    """每个测试使用新建的数据库，结束后删除（包括全文索引等不在模型中的表）"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    database = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '', 1)
+    if os.path.exists(database):
+        os.remove(database)
+
+
+@pytest.fixture
+def make_user(app):
+    def make(username, **kwargs):
+        user = User(username=username, email=f'{username}@example.com', **kwargs)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_instance(app):
+    """创建运行中的实例，停在第一个步骤（并行步骤时为各分支）"""
+    from app.services.workflow_service import enter_workflow_step
+
+    def make(steps, created_by, title='测试实例'):
+        workflow = WorkflowTemplate(name='测试流程', created_by=created_by)
+        workflow.set_steps(steps)
+        db.session.add(workflow)
+        db.session.flush()
+        instance = WorkflowInstance(workflow_id=workflow.id, title=title, status='running', created_by=created_by)
+        db.session.add(instance)
+        db.session.flush()
+        enter_workflow_step(instance, workflow.get_definition(), steps[0], created_by)
+        db.session.commit()
+        return instance
+    return make
+
+
+@pytest.fixture
+def make_font():
+    """用 fontTools 生成只包含指定字符的 TrueType 字体"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    def make(path, codepoints):
+        cmap = {codepoint: f'uni{codepoint:04X}' for codepoint in codepoints}
+        names = ['.notdef'] + sorted(cmap.values())
+        pen = TTGlyphPen(None)
+        pen.moveTo((0, 0))
+        pen.lineTo((0, 500))
+        pen.lineTo((500, 0))
+        pen.closePath()
+        glyph = pen.glyph()
+        builder = FontBuilder(1000, isTTF=True)
+        builder.setupGlyphOrder(names)
+        builder.setupCharacterMap(cmap)
+        builder.setupGlyf({name: glyph for name in names})
+        builder.setupHorizontalMetrics({name: (500, 0) for name in names})
+        builder.setupHorizontalHeader(ascent=800, descent=-200)
+        builder.setupNameTable({'familyName': 'Test', 'styleName': 'Regular'})
+        builder.setupOS2()
+        builder.setupPost()
+        builder.save(str(path))
+        return str(path)
+    return make
+
+
+@pytest.fixture
+def fonts(tmp_path, monkeypatch):
+    """绑定到临时静态目录和 instance 目录的字体管理器，字形索引和子集服务也临时绑定到该应用"""
+    app = Flask(__name__, static_folder=str(tmp_path / 'static'), instance_path=str(tmp_path / 'instance'))
+    app.config['FONT_SUBSET_ENABLED'] = True
+    monkeypatch.setattr(font_subsetter, 'app', app)
+    monkeypatch.setattr(glyph_index, 'app', app)
+    monkeypatch.setattr(glyph_index, '_fonts', None)
+    monkeypatch.setattr(glyph_index, '_checked', set())
+    return FontManager(app)
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import SystemLog
+from app.services import archive_service
+from app.services.archive_service import (archive_table, archive_expired_logs, query_archive, load_manifest,
+                                          extend_page_with_archive, newest_archived_time)
+
+
+@pytest.fixture
+def old_logs(app, tmp_path):
+    app.config['LOG_ARCHIVE_FOLDER'] = str(tmp_path)
+    base = datetime(2025, 1, 30)
+    # 跨两个月，最后两条在保留期内
+    db.session.add_all([SystemLog(level='INFO', message=f'Backup {i}', created_at=base + timedelta(days=i))
+                        for i in range(6)])
+    db.session.add_all([SystemLog(level='INFO', message='recent', created_at=datetime.utcnow())
+                        for _ in range(2)])
+    db.session.commit()
+    return base
+
+
+def test_archive_moves_rows_to_monthly_files(old_logs):
+    assert archive_table('system_logs', old_logs + timedelta(days=30), batch_size=4) == 6
+    assert SystemLog.query.count() == 2
+
+    files = load_manifest('system_logs')['files']
+    assert sorted({entry['month'] for entry in files}) == ['2025-01', '2025-02']
+    assert sum(entry['rows'] for entry in files) == 6
+    assert newest_archived_time('system_logs') == old_logs + timedelta(days=5)
+
+
+def test_query_archive_round_trip(old_logs):
+    archive_table('system_logs', old_logs + timedelta(days=30))
+
+    records = query_archive('system_logs')
+    assert [record['message'] for record in records] == [f'Backup {i}' for i in range(5, -1, -1)]
+    assert records[0]['level'] == 'INFO'
+
+    records = query_archive('system_logs', start=old_logs + timedelta(days=2), end=old_logs + timedelta(days=3))
+    assert [record['message'] for record in records] == ['Backup 3', 'Backup 2']
+
+    before = (records[0]['_time'], records[0]['id'])
+    assert [record['message'] for record in query_archive('system_logs', before=before, limit=2)] == \
+        ['Backup 2', 'Backup 1']
+
+
+def test_archive_keyword_is_case_insensitive_like_the_database(old_logs):
+    archive_table('system_logs', old_logs + timedelta(days=30))
+    assert len(query_archive('system_logs', keyword='backup 1')) == 1
+    assert len(query_archive('system_logs', keyword='BACKUP')) == 6
+
+
+def test_archive_is_idempotent_after_interrupted_delete(old_logs):
+    archive_table('system_logs', old_logs + timedelta(days=30))
+    # 再次归档同一批记录（例如上次写入文件后删除前中断）不会重复登记
+    db.session.add(SystemLog(id=1, level='INFO', message='Backup 0', created_at=old_logs))
+    db.session.commit()
+    archive_table('system_logs', old_logs + timedelta(days=30))
+    assert sum(entry['rows'] for entry in load_manifest('system_logs')['files']) == 7
+
+
+def test_cursor_page_continues_into_archive(old_logs):
+    archive_table('system_logs', old_logs + timedelta(days=30))
+    items = [log.to_dict() for log in SystemLog.query.order_by(SystemLog.created_at.desc(), SystemLog.id.desc())]
+    page_info = {'next_cursor': None, 'has_more': False, 'per_page': 5}
+
+    items, page_info = extend_page_with_archive('system_logs', items, page_info, 5)
+    assert [item['message'] for item in items] == ['recent', 'recent', 'Backup 5', 'Backup 4', 'Backup 3']
+    assert page_info['has_more'] and items[-1]['archived']
+
+    rest, page_info = extend_page_with_archive('system_logs', [], {'next_cursor': None, 'has_more': False},
+                                               5, cursor=page_info['next_cursor'])
+    assert [item['message'] for item in rest] == ['Backup 2', 'Backup 1', 'Backup 0']
+    assert not page_info['has_more']
+
+
+def test_workflow_logs_are_not_archived(old_logs):
+    assert 'workflow_logs' not in archive_service.ARCHIVE_TABLES
+    assert 'workflow_logs' not in archive_expired_logs(retention_days=1)
@@ -0,0 +1,80 @@
+import pytest
+from app.models import WorkflowApproval
+from app.services.workflow_service import process_workflow_steps_batch
+from app.utils.query_counter import query_counter
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {'users': []}},
+    {'id': 2, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+@pytest.fixture
+def approver(make_user):
+    user = make_user('approver')
+    STEPS[0]['approvers']['users'] = [user.id]
+    return user
+
+
+def test_batch_reports_each_item(approver, make_instance):
+    first = make_instance(STEPS, approver.id)
+    second = make_instance(STEPS, approver.id)
+    third = make_instance(STEPS, approver.id)
+
+    results = process_workflow_steps_batch([
+        {'instance_id': first.id, 'step_id': 1, 'action': 'approve'},
+        {'instance_id': str(second.id), 'step_id': 1, 'action': 'reject', 'comment': '材料不全'},
+        {'instance_id': 'abc', 'step_id': 1},
+        {'instance_id': 99999, 'step_id': 1},
+        {'instance_id': third.id, 'step_id': 2},
+        {'instance_id': third.id, 'step_id': 1, 'action': 'delete'},
+        {'instance_id': first.id, 'step_id': 1},
+    ], approver.id)
+
+    assert [result['success'] for result in results] == [True, True, False, False, False, False, False]
+    assert [result.get('error') for result in results[2:]] == ['invalid', 'not_found', 'invalid', 'invalid',
+                                                               'invalid']
+    assert first.current_step == 2
+    assert second.status == 'rejected'
+    assert third.current_step == 1
+    assert WorkflowApproval.query.count() == 2
+
+
+def test_approver_without_permission_is_forbidden(approver, make_user, make_instance):
+    instance = make_instance(STEPS, approver.id)
+    other = make_user('other')
+
+    results = process_workflow_steps_batch([{'instance_id': instance.id, 'step_id': 1}], other.id)
+    assert results[0]['error'] == 'forbidden'
+    assert instance.current_step == 1
+
+
+def test_broken_definition_only_skips_its_item(approver, make_instance):
+    good = make_instance(STEPS, approver.id)
+    broken = make_instance([STEPS[0], {'id': 2, 'name': '会签', 'type': 'parallel', 'branches': []}],
+                           approver.id)
+
+    results = process_workflow_steps_batch([
+        {'instance_id': good.id, 'step_id': 1},
+        {'instance_id': broken.id, 'step_id': 1},
+    ], approver.id)
+
+    assert results[0]['success'] and results[1]['error'] == 'invalid'
+    assert good.current_step == 2
+    assert broken.current_step == 1
+    assert WorkflowApproval.query.filter_by(instance_id=broken.id).count() == 0
+
+
+def test_batch_reads_do_not_grow_with_items(app, approver, make_instance):
+    # 事件留给分发器处理，只统计批量审批本身的查询
+    app.config['WORKFLOW_EVENT_DISPATCH'] = 'background'
+
+    def count_selects(size):
+        items = [{'instance_id': make_instance(STEPS, approver.id).id, 'step_id': 1} for _ in range(size)]
+        with query_counter.record() as recorder:
+            results = process_workflow_steps_batch(items, approver.id)
+        assert all(result['success'] for result in results)
+        return sum(1 for statement, _ in recorder.statements if statement.lstrip().upper().startswith('SELECT'))
+
+    # 实例按版本号逐行更新，读取的查询次数与批量大小无关
+    assert count_selects(10) == count_selects(2)
@@ -0,0 +1,35 @@
+from datetime import datetime
+from app import db
+from app.models import (
+    WorkflowInstance, WorkflowApproval, WorkflowLog, WorkflowEvent, WorkflowTimer, WorkflowToken
+)
+from app.services.workflow_service import process_workflow_step
+
+STEPS = [{'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}}]
+
+
+def test_delete_removes_dependent_rows(app, make_user, make_instance):
+    admin = make_user('admin', is_admin=True)
+    instance = make_instance(STEPS, admin.id)
+    other = make_instance(STEPS, admin.id, title='保留的实例')
+    process_workflow_step(instance.id, 1, 'approve', admin.id)
+    for target in (instance, other):
+        db.session.add(WorkflowTimer(instance_id=target.id, timer_type='instance.timeout', due_at=datetime.utcnow()))
+        db.session.add(WorkflowToken(instance_id=target.id, split_step_id=1, branch_step_id=1, status='arrived'))
+    db.session.commit()
+    assert WorkflowInstance.query.get(instance.id).status == 'completed'
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    response = client.delete(f'/api/workflow/instances/{instance.id}')
+    assert response.status_code == 200, response.get_json()
+
+    assert WorkflowInstance.query.get(instance.id) is None
+    for model in (WorkflowApproval, WorkflowLog, WorkflowEvent, WorkflowTimer, WorkflowToken):
+        assert model.query.filter_by(instance_id=instance.id).count() == 0
+        assert model.query.filter(model.instance_id.is_(None)).count() == 0
+    # 其他实例的记录不受影响
+    assert WorkflowTimer.query.filter_by(instance_id=other.id).count() == 1
+    assert WorkflowEvent.query.filter_by(instance_id=other.id).count() >= 1
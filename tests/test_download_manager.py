@@ -0,0 +1,200 @@
+import io
+import os
+import hashlib
+import threading
+import zipfile
+import pytest
+import requests
+from app.utils import download_manager
+from app.utils.download_manager import DownloadManager
+
+FONT = b'\x00\x01\x00\x00' + bytes(range(256)) * 1024
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None, break_after=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.break_after = break_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} 错误', response=self)
+
+    def iter_content(self, chunk_size):
+        body = self.body if self.break_after is None else self.body[:self.break_after]
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+        if self.break_after is not None:
+            raise requests.ConnectionError('连接中断')
+
+
+class FakeServer:
+    """代替 requests 会话，按URL返回文件内容，支持 Range 请求"""
+
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.requests = []
+        self.break_after = {}  # url: 下一次响应在多少字节后中断
+        self.barrier = None
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, **kwargs):
+        offset = (headers or {}).get('Range')
+        with self._lock:
+            self.requests.append((url, offset))
+        if self.barrier:
+            self.barrier.wait()
+        if url not in self.files:
+            return FakeResponse(404)
+        body = self.files[url]
+        break_after = self.break_after.pop(url, None)
+        if offset and self.ranges:
+            start = int(offset[len('bytes='):-1])
+            if start >= len(body):
+                return FakeResponse(416, headers={'Content-Range': f'bytes */{len(body)}'})
+            return FakeResponse(206, body[start:], {'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'},
+                                break_after)
+        return FakeResponse(200, body, {'Content-Length': str(len(body))}, break_after)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer({})
+    monkeypatch.setattr(DownloadManager, '_session', lambda self: server)
+    monkeypatch.setattr(download_manager.time, 'sleep', lambda seconds: None)
+    return server
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return DownloadManager(str(tmp_path / 'fonts'), str(tmp_path / 'cache'), workers=4)
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _item(name, url=None, **kwargs):
+    return dict(name=name, file=f'{name}.ttf', url=url or f'https://fonts.example.com/{name}.ttf', **kwargs)
+
+
+def test_download_verifies_and_installs(manager, server):
+    server.files['https://fonts.example.com/Roboto.ttf'] = FONT
+
+    result = manager.download_all([_item('Roboto', sha256=_sha256(FONT))])[0]
+
+    assert (result['success'], result['source']) == (True, 'network')
+    assert _read(os.path.join(manager.dest_dir, 'Roboto.ttf')) == FONT
+    # 下载完成的缓存文件在安装后删除
+    assert os.listdir(manager.cache_dir) == []
+    # 已存在且校验通过的字体不再下载
+    assert manager.download_all([_item('Roboto', sha256=_sha256(FONT))])[0]['source'] == 'existing'
+    assert len(server.requests) == 1
+
+
+def test_interrupted_download_resumes_with_range(manager, server):
+    url = 'https://fonts.example.com/Roboto.ttf'
+    server.files[url] = FONT
+    server.break_after[url] = 100000
+
+    result = manager.download_all([_item('Roboto')])[0]
+
+    assert result['success']
+    assert server.requests == [(url, None), (url, 'bytes=100000-')]
+    assert _read(os.path.join(manager.dest_dir, 'Roboto.ttf')) == FONT
+
+
+def test_partial_file_from_earlier_run_is_continued(manager, server):
+    url = 'https://fonts.example.com/Roboto.ttf'
+    server.files[url] = FONT
+    server.break_after[url] = 100000
+    manager.retries = 1
+    assert not manager.download_all([_item('Roboto')])[0]['success']
+
+    assert manager.download_all([_item('Roboto')])[0]['success']
+    assert server.requests[-1] == (url, 'bytes=100000-')
+    assert _read(os.path.join(manager.dest_dir, 'Roboto.ttf')) == FONT
+
+
+def test_server_without_range_support_restarts(manager, server):
+    url = 'https://fonts.example.com/Roboto.ttf'
+    server.files[url] = FONT
+    server.ranges = False
+    server.break_after[url] = 100000
+
+    assert manager.download_all([_item('Roboto')])[0]['success']
+    assert _read(os.path.join(manager.dest_dir, 'Roboto.ttf')) == FONT
+
+
+@pytest.mark.parametrize('body, sha256', [
+    (FONT, _sha256(b'other')),
+    (b'<html>404 Not Found</html>', None),
+])
+def test_failed_check_installs_nothing(manager, server, body, sha256):
+    server.files['https://fonts.example.com/Roboto.ttf'] = body
+
+    result = manager.download_all([_item('Roboto', sha256=sha256)])[0]
+
+    assert not result['success']
+    assert os.listdir(manager.dest_dir) == []
+    # 校验失败的下载被删除，下次重新下载
+    assert os.listdir(manager.cache_dir) == []
+
+
+def test_client_errors_are_not_retried(manager, server):
+    result = manager.download_all([_item('Missing')])[0]
+
+    assert not result['success'] and '404' in result['error']
+    assert len(server.requests) == 1
+
+
+def test_mirror_is_used_before_network(manager, server, tmp_path):
+    mirror = tmp_path / 'mirror'
+    mirror.mkdir()
+    (mirror / 'Roboto.ttf').write_bytes(FONT)
+    manager.mirror_dir = str(mirror)
+
+    assert manager.download_all([_item('Roboto')])[0]['source'] == 'mirror'
+    assert server.requests == []
+
+
+def test_archive_is_downloaded_once_for_several_fonts(manager, server):
+    url = 'https://fonts.example.com/family.zip'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('family/Sans-Regular.ttf', FONT)
+        zf.writestr('family/Serif-Regular.ttf', FONT[:1000])
+    server.files[url] = buffer.getvalue()
+
+    results = manager.download_all([_item('Sans-Regular', url), _item('Serif-Regular', url)])
+
+    assert [result['success'] for result in results] == [True, True]
+    assert server.requests == [(url, None)]
+    assert _read(os.path.join(manager.dest_dir, 'Serif-Regular.ttf')) == FONT[:1000]
+
+
+def test_downloads_run_in_parallel(manager, server):
+    items = [_item(f'Font{i}') for i in range(3)]
+    for item in items:
+        server.files[item['url']] = FONT
+    # 三个请求同时进行时才能通过屏障
+    server.barrier = threading.Barrier(3, timeout=5)
+
+    results = manager.download_all(items)
+
+    assert [result['file'] for result in results] == ['Font0.ttf', 'Font1.ttf', 'Font2.ttf']
+    assert all(result['success'] for result in results)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import WorkflowEvent, WorkflowInstance
+from app.services.event_service import event_dispatcher, emit_event
+from app.services.workflow_service import process_workflow_step
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}},
+    {'id': 2, 'name': '自动归档', 'type': 'auto'},
+    {'id': 3, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', is_admin=True)
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """临时注册测试用的事件处理函数"""
+    monkeypatch.setattr(event_dispatcher, 'handlers', dict(event_dispatcher.handlers))
+    return event_dispatcher.handlers
+
+
+def _statuses(instance_id):
+    return {event.status for event in WorkflowEvent.query.filter_by(instance_id=instance_id)}
+
+
+def test_inline_dispatch_runs_auto_steps_after_commit(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+
+    process_workflow_step(instance.id, 1, 'approve', admin.id)
+
+    assert WorkflowInstance.query.get(instance.id).current_step == 3
+    assert _statuses(instance.id) == {'done'}
+
+
+def test_background_dispatch_leaves_events_queued(app, admin, make_instance):
+    app.config['WORKFLOW_EVENT_DISPATCH'] = 'background'
+    instance = make_instance(STEPS, admin.id)
+
+    process_workflow_step(instance.id, 1, 'approve', admin.id)
+    assert WorkflowInstance.query.get(instance.id).current_step == 2
+    assert 'pending' in _statuses(instance.id)
+
+    assert event_dispatcher.dispatch_pending() >= 1
+    assert WorkflowInstance.query.get(instance.id).current_step == 3
+    assert _statuses(instance.id) == {'done'}
+
+
+def test_failed_event_is_retried_then_flags_recovery(app, admin, make_instance, handlers):
+    app.config['WORKFLOW_EVENT_MAX_ATTEMPTS'] = 2
+    instance = make_instance(STEPS, admin.id)
+    event_dispatcher.dispatch_pending()
+    calls = []
+
+    def fail(event):
+        event_dispatcher.after_done(lambda: calls.append(event.id))
+        raise RuntimeError('处理失败')
+    handlers['test.fail'] = fail
+    emit_event(instance.id, 'test.fail')
+    db.session.commit()
+
+    event_dispatcher.dispatch_pending(instance.id)
+    event = WorkflowEvent.query.filter_by(event_type='test.fail').one()
+    assert (event.status, event.attempts) == ('pending', 1)
+    assert event.available_at > datetime.utcnow()
+
+    event.available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    event_dispatcher.dispatch_pending(instance.id)
+
+    event = WorkflowEvent.query.filter_by(event_type='test.fail').one()
+    assert event.status == 'failed' and event.last_error == '处理失败'
+    assert WorkflowInstance.query.get(instance.id).needs_recovery
+    # 处理失败时登记的操作被丢弃
+    assert calls == []
+
+
+def test_after_done_runs_once_event_is_committed(admin, make_instance, handlers):
+    instance = make_instance(STEPS, admin.id)
+    event_dispatcher.dispatch_pending()
+    seen = []
+
+    def handle(event):
+        event_dispatcher.after_done(lambda: seen.append(WorkflowEvent.query.get(event.id).status))
+        assert seen == []
+    handlers['test.ok'] = handle
+    emit_event(instance.id, 'test.ok')
+    db.session.commit()
+
+    assert event_dispatcher.dispatch_pending(instance.id) == 1
+    assert seen == ['done']
+
+
+def test_expired_lease_is_claimed_again(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    event = WorkflowEvent.query.filter_by(instance_id=instance.id, status='pending').one()
+    # 模拟处理进程在领取后中断
+    event.status = 'processing'
+    event.attempts = 1
+    event.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert event_dispatcher.dispatch_pending(instance.id) == 1
+    event = WorkflowEvent.query.get(event.id)
+    assert (event.status, event.attempts) == ('done', 2)
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import pytest
+from app.services import font_service
+from app.services.font_service import FontManager
+
+LATIN = range(0x20, 0x7F)
+
+
+@pytest.fixture
+def scans(fonts, monkeypatch):
+    """记录字体目录扫描次数和计算哈希的文件"""
+    record = {'scans': 0, 'hashed': []}
+    scan_fonts = FontManager._scan_fonts
+    file_hash = font_service._file_hash
+
+    def counting_scan(self, *args):
+        record['scans'] += 1
+        return scan_fonts(self, *args)
+
+    def counting_hash(path):
+        record['hashed'].append(os.path.basename(path))
+        return file_hash(path)
+    monkeypatch.setattr(FontManager, '_scan_fonts', counting_scan)
+    monkeypatch.setattr(font_service, '_file_hash', counting_hash)
+    return record
+
+
+def _touch_dir(path):
+    # 文件系统时间精度不足时，确保目录修改时间发生变化
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+
+
+def _css(fonts):
+    with open(os.path.join(fonts.app.static_folder, 'css', 'fonts.css'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_font_urls_carry_content_hash(fonts, make_font):
+    path = make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+    with open(path, 'rb') as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    url = fonts.get_font_url('arial.ttf')
+
+    assert url == f'/static/fonts/arial.ttf?v={version}'
+    assert url in _css(fonts)
+    assert fonts.get_font_url('missing.ttf') == '/static/fonts/missing.ttf'
+    with open(fonts.get_manifest_path(), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['fonts']['arial.ttf']['coverage'] == {'codepoints': len(LATIN), 'latin': True, 'cjk': False}
+    assert fonts.get_css_url() == f"/static/css/fonts.css?v={manifest['css_hash'][:12]}"
+
+
+def test_manifest_refreshes_only_when_font_dir_changes(fonts, make_font, scans):
+    make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+    fonts.get_manifest()
+    assert scans['scans'] == 1
+
+    fonts.get_manifest()
+    fonts.get_font_url('arial.ttf')
+    assert scans['scans'] == 1
+
+    make_font(os.path.join(fonts.get_font_dir(), 'verdana.ttf'), LATIN)
+    _touch_dir(fonts.get_font_dir())
+    manifest = fonts.get_manifest()
+
+    assert scans['scans'] == 2
+    assert set(manifest['fonts']) == {'arial.ttf', 'verdana.ttf'}
+    # 大小和修改时间未变的字体不重新计算哈希
+    assert scans['hashed'] == ['arial.ttf', 'verdana.ttf']
+
+
+def test_other_process_reuses_manifest_file(fonts, make_font, scans):
+    make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+    fonts.get_manifest()
+
+    other = FontManager(fonts.app)
+
+    assert other.get_manifest()['fonts'].keys() == {'arial.ttf'}
+    assert scans['scans'] == 1
+
+
+def test_css_is_rewritten_only_when_content_changes(fonts, make_font):
+    make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+    fonts.get_manifest()
+    css_path = os.path.join(fonts.app.static_folder, 'css', 'fonts.css')
+    inode = os.stat(css_path).st_ino
+
+    fonts.refresh_manifest(force=True)
+    assert os.stat(css_path).st_ino == inode
+
+    make_font(os.path.join(fonts.get_font_dir(), 'simhei.ttf'), [0x4E00, 0x4E01])
+    _touch_dir(fonts.get_font_dir())
+    fonts.get_manifest()
+
+    # 新内容写入临时文件后原子替换，不留下临时文件
+    assert os.stat(css_path).st_ino != inode
+    assert "font-family: 'SimHei'" in _css(fonts)
+    assert [name for name in os.listdir(os.path.dirname(css_path)) if name.startswith('.tmp-')] == []
+
+
+def test_versioned_static_files_are_cached_long_term(fonts, make_font):
+    make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+    client = fonts.app.test_client()
+
+    response = client.get(fonts.get_font_url('arial.ttf'))
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 60 * 60
+    response.close()
+
+    response = client.get('/static/fonts/arial.ttf')
+    assert not response.cache_control.immutable
+    response.close()
@@ -0,0 +1,91 @@
+import os
+import random
+from app.services.font_subset_service import (FontSubsetter, font_subsetter, slice_of, format_unicode_range,
+                                              parse_unicode_range, plan_slices)
+
+LATIN = set(range(0x20, 0x7F))
+CJK = {ord(char) for char in '的一是在不了有和人这'}
+
+
+def _version(fonts, font_file):
+    return fonts.get_manifest()['fonts'][font_file]['hash'][:12]
+
+
+def test_slice_of():
+    assert slice_of(ord('A')) == 'latin'
+    assert slice_of(0x0101) == 'latin-ext'
+    assert slice_of(ord('的')) == 'cjk-1'
+    assert slice_of(ord(bytes([0xD8, 0xA1]).decode('gb2312'))) == 'cjk-2'
+    assert slice_of(0x3400) == 'cjk-ext-00'
+    # 扩展B区排在基本区和兼容区之后
+    assert slice_of(0x20000) == 'cjk-ext-06'
+    assert slice_of(0xE000) == 'other'
+
+
+def test_unicode_range_round_trip():
+    assert format_unicode_range({0x41, 0x42, 0x43, 0x61}) == 'U+41-43, U+61'
+    assert format_unicode_range(set()) == ''
+    codepoints = set(random.Random(0).sample(range(0x20, 0x30000), 2000)) | LATIN
+    assert parse_unicode_range(format_unicode_range(codepoints)) == codepoints
+
+
+def test_plan_slices_partitions_the_font():
+    cmap = LATIN | CJK | {0x0101, 0x3400, 0x20000, 0xE000}
+
+    slices = plan_slices(cmap)
+
+    assert list(slices) == ['latin', 'latin-ext', 'cjk-1', 'cjk-ext-00', 'cjk-ext-06', 'other']
+    parsed = [parse_unicode_range(value) for value in slices.values()]
+    assert set().union(*parsed) == cmap
+    assert sum(len(codepoints) for codepoints in parsed) == len(cmap)
+
+
+def test_css_references_subsets_by_unicode_range(fonts, make_font):
+    make_font(os.path.join(fonts.get_font_dir(), 'simhei.ttf'), LATIN | CJK)
+    version = _version(fonts, 'simhei.ttf')
+    with open(os.path.join(fonts.app.static_folder, 'css', 'fonts.css'), encoding='utf-8') as f:
+        css = f.read()
+
+    assert f"url('/fonts/subset/simhei.ttf/{version}/latin.woff2') format('woff2')" in css
+    assert f"unicode-range: {format_unicode_range(CJK)};" in css
+
+    # 关闭子集后重新生成只引用完整字体的CSS
+    fonts.app.config['FONT_SUBSET_ENABLED'] = False
+    assert fonts.get_manifest()['subsets'] is False
+    with open(os.path.join(fonts.app.static_folder, 'css', 'fonts.css'), encoding='utf-8') as f:
+        assert 'unicode-range' not in f.read()
+
+
+def test_subset_is_generated_once(fonts, make_font, monkeypatch):
+    from fontTools.ttLib import TTFont
+    make_font(os.path.join(fonts.get_font_dir(), 'simhei.ttf'), LATIN | CJK)
+    version = _version(fonts, 'simhei.ttf')
+    generated = []
+    generate = FontSubsetter._generate
+    monkeypatch.setattr(FontSubsetter, '_generate',
+                        lambda self, *args: generated.append(args[2]) or generate(self, *args))
+
+    path = fonts.get_subset('simhei.ttf', version, 'cjk-1')
+    assert fonts.get_subset('simhei.ttf', version, 'cjk-1') == path
+
+    assert generated == [path]
+    font = TTFont(path)
+    assert font.flavor == 'woff2'
+    assert set(font.getBestCmap()) == CJK
+    font.close()
+    assert fonts.get_subset('simhei.ttf', 'outdated', 'cjk-1') is None
+    assert fonts.get_subset('simhei.ttf', version, 'greek-cyrillic') is None
+
+
+def test_changed_font_purges_old_subsets(fonts, make_font):
+    path = make_font(os.path.join(fonts.get_font_dir(), 'simhei.ttf'), LATIN | CJK)
+    subset = fonts.get_subset('simhei.ttf', _version(fonts, 'simhei.ttf'), 'latin')
+
+    make_font(path, LATIN)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    fonts.refresh_manifest(force=True)
+
+    assert not os.path.exists(os.path.dirname(subset))
+    assert list(fonts.get_manifest()['fonts']['simhei.ttf']['slices']) == ['latin']
+    assert os.listdir(font_subsetter.get_cache_dir()) == []
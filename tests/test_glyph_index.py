@@ -0,0 +1,94 @@
+import os
+import logging
+import pytest
+from app.services import font_service, glyph_index as glyph_index_module
+from app.services.glyph_index import CoverageBitmap, GlyphIndex, glyph_index
+
+LATIN = range(0x20, 0x7F)
+CJK = [ord(char) for char in '张三审批']
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """记录用 fontTools 解析过的字体"""
+    paths = []
+    read_codepoints = glyph_index_module.read_codepoints
+
+    def counting_read(path):
+        paths.append(os.path.basename(path))
+        return read_codepoints(path)
+    monkeypatch.setattr(glyph_index_module, 'read_codepoints', counting_read)
+    monkeypatch.setattr(font_service, 'read_codepoints', counting_read)
+    return paths
+
+
+def test_coverage_bitmap():
+    bitmap = CoverageBitmap.from_codepoints([0x41, 0x4E00, 0x20000])
+
+    assert 0x41 in bitmap and 0x4E00 in bitmap and 0x20000 in bitmap
+    assert 0x42 not in bitmap and 0x30000 not in bitmap
+    assert len(bitmap) == 3
+    # 空白和控制字符不计入缺字
+    assert bitmap.missing('A 一\n\t') == 0
+    assert bitmap.missing('AB一丁') == 2
+    loaded = CoverageBitmap.load(bitmap.dump(), len(bitmap))
+    assert loaded.bits == bitmap.bits and len(loaded) == 3
+    assert not len(CoverageBitmap.from_codepoints([]))
+
+
+def test_select_prefers_first_font_covering_the_text(fonts, make_font, tmp_path):
+    latin = make_font(tmp_path / 'latin.ttf', LATIN)
+    partial = make_font(tmp_path / 'partial.ttf', list(LATIN) + CJK[:2])
+    full = make_font(tmp_path / 'full.ttf', list(LATIN) + CJK)
+    broken = tmp_path / 'broken.ttf'
+    broken.write_bytes(b'not a font')
+    missing = str(tmp_path / 'missing.ttf')
+
+    assert glyph_index.select('Hello', [missing, str(broken), latin, full]) == (latin, 0)
+    assert glyph_index.select('审批 approved', [latin, partial, full]) == (full, 0)
+    # 没有完全覆盖的字体时返回缺字最少的字体
+    assert glyph_index.select('张三审批', [latin, partial]) == (partial, 2)
+    assert glyph_index.select('张三', [missing, str(broken)]) == (None, None)
+
+
+def test_index_is_persisted_and_reused(fonts, make_font, tmp_path, parsed):
+    path = make_font(tmp_path / 'latin.ttf', LATIN)
+    assert 0x41 in glyph_index.get_coverage(path)
+    assert os.path.exists(glyph_index.get_index_path())
+
+    # 新进程读取索引文件，不再解析字体
+    other = GlyphIndex(fonts.app)
+    assert len(other.get_coverage(path)) == len(LATIN)
+    assert parsed == ['latin.ttf']
+
+
+def test_changed_font_is_parsed_again(fonts, make_font, tmp_path, parsed):
+    path = make_font(tmp_path / 'font.ttf', LATIN)
+    glyph_index.get_coverage(path)
+
+    make_font(path, CJK)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    other = GlyphIndex(fonts.app)
+
+    assert other.select('张三', [path]) == (os.path.abspath(path), 0)
+    assert parsed == ['font.ttf', 'font.ttf']
+
+
+def test_scanned_fonts_are_indexed_without_parsing_again(fonts, make_font, parsed):
+    path = make_font(os.path.join(fonts.get_font_dir(), 'simhei.ttf'), list(LATIN) + CJK)
+
+    assert fonts.select_font('张三 审批') == path
+
+    assert parsed == ['simhei.ttf']
+
+
+def test_missing_glyphs_are_reported_once_per_font(fonts, make_font, caplog):
+    make_font(os.path.join(fonts.get_font_dir(), 'arial.ttf'), LATIN)
+
+    with caplog.at_level(logging.DEBUG, logger='app.services.font_service'):
+        fonts.select_font('张三')
+        fonts.select_font('审批')
+
+    levels = [record.levelno for record in caplog.records if '缺少' in record.getMessage()]
+    assert levels == [logging.WARNING, logging.DEBUG]
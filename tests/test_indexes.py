@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+from app import db
+from app.models import WorkflowLog, WorkflowInstance
+from app.services.index_service import ensure_indexes
+from app.utils.index_advisor import index_advisor
+from config import env_flag
+
+
+def _statement(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    return str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)
+
+
+def test_ensure_indexes_recreates_missing_index(app):
+    assert ensure_indexes() == []
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP INDEX ix_workflow_logs_instance_id_created_at'))
+    assert ensure_indexes() == ['ix_workflow_logs_instance_id_created_at']
+
+
+def test_hot_queries_use_indexes(app):
+    queries = [
+        WorkflowLog.query.filter_by(instance_id=1).order_by(WorkflowLog.created_at),
+        WorkflowInstance.query.filter_by(status='running').order_by(WorkflowInstance.updated_at.desc()),
+        WorkflowInstance.query.filter_by(created_by=1).order_by(WorkflowInstance.created_at.desc()),
+    ]
+    for query in queries:
+        assert index_advisor.find_full_scans(db.engine, *_statement(query)) == []
+
+
+def test_advisor_reports_full_scan(app):
+    query = WorkflowLog.query.filter(WorkflowLog.message.contains('x'))
+    assert index_advisor.find_full_scans(db.engine, *_statement(query)) == ['workflow_logs']
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1', True), ('true', True), (' On ', True), ('yes', True),
+    ('0', False), ('false', False), ('off', False), ('', False), (None, False),
+])
+def test_env_flag(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv('SOME_FEATURE_DISABLED', raising=False)
+    else:
+        monkeypatch.setenv('SOME_FEATURE_DISABLED', value)
+    assert env_flag('SOME_FEATURE_DISABLED') is expected
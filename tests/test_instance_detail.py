@@ -0,0 +1,34 @@
+import pytest
+from app import db
+from app.models import WorkflowApproval, WorkflowLog
+from app.services.workflow_service import get_instance_detail
+
+STEPS = [{'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}}]
+
+
+@pytest.fixture
+def instance(make_user, make_instance):
+    creator = make_user('creator', full_name='发起人')
+    instance = make_instance(STEPS, creator.id)
+    for i in range(8):
+        approver = make_user(f'approver{i}')
+        db.session.add(WorkflowApproval(instance_id=instance.id, step_id=1, approver_id=approver.id,
+                                        action='approve'))
+        db.session.add(WorkflowLog(instance_id=instance.id, user_id=approver.id, action='approve', step_id=1,
+                                   message='批准'))
+    db.session.commit()
+    db.session.refresh(instance)
+    return instance
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_instance_detail_query_budget(instance, query_budget, compact):
+    with query_budget(6):
+        detail = get_instance_detail(instance, compact=compact)
+
+    assert len(detail['approvals']) == 8
+    assert detail['instance']['active_steps'] == [1]
+    assert [entry['username'] for entry in detail['history']] == [f'approver{i}' for i in range(8)]
+    assert all(approval['approver_name'].startswith('approver') for approval in detail['approvals'])
+    if not compact:
+        assert detail['instance']['creator']['full_name'] == '发起人'
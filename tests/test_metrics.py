@@ -0,0 +1,79 @@
+import pytest
+from flask import Flask
+from flask_login import LoginManager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from app.utils.metrics import Metrics, Counter, Histogram
+
+
+@pytest.fixture
+def metrics_app():
+    """启用指标的最小应用，请求中执行两条数据库语句"""
+    app = Flask(__name__)
+    app.config.update(METRICS_ENABLED=True, METRICS_RESPONSE_HEADERS=True, METRICS_TOKEN='secret')
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: None)
+    engine = create_engine('sqlite://')
+
+    @app.route('/items')
+    def items():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            conn.execute(text('SELECT 2'))
+        return 'ok'
+
+    registry = Metrics(app)
+    yield app, registry
+    event.remove(Engine, 'before_cursor_execute', registry._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', registry._after_cursor_execute)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', '耗时', ('endpoint',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, endpoint='a')
+    assert list(histogram.samples()) == [
+        'latency_bucket{endpoint="a",le="0.1"} 1',
+        'latency_bucket{endpoint="a",le="1"} 2',
+        'latency_bucket{endpoint="a",le="+Inf"} 3',
+        'latency_sum{endpoint="a"} 5.55',
+        'latency_count{endpoint="a"} 3',
+    ]
+
+
+def test_counter_escapes_label_values():
+    counter = Counter('hits', '次数', ('path',))
+    counter.inc(path='a"b')
+    counter.inc(2, path='a"b')
+    assert list(counter.samples()) == ['hits{path="a\\"b"} 3']
+    assert list(Counter('empty', '无标签').samples()) == ['empty 0']
+
+
+def test_disabled_registry_ignores_records():
+    registry = Metrics()
+    registry.inc('file_uploads_total')
+    registry.observe('file_processing_seconds', 1, operation='pdf')
+
+    @registry.timed('file_processing_seconds', operation='pdf')
+    def work():
+        return 'done'
+    assert work() == 'done'
+    assert 'file_uploads_total 0' in registry.render()
+    assert 'file_processing_seconds_count' not in registry.render()
+
+
+def test_request_metrics_and_export(metrics_app):
+    app, registry = metrics_app
+    client = app.test_client()
+
+    response = client.get('/items')
+    assert response.headers['X-DB-Queries'] == '2'
+    assert float(response.headers['X-DB-Time']) > 0
+    client.get('/missing')
+
+    assert client.get('/metrics').status_code == 403
+    exported = client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+    assert 'http_requests_total{method="GET",endpoint="items",status="200"} 1' in exported
+    assert 'http_requests_total{method="GET",endpoint="unmatched",status="404"} 1' in exported
+    assert 'http_request_queries_bucket{endpoint="items",le="2"} 1' in exported
+    assert '# TYPE http_request_duration_seconds histogram' in exported
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm.exc import StaleDataError
+from app import db
+from app.models import WorkflowInstance, WorkflowApproval
+from app.services.workflow_service import process_workflow_step, WorkflowConflictError
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}},
+    {'id': 2, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', is_admin=True)
+
+
+def _concurrent_update(instance_id):
+    """模拟另一个请求在本会话读取实例之后更新了它"""
+    with db.engine.begin() as conn:
+        conn.execute(text('UPDATE workflow_instances SET version = version + 1 WHERE id = :id'),
+                     {'id': instance_id})
+
+
+def test_stale_version_is_detected(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    version = instance.version
+    _concurrent_update(instance.id)
+
+    instance.title = '修改标题'
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+    db.session.rollback()
+    assert WorkflowInstance.query.get(instance.id).version == version + 1
+
+
+def test_conflict_is_retried_with_fresh_instance(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    _concurrent_update(instance.id)
+
+    process_workflow_step(instance.id, 1, 'approve', admin.id)
+    assert instance.current_step == 2
+    assert WorkflowApproval.query.filter_by(instance_id=instance.id).count() == 1
+
+
+def test_conflict_without_commit_leaves_transaction_to_caller(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    _concurrent_update(instance.id)
+
+    with pytest.raises(WorkflowConflictError):
+        process_workflow_step(instance.id, 1, 'approve', admin.id, commit=False)
+    db.session.rollback()
+    assert WorkflowApproval.query.count() == 0
+
+
+def test_step_handled_by_other_request_is_a_conflict(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    # 另一个请求已经处理了步骤1
+    with db.engine.begin() as conn:
+        conn.execute(text('UPDATE workflow_instances SET version = version + 1, current_step = 2 WHERE id = :id'),
+                     {'id': instance.id})
+
+    with pytest.raises(WorkflowConflictError):
+        process_workflow_step(instance.id, 1, 'approve', admin.id)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from app import db
+from app.models import LoginLog, User
+from app.services.schema_service import backfill_not_null
+from app.utils.pagination import keyset_paginate, encode_cursor, InvalidCursorError
+from app.utils.query_counter import query_counter
+
+
+def _all_pages(sort_column, descending, per_page=2):
+    items, cursor = [], None
+    while True:
+        page = keyset_paginate(LoginLog.query, sort_column, LoginLog.id, cursor=cursor, per_page=per_page,
+                               descending=descending)
+        items.extend(log.id for log in page.items)
+        cursor = page.next_cursor
+        if not cursor:
+            return items
+
+
+@pytest.fixture
+def logs(app):
+    base = datetime(2026, 1, 1)
+    # 排序值有重复，翻页需要靠 id 区分
+    db.session.add_all([LoginLog(username=f'user{i}', status='success', created_at=base + timedelta(days=i % 3))
+                        for i in range(11)])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_keyset_pages_match_offset_order(logs, descending):
+    offset_order = [log.id for log in LoginLog.query.order_by(
+        LoginLog.created_at.desc() if descending else LoginLog.created_at.asc(),
+        LoginLog.id.desc() if descending else LoginLog.id.asc())]
+
+    assert _all_pages(LoginLog.created_at, descending) == offset_order
+    assert len(offset_order) == 11
+
+
+def test_keyset_on_primary_key(logs):
+    assert _all_pages(LoginLog.id, False, per_page=3) == sorted(log.id for log in LoginLog.query)
+
+
+def test_cursor_must_match_sort(logs):
+    cursor = encode_cursor('username', True, 'user3', 4)
+    with pytest.raises(InvalidCursorError):
+        keyset_paginate(LoginLog.query, LoginLog.created_at, LoginLog.id, cursor=cursor)
+    with pytest.raises(InvalidCursorError):
+        keyset_paginate(LoginLog.query, LoginLog.created_at, LoginLog.id, cursor='not-a-cursor')
+
+
+def test_nullable_sort_column_is_rejected(app):
+    with pytest.raises(InvalidCursorError):
+        keyset_paginate(User.query, User.username, User.id)
+
+
+def test_next_page_reads_composite_index(logs):
+    first = keyset_paginate(LoginLog.query, LoginLog.created_at, LoginLog.id, per_page=3)
+    with query_counter.record() as recorder:
+        keyset_paginate(LoginLog.query, LoginLog.created_at, LoginLog.id, cursor=first.next_cursor, per_page=3)
+    statement, parameters = recorder.statements[0]
+
+    plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(
+        f'EXPLAIN QUERY PLAN {statement}', parameters))
+    assert 'TEMP B-TREE' not in plan
+    assert 'SEARCH login_logs USING INDEX ix_login_logs_created_at_id' in plan
+
+
+def test_upgrade_backfills_null_sort_values(app):
+    # 模拟升级前 created_at 可为空的旧表
+    db.session.remove()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE login_logs'))
+        conn.execute(text('CREATE TABLE login_logs (id INTEGER PRIMARY KEY, user_id INTEGER, username VARCHAR(64), '
+                          'status VARCHAR(16), ip_address VARCHAR(64), user_agent VARCHAR(256), created_at DATETIME)'))
+        conn.execute(text("INSERT INTO login_logs (username, created_at) VALUES ('old', NULL)"))
+
+    assert 'login_logs.created_at' in backfill_not_null()
+    assert LoginLog.query.filter(LoginLog.created_at.is_(None)).count() == 0
+    assert backfill_not_null() == []
@@ -0,0 +1,76 @@
+import pytest
+from app import db
+from app.models import Role, Department
+from app.services.workflow_service import get_user_pending_tasks
+from app.utils.query_counter import query_counter
+
+
+@pytest.fixture
+def people(make_user):
+    role = Role(name='财务')
+    sales, hr = Department(name='销售部', code='sales'), Department(name='人事部', code='hr')
+    db.session.add_all([role, sales, hr])
+    db.session.commit()
+    users = {
+        'admin': make_user('admin', is_admin=True),
+        'direct': make_user('direct'),
+        'finance': make_user('finance'),
+        'manager': make_user('manager', position='Sales Manager', department_id=sales.id),
+        'other_manager': make_user('other_manager', position='HR Manager', department_id=hr.id),
+        'staff': make_user('staff', department_id=sales.id),
+    }
+    users['finance'].roles.append(role)
+    db.session.commit()
+    users['role_id'] = role.id
+    return users
+
+
+def _pending(user):
+    tasks, total = get_user_pending_tasks(user.id, per_page=100)
+    assert total == len(tasks)
+    return {task['title'] for task in tasks}
+
+
+def test_pending_tasks_follow_step_approvers(people, make_instance):
+    serial = [
+        {'id': 1, 'name': '指定人审批', 'type': 'approval', 'approvers': {'users': [people['direct'].id]}},
+        {'id': 2, 'name': '财务审批', 'type': 'approval', 'approvers': {'roles': [people['role_id']]}},
+    ]
+    parallel = [
+        {'id': 1, 'name': '会签', 'type': 'parallel', 'branches': [2, 3]},
+        {'id': 2, 'name': '财务', 'type': 'approval', 'approvers': {'roles': [people['role_id']]},
+         'transitions': [{'target': 4}]},
+        {'id': 3, 'name': '主管', 'type': 'approval', 'approvers': {'department_manager': True},
+         'transitions': [{'target': 4}]},
+        {'id': 4, 'name': '汇聚', 'type': 'join'},
+    ]
+    make_instance(serial, people['staff'].id, title='串行')
+    make_instance(parallel, people['staff'].id, title='并行')
+    finished = make_instance(serial, people['staff'].id, title='已结束')
+    finished.status = 'completed'
+    db.session.commit()
+
+    assert _pending(people['admin']) == {'串行', '并行'}
+    assert _pending(people['direct']) == {'串行'}
+    # 串行流程尚未到达财务步骤，并行流程的财务分支处于活动状态
+    assert _pending(people['finance']) == {'并行'}
+    # 部门主管只审批本部门员工发起的流程
+    assert _pending(people['manager']) == {'并行'}
+    assert _pending(people['other_manager']) == set()
+    assert _pending(people['staff']) == set()
+
+
+def test_pending_task_queries_do_not_grow_with_instances(people, make_instance):
+    steps = [{'id': 1, 'name': '财务审批', 'type': 'approval', 'approvers': {'roles': [people['role_id']]}}]
+    for i in range(3):
+        make_instance(steps, people['staff'].id, title=f'实例{i}')
+    db.session.expire_all()
+    with query_counter.record() as few:
+        assert get_user_pending_tasks(people['finance'].id, per_page=1)[1] == 3
+
+    for i in range(20):
+        make_instance(steps, people['staff'].id, title=f'更多{i}')
+    db.session.expire_all()
+    with query_counter.record() as many:
+        assert get_user_pending_tasks(people['finance'].id, per_page=1)[1] == 23
+    assert many.count == few.count
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app import db
+from app.services.db_service import build_engine_options, InstrumentedQueuePool, get_pool_stats
+
+CONFIG = {'POOL_SIZE': 3, 'POOL_MAX_OVERFLOW': 2, 'POOL_TIMEOUT': 7, 'POOL_RECYCLE': 600, 'SQLITE_BUSY_TIMEOUT': 2000}
+
+
+def test_server_databases_get_queue_pool_settings():
+    options = build_engine_options(CONFIG, make_url('postgresql://db/app'))
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert (options['pool_size'], options['max_overflow'], options['pool_timeout'], options['pool_recycle']) == \
+        (3, 2, 7, 600)
+    assert options['pool_pre_ping'] is True
+
+
+def test_sqlite_file_shares_pooled_connections_across_threads():
+    options = build_engine_options(CONFIG, make_url('sqlite:////tmp/app.db'))
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['connect_args'] == {'timeout': 2.0, 'check_same_thread': False}
+    assert build_engine_options(CONFIG, make_url('sqlite://')) == {}
+
+
+def test_pool_records_checkouts_overflow_and_timeouts(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=InstrumentedQueuePool, pool_size=1,
+                           max_overflow=1, pool_timeout=0.05, connect_args={'check_same_thread': False})
+    first = engine.connect()
+    second = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    first.close()
+    second.close()
+
+    metrics = engine.pool.metrics.to_dict()
+    assert metrics['checkouts'] == 2
+    assert metrics['connects'] == 2
+    assert metrics['overflow_max'] == 1
+    assert metrics['timeouts'] == 1 and metrics['wait_time_max'] >= 0.05
+
+
+def test_app_engine_uses_configured_pool(app):
+    db.session.execute(text('SELECT 1'))
+    stats = get_pool_stats()['default']
+    assert stats['pool_class'] == 'InstrumentedQueuePool'
+    assert stats['size'] == app.config['POOL_SIZE']
+    assert stats['checkouts'] >= 1
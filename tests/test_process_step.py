@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import WorkflowInstance, WorkflowApproval, WorkflowLog
+from app.services.workflow_service import process_workflow_step
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}},
+    {'id': 2, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', is_admin=True)
+
+
+@pytest.fixture
+def commits(app):
+    """记录会话提交次数"""
+    counter = []
+    session = db.session()
+
+    def record(session):
+        counter.append(1)
+    event.listen(session, 'after_commit', record)
+    yield counter
+    event.remove(session, 'after_commit', record)
+
+
+def _logs(instance_id):
+    return WorkflowLog.query.filter_by(instance_id=instance_id, step_id=1).count()
+
+
+def test_step_is_processed_in_one_commit(app, admin, make_instance, commits):
+    # 事件留在队列中，只统计步骤处理本身的提交
+    app.config['WORKFLOW_EVENT_DISPATCH'] = 'background'
+    instance = make_instance(STEPS, admin.id)
+    commits.clear()
+
+    result = process_workflow_step(instance.id, 1, 'approve', admin.id, comment='同意')
+
+    assert len(commits) == 1
+    assert result['next_step']['id'] == 2
+    assert WorkflowInstance.query.get(instance.id).current_step == 2
+    assert WorkflowApproval.query.filter_by(instance_id=instance.id).one().comment == '同意'
+    assert _logs(instance.id) == 1
+
+
+def test_failed_step_writes_nothing(admin, make_user, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    outsider = make_user('outsider')
+
+    with pytest.raises(ValueError):
+        process_workflow_step(instance.id, 1, 'approve', outsider.id)
+
+    assert WorkflowInstance.query.get(instance.id).current_step == 1
+    assert WorkflowApproval.query.count() == 0
+    assert _logs(instance.id) == 0
+
+
+def test_without_commit_the_caller_owns_the_transaction(admin, make_instance, commits):
+    instance = make_instance(STEPS, admin.id)
+    commits.clear()
+
+    process_workflow_step(instance.id, 1, 'approve', admin.id, commit=False)
+    assert commits == []
+    db.session.rollback()
+
+    assert WorkflowInstance.query.get(instance.id).current_step == 1
+    assert WorkflowApproval.query.count() == 0
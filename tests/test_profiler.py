@@ -0,0 +1,44 @@
+import json
+import threading
+from app.models import RequestProfile
+from app.utils.profiler import SlowRequestProfiler, _ActiveRequest, redact_params, REDACTED
+
+
+def test_sensitive_params_are_redacted():
+    params = {'t': ['abc'], 'AccessToken': ['x'], 'new_password': ['p'], 'page': ['2'], 'keyword': ['报销'],
+              'ticket': ['9']}
+    assert redact_params(params, extra={'ticket'}) == {
+        't': REDACTED, 'AccessToken': REDACTED, 'new_password': REDACTED, 'page': ['2'], 'keyword': ['报销'],
+        'ticket': REDACTED,
+    }
+
+
+def test_sample_collects_current_stack(app):
+    profiler = SlowRequestProfiler()
+    profiler._root = ''
+    active = profiler._active[threading.get_ident()] = _ActiveRequest()
+
+    profiler.sample()
+
+    assert active.samples == 1
+    (stack, count), = active.stacks.items()
+    assert count == 1 and stack.split(';')[-1].startswith('sample (')
+    assert 'test_sample_collects_current_stack' in stack
+
+
+def test_saved_profile_keeps_only_param_names_of_secrets(app):
+    profiler = SlowRequestProfiler()
+    profiler.redact = frozenset({'ticket'})
+    active = _ActiveRequest()
+    active.stacks = {'outer;inner': 3}
+    active.samples = 3
+
+    with app.test_request_context('/auth/reset-password/secret-reset-token?t=abc&page=2&ticket=9&access_token=zz'):
+        profiler._save(active, 1.5, 200)
+
+    profile = RequestProfile.query.one()
+    params = json.loads(profile.params)
+    assert params['view_args'] == {'token': REDACTED}
+    assert params['args'] == {'t': REDACTED, 'page': ['2'], 'ticket': REDACTED, 'access_token': REDACTED}
+    assert 'secret-reset-token' not in profile.path and profile.path.endswith(REDACTED)
+    assert (profile.duration_ms, profile.sample_count, profile.stacks) == (1500, 3, 'outer;inner 3')
@@ -0,0 +1,48 @@
+import pytest
+from app import db
+from app.models import User
+from app.utils.query_counter import query_counter
+
+
+def test_record_counts_nested_blocks(make_user):
+    make_user('alice')
+    with query_counter.record() as outer:
+        User.query.filter_by(username='alice').first()
+        with query_counter.record() as inner:
+            User.query.count()
+    assert outer.count == 2
+    assert inner.count == 1
+
+
+def test_repeated_statement_with_different_params_is_n_plus_one(make_user):
+    ids = [make_user(f'user{i}').id for i in range(6)]
+    db.session.expire_all()
+    with query_counter.record() as recorder:
+        for user_id in ids:
+            db.session.query(User.username).filter(User.id == user_id).scalar()
+        # 参数相同的重复查询不算 N+1
+        for _ in range(6):
+            User.query.count()
+    repeated = recorder.repeated(5)
+    assert len(repeated) == 1 and repeated[0][1] == 6
+
+
+def test_query_budget_fails_over_budget(make_user, query_budget):
+    make_user('alice')
+    with query_budget(2):
+        User.query.count()
+    with pytest.raises(pytest.fail.Exception, match='超过预算'):
+        with query_budget(1):
+            User.query.count()
+            User.query.count()
+
+
+def test_query_budget_reports_n_plus_one(make_user, query_budget):
+    ids = [make_user(f'user{i}').id for i in range(6)]
+    with pytest.raises(pytest.fail.Exception, match='N\\+1'):
+        with query_budget(100):
+            for user_id in ids:
+                db.session.query(User.username).filter(User.id == user_id).scalar()
+    with query_budget(100, allow_n_plus_one=True):
+        for user_id in ids:
+            db.session.query(User.username).filter(User.id == user_id).scalar()
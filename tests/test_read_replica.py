@@ -0,0 +1,77 @@
+import pytest
+from flask import session as flask_session
+from app import db
+from app.models import SystemLog
+from app.services.db_service import replica_router, use_read_replica
+from app.utils.security import generate_jwt_token
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    """以另一个 SQLite 文件充当只读副本"""
+    path = str(tmp_path / 'replica.db')
+    app.config['SQLALCHEMY_BINDS'] = {'replica_0': f'sqlite:///{path}'}
+    replica_router._status.clear()
+    replica_router._last_writes.clear()
+    yield path
+    db.get_engine(app, 'replica_0').dispose()
+    app.config['SQLALCHEMY_BINDS'] = None
+    replica_router._status.clear()
+    replica_router._last_writes.clear()
+
+
+def _bearer(user_id):
+    return {'Authorization': f'Bearer {generate_jwt_token(user_id)}'}
+
+
+def _read_bind(app, headers=None):
+    # 每个请求使用独立的应用上下文（独立的 g），与真实请求一致
+    with app.app_context(), app.test_request_context('/', method='GET', headers=headers or {}):
+        use_read_replica()
+        return db.session.get_bind().url.database
+
+
+def _write(app, method='POST', headers=None, replica_read=False):
+    with app.app_context(), app.test_request_context('/', method=method, headers=headers or {}):
+        if replica_read:
+            use_read_replica()
+        db.session.add(SystemLog(level='INFO', module='test', message='写入'))
+        db.session.commit()
+        return db.session.get_bind().url.database
+
+
+def test_read_only_get_uses_replica(app, replica):
+    assert _read_bind(app) == replica
+    assert _read_bind(app, _bearer(1)) == replica
+
+
+def test_jwt_client_reads_own_writes_from_primary(app, replica):
+    primary = db.engine.url.database
+    _write(app, headers=_bearer(1))
+
+    assert _read_bind(app, _bearer(1)) == primary
+    # 其他用户和匿名请求不受影响
+    assert _read_bind(app, _bearer(2)) == replica
+    assert _read_bind(app) == replica
+
+
+def test_stickiness_expires(app, replica):
+    _write(app, headers=_bearer(1))
+    replica_router._last_writes['user:1'] -= app.config['REPLICA_STICKY_SECONDS'] + 1
+    assert _read_bind(app, _bearer(1)) == replica
+
+
+def test_write_within_request_pins_later_reads(app, replica):
+    primary = db.engine.url.database
+    # 匿名请求无法跨请求识别，但同一请求中写入后的读取仍走主库
+    assert _write(app, method='GET', replica_read=True) == primary
+    assert _read_bind(app) == replica
+
+
+def test_web_session_and_jwt_share_user_stickiness(app, replica):
+    primary = db.engine.url.database
+    with app.app_context(), app.test_request_context('/', method='POST'):
+        flask_session['_user_id'] = '1'
+        db.session.add(SystemLog(level='INFO', module='test', message='网页写入'))
+        db.session.commit()
+    assert _read_bind(app, _bearer(1)) == primary
@@ -0,0 +1,72 @@
+from datetime import timedelta
+import pytest
+from app import db
+from app.models import WorkflowInstance, WorkflowApproval, WorkflowEvent
+from app.services.workflow_service import mark_instances_for_recovery, recover_workflows
+
+STEPS = [
+    {'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}},
+    {'id': 2, 'name': '财务审批', 'type': 'approval', 'approvers': {}},
+]
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', is_admin=True)
+
+
+def test_unapplied_approval_is_replayed(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    # 审批记录已提交，但实例状态未推进
+    db.session.add(WorkflowApproval(instance_id=instance.id, step_id=1, approver_id=admin.id, action='approve',
+                                    created_at=instance.updated_at + timedelta(seconds=1)))
+    db.session.commit()
+    mark_instances_for_recovery([instance.id])
+
+    result = recover_workflows()
+
+    assert (result['examined'], result['recovered'], result['failed']) == (1, 1, 0)
+    instance = WorkflowInstance.query.get(instance.id)
+    assert instance.current_step == 2 and not instance.needs_recovery
+    assert result['run']['status'] == 'completed' and result['pending'] == 0
+
+
+def test_stuck_auto_step_gets_a_new_event(app, admin, make_instance):
+    app.config['WORKFLOW_EVENT_DISPATCH'] = 'background'
+    instance = make_instance([{'id': 1, 'name': '自动归档', 'type': 'auto'}] + STEPS[1:], admin.id)
+    WorkflowEvent.query.filter_by(instance_id=instance.id).update({'status': 'failed'})
+    db.session.commit()
+    mark_instances_for_recovery([instance.id])
+
+    assert recover_workflows()['recovered'] == 1
+    assert WorkflowEvent.query.filter_by(instance_id=instance.id, status='pending', step_id=1).count() == 1
+
+
+def test_recovery_resumes_from_checkpoint(app, admin, make_instance):
+    app.config['WORKFLOW_RECOVERY_BATCH_SIZE'] = 1
+    ids = [make_instance(STEPS, admin.id, title=f'实例{i}').id for i in range(3)]
+    make_instance(STEPS, admin.id, title='未标记')
+    mark_instances_for_recovery(ids)
+
+    first = recover_workflows(max_batches=2)
+    assert first['examined'] == 2
+    assert first['run']['status'] == 'running' and first['run']['checkpoint_id'] == ids[1]
+
+    second = recover_workflows(max_batches=2)
+    assert second['examined'] == 1
+    assert second['run']['status'] == 'completed' and second['run']['examined'] == 3
+    # 没有标记的实例时不创建新的恢复任务
+    assert recover_workflows()['examined'] == 0
+
+
+def test_broken_instance_stays_marked(admin, make_instance):
+    instance = make_instance(STEPS, admin.id)
+    instance.current_step = 99
+    db.session.commit()
+    mark_instances_for_recovery([instance.id])
+
+    result = recover_workflows()
+
+    assert result['failed'] == 1
+    assert WorkflowInstance.query.get(instance.id).needs_recovery
+    assert '步骤ID 99 不存在' in result['run']['last_error']
@@ -0,0 +1,33 @@
+from app import db
+from app.models import Permission, Role
+from app.services.schema_service import ensure_permissions, upgrade_schema
+
+
+def test_missing_permissions_are_added_once(app):
+    admin_role = Role(name='管理员')
+    user_role = Role(name='普通用户')
+    db.session.add_all([admin_role, user_role])
+    for name in ('workflow_view', 'workflow_approval'):
+        permission = Permission(name=name, description=name)
+        db.session.add(permission)
+        admin_role.add_permission(permission)
+    user_role.add_permission(Permission.query.filter_by(name='workflow_view').first())
+    db.session.commit()
+
+    added = upgrade_schema()['permissions']
+    assert Permission.WORKFLOW_INSTANCE_DELETE in added
+    assert 'workflow_view' not in added
+    assert ensure_permissions() == []
+
+    db.session.expire_all()
+    names = {permission.name for permission in Permission.query}
+    assert Permission.WORKFLOW_INSTANCE_DELETE in names and len(names) == len(added) + 2
+    # 拥有全部权限的角色获得新增的权限，其他角色不变
+    assert admin_role.permissions.filter_by(name=Permission.WORKFLOW_INSTANCE_DELETE).count() == 1
+    assert user_role.permissions.count() == 1
+
+
+def test_empty_permission_table_is_seeded(app):
+    added = ensure_permissions()
+    assert Permission.query.count() == len(added)
+    assert Permission.query.filter_by(name=Permission.FILE_SIGN).one().description == 'FILE_SIGN'
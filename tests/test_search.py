@@ -0,0 +1,56 @@
+import pytest
+from app import db
+from app.models import SystemLog
+from app.services import search_service
+from app.services.search_service import ensure_fulltext_index, filter_by_keyword, search_logs
+
+
+@pytest.fixture
+def logs(app):
+    ensure_fulltext_index()
+    messages = ['用户 alice 登录成功', '审批流程超时提醒', 'Database Backup finished', '用户 bob 登录失败']
+    db.session.add_all([SystemLog(level='INFO', message=message) for message in messages])
+    db.session.commit()
+    yield
+    # 全文索引可用状态按数据库URL缓存，测试之间数据库会被删除
+    search_service._index_ready.clear()
+
+
+def _messages(query):
+    return sorted(log.message for log in query)
+
+
+def test_fulltext_index_is_created(logs):
+    assert search_service.fulltext_available(SystemLog)
+    assert ensure_fulltext_index() == ['system_logs', 'workflow_logs']
+
+
+def test_substring_search_matches_like(logs):
+    for keyword in ['登录成', 'backup fin', 'alice']:
+        expected = _messages(SystemLog.query.filter(SystemLog.message.contains(keyword)))
+        assert _messages(filter_by_keyword(SystemLog.query, SystemLog, keyword)) == expected
+        assert expected
+
+
+def test_short_keyword_falls_back_to_like(logs):
+    assert _messages(filter_by_keyword(SystemLog.query, SystemLog, '超时')) == ['审批流程超时提醒']
+
+
+def test_index_follows_updates_and_deletes(logs):
+    log = SystemLog.query.filter_by(message='用户 bob 登录失败').one()
+    log.message = '用户 bob 已注销'
+    db.session.commit()
+    assert _messages(filter_by_keyword(SystemLog.query, SystemLog, '登录失败')) == []
+    assert _messages(filter_by_keyword(SystemLog.query, SystemLog, 'bob 已注销')) == ['用户 bob 已注销']
+
+    db.session.delete(log)
+    db.session.commit()
+    assert _messages(filter_by_keyword(SystemLog.query, SystemLog, 'bob 已注销')) == []
+
+
+def test_search_logs_ranks_and_limits(logs):
+    results = search_logs(SystemLog, '用户', limit=1)
+    assert len(results) == 1
+    results = search_logs(SystemLog, '登录成功')
+    assert [log.message for log, _ in results] == ['用户 alice 登录成功']
+    assert search_logs(SystemLog, '  ') == []
@@ -0,0 +1,90 @@
+import threading
+import time
+from sqlalchemy import create_engine, text
+from app import db
+from app.models import SystemLog
+from app.services.db_service import sqlite_pragmas, install_sqlite_pragmas, install_sqlite_writer_lock
+from app.services.write_queue import WriteQueue
+
+
+def test_pragmas_follow_production_mode():
+    assert sqlite_pragmas({}) == [('journal_mode', 'WAL'), ('busy_timeout', 5000)]
+    names = [name for name, _ in sqlite_pragmas({'SQLITE_PRODUCTION_MODE': True, 'SQLITE_JOURNAL_MODE': ''})]
+    assert names == ['busy_timeout', 'synchronous', 'cache_size', 'mmap_size', 'temp_store']
+
+
+def test_pragmas_applied_on_connect(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/wal.db')
+    install_sqlite_pragmas(engine, sqlite_pragmas({'SQLITE_PRODUCTION_MODE': True, 'SQLITE_BUSY_TIMEOUT': 1234}))
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert conn.execute(text('PRAGMA temp_store')).scalar() == 2  # MEMORY
+
+
+def test_writer_lock_serializes_write_transactions(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/lock.db', connect_args={'check_same_thread': False})
+    install_sqlite_writer_lock(engine, timeout=5)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (id INTEGER PRIMARY KEY)'))
+
+    second_started = threading.Event()
+    order = []
+
+    def second_writer():
+        second_started.set()
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO t (id) VALUES (2)'))
+            order.append('second')
+
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO t (id) VALUES (1)'))
+        thread = threading.Thread(target=second_writer)
+        thread.start()
+        second_started.wait()
+        time.sleep(0.1)
+        # 第一个事务未提交，第二个写事务在进程内写锁上排队
+        assert order == []
+        # 读操作不需要写锁
+        with engine.connect() as reader:
+            assert reader.execute(text('SELECT count(*) FROM t')).scalar() == 0
+        order.append('first')
+    thread.join(timeout=5)
+
+    assert order == ['first', 'second']
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM t')).scalar() == 2
+
+
+def test_write_queue_commits_appends_in_batches(app):
+    queue = WriteQueue()
+    app.config['WRITE_QUEUE_ENABLED'] = True
+    app.testing = False
+    try:
+        queue.init_app(app)
+    finally:
+        app.testing = True
+    queue.flush_interval = 0.2
+    try:
+        assert queue.running
+        for i in range(5):
+            queue.append(SystemLog, level='INFO', module='batch', message=f'第{i}条')
+        queue.flush()
+    finally:
+        queue.stop()
+
+    assert queue.stats['rows'] == 5
+    assert queue.stats['batches'] < 5
+    logs = SystemLog.query.filter_by(module='batch').all()
+    assert len(logs) == 5
+    # 时间在入队时取值
+    assert all(log.created_at is not None for log in logs)
+
+
+def test_write_queue_writes_synchronously_when_disabled(app):
+    queue = WriteQueue(app)
+    assert not queue.enabled
+    queue.append(SystemLog, level='INFO', module='sync', message='直接写入')
+    assert SystemLog.query.filter_by(module='sync').count() == 1
+    assert queue.get_status()['pending'] == 0
@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+from app import create_app
+from app.services.font_service import FontManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 应用启动时不应导入的重量级模块，只在用到的功能中导入
+HEAVY_MODULES = ('PIL', 'psutil', 'requests', 'reportlab', 'fontTools')
+
+
+def test_create_app_does_not_import_heavy_modules(tmp_path):
+    # 在新的解释器中启动，与 gunicorn 工作进程冷启动一致
+    script = (
+        "import sys\n"
+        "from app import create_app\n"
+        "create_app('testing')\n"
+        f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])\n"
+    )
+    env = dict(os.environ, TEST_DATABASE_URL=f'sqlite:///{tmp_path}/startup.db')
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_startup_reads_manifest_without_scanning_fonts(monkeypatch):
+    scans = []
+    monkeypatch.setattr(FontManager, '_scan_fonts', lambda self, *args: scans.append(args) or {})
+    monkeypatch.setattr(FontManager, 'load_manifest', lambda self: {'missing_required': []})
+
+    create_app('testing')
+
+    assert scans == []
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import WorkflowInstance, WorkflowTimer
+from app.services.event_service import event_dispatcher
+from app.services.task_scheduler import task_scheduler
+from app.services.timer_service import timer_service
+from config import config
+
+STEPS = [{'id': 1, 'name': '部门审批', 'type': 'approval', 'approvers': {}, 'timeout': 60, 'on_timeout': 'reject'}]
+
+
+@pytest.fixture
+def overdue(app, make_user, make_instance):
+    """创建审批截止时间已过的实例"""
+    admin = make_user('admin', is_admin=True)
+    timer_service._next_poll = 0
+
+    def make(title):
+        instance = make_instance(STEPS, admin.id, title=title)
+        # 进入步骤的事件写入截止时间定时器
+        event_dispatcher.dispatch_pending(instance.id)
+        WorkflowTimer.query.filter_by(instance_id=instance.id).update(
+            {'due_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        return instance.id
+    return make
+
+
+def _status(instance_id):
+    db.session.expire_all()
+    return WorkflowInstance.query.get(instance_id).status
+
+
+def test_due_timers_fire_in_default_dispatch_mode(app, overdue):
+    # 默认配置没有事件分发线程和定时器线程
+    assert app.config['WORKFLOW_EVENT_DISPATCH'] == config['default'].WORKFLOW_EVENT_DISPATCH == 'inline'
+    first = overdue('第一个')
+
+    app.test_client().get('/api/workflow/tasks')
+    assert _status(first) == 'rejected'
+    assert WorkflowTimer.query.filter_by(instance_id=first).one().status == 'fired'
+
+    # 检查间隔内的请求不再查询定时器，由后台任务调度器补充触发
+    second = overdue('第二个')
+    app.test_client().get('/api/workflow/tasks')
+    assert _status(second) == 'running'
+
+    task_scheduler.app = app
+    task_scheduler.run_task('fire_workflow_timers')
+    assert task_scheduler.tasks['fire_workflow_timers']['last_error'] is None
+    assert _status(second) == 'rejected'
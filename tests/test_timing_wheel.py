@@ -0,0 +1,35 @@
+from app.utils.timing_wheel import HierarchicalTimingWheel
+
+
+def test_timers_fire_at_due_tick_across_levels():
+    wheel = HierarchicalTimingWheel(tick=1, wheel_sizes=(10, 10, 10), start=0)
+    for key, due in [('a', 3), ('b', 25), ('c', 250), ('d', 25.9)]:
+        assert wheel.add(key, due)
+
+    assert wheel.advance(2) == []
+    assert wheel.advance(3) == ['a']
+    assert wheel.advance(24) == []
+    assert sorted(wheel.advance(25)) == ['b', 'd']
+    assert wheel.advance(249) == []
+    assert wheel.advance(250) == ['c']
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = HierarchicalTimingWheel(tick=1, wheel_sizes=(10, 10), start=0)
+    wheel.add('a', 5)
+    wheel.add('b', 5)
+    wheel.cancel('a')
+    # 重复添加以最后一次为准
+    wheel.add('b', 40)
+
+    assert wheel.advance(39) == []
+    assert wheel.advance(40) == ['b']
+    assert 'a' not in wheel
+
+
+def test_overdue_and_capacity():
+    wheel = HierarchicalTimingWheel(tick=1, wheel_sizes=(10, 10), start=100)
+    assert wheel.add('late', 50)
+    assert not wheel.add('far', 100 + wheel.capacity + 10)
+    assert wheel.advance(100) == ['late']
@@ -0,0 +1,70 @@
+import pytest
+from app.models import WorkflowToken
+from app.services.workflow_service import process_workflow_step, get_active_steps
+
+
+def _steps(join):
+    return [
+        {'id': 1, 'name': '会签', 'type': 'parallel', 'branches': [2, 3, 4]},
+        {'id': 2, 'name': '财务', 'type': 'approval', 'approvers': {}, 'transitions': [{'target': 5}]},
+        {'id': 3, 'name': '法务', 'type': 'approval', 'approvers': {}, 'transitions': [{'target': 5}]},
+        {'id': 4, 'name': '人事', 'type': 'approval', 'approvers': {}, 'transitions': [{'target': 5}]},
+        dict({'id': 5, 'name': '汇聚', 'type': 'join'}, **join),
+        {'id': 6, 'name': '总经理', 'type': 'approval', 'approvers': {}},
+    ]
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', is_admin=True)
+
+
+def _token_statuses(instance):
+    return sorted((token.branch_step_id, token.status)
+                  for token in WorkflowToken.query.filter_by(instance_id=instance.id))
+
+
+def test_all_join_waits_for_every_branch(admin, make_instance):
+    instance = make_instance(_steps({}), admin.id)
+    assert sorted(get_active_steps(instance)) == [2, 3, 4]
+
+    process_workflow_step(instance.id, 3, 'approve', admin.id)
+    process_workflow_step(instance.id, 2, 'approve', admin.id)
+    assert instance.current_step == 1
+    assert get_active_steps(instance) == [4]
+
+    process_workflow_step(instance.id, 4, 'approve', admin.id)
+    assert instance.current_step == 6
+    assert _token_statuses(instance) == [(2, 'arrived'), (3, 'arrived'), (4, 'arrived')]
+
+
+def test_any_join_cancels_remaining_branches(admin, make_instance):
+    instance = make_instance(_steps({'mode': 'any'}), admin.id)
+
+    process_workflow_step(instance.id, 4, 'approve', admin.id)
+    assert instance.current_step == 6
+    assert _token_statuses(instance) == [(2, 'canceled'), (3, 'canceled'), (4, 'arrived')]
+    with pytest.raises(ValueError):
+        process_workflow_step(instance.id, 2, 'approve', admin.id)
+
+
+def test_count_join_needs_n_of_m(admin, make_instance):
+    instance = make_instance(_steps({'mode': 'count', 'count': 2}), admin.id)
+
+    process_workflow_step(instance.id, 2, 'approve', admin.id)
+    assert instance.current_step == 1
+    process_workflow_step(instance.id, 3, 'approve', admin.id)
+    assert instance.current_step == 6
+    assert _token_statuses(instance) == [(2, 'arrived'), (3, 'arrived'), (4, 'canceled')]
+
+    process_workflow_step(instance.id, 6, 'approve', admin.id)
+    assert instance.status == 'completed'
+
+
+def test_branch_rejection_rejects_instance(admin, make_instance):
+    instance = make_instance(_steps({}), admin.id)
+
+    process_workflow_step(instance.id, 2, 'approve', admin.id)
+    process_workflow_step(instance.id, 3, 'reject', admin.id)
+    assert instance.status == 'rejected'
+    assert _token_statuses(instance) == [(2, 'arrived'), (3, 'canceled'), (4, 'canceled')]